@@ -1,21 +1,45 @@
-from flask import Flask
-from flask_cors import CORS
-from flask_socketio import SocketIO
+import sys
+from app.config import Config
+
+
+def _socketio_async_mode():
+    """Use gevent only in processes gevent has patched (gunicorn gevent workers).
+
+    Left to auto-detection, Flask-SocketIO picks gevent whenever it is
+    installed, which serializes requests on the unpatched Werkzeug server.
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('socket'):
+        return 'gevent'
+    return 'threading'
 
 
 def create_app():
+    # Imported here so the ASGI app (app.asgi) does not load Flask-SocketIO
+    from flask import Flask
+    from flask_cors import CORS
+    from flask_socketio import SocketIO
+    
     app = Flask(__name__)
     CORS(app)  # Enable CORS for all routes
     
-    # Initialize SocketIO
-    socketio = SocketIO(app, cors_allowed_origins="*")
+    # Initialize SocketIO; with a message queue, events emitted by one worker
+    # reach clients connected to any other worker or node
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=_socketio_async_mode(),
+                        message_queue=Config.SOCKETIO_MESSAGE_QUEUE)
     
     # Import and register blueprints
     from app.endpoints.query import query_bp
     from app.endpoints.streaming import streaming_bp, register_socketio_events
+    from app.endpoints.math_batch import math_bp
+    from app.endpoints.metrics import metrics_bp
+    from app.endpoints.jobs import jobs_bp
     
     app.register_blueprint(query_bp)
     app.register_blueprint(streaming_bp)
+    app.register_blueprint(math_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(jobs_bp)
     
     # Register SocketIO events
     register_socketio_events(socketio)
@@ -0,0 +1,405 @@
+"""ASGI variant of the query endpoints.
+
+Serves /query, /query_enhanced and /stream on an asyncio event loop, so a
+single worker process can hold thousands of in-flight queries while they
+wait on Groq and OpenWeatherMap. Run it with:
+
+    uvicorn app.asgi:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import json
+import time
+
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.config import Config
+from app.endpoints.math_batch import run_math_batch
+from app.endpoints.query import collect_stats
+from app.tools import get_tools
+from app.utils import batch, circuit_breaker, deadline, jobs, metrics, planner, query_runner, sse, tracing
+from app.utils.admission import Rejected, client_key, get_admission
+from app.utils.tool_selector import get_agent_executor
+
+
+async def _read_query(request):
+    """Return the query string from the JSON body, or None if missing.
+
+    A `timeout` in the body replaces the deadline the middleware set from
+    the headers (which still takes precedence).
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+
+    if isinstance(data, dict) and 'timeout' in data:
+        deadline.start(request.headers, data)
+    if not isinstance(data, dict) or 'query' not in data:
+        return None
+    return data['query']
+
+
+def _admit_client(request, cost=1):
+    """Apply the per-client rate limit to this request (`cost` queries); raises RateLimited."""
+    get_admission().check_client(client_key(request.headers, request.client.host if request.client else None), cost)
+
+
+async def handle_query(request):
+    """Handle user queries and route them to appropriate tools."""
+    user_query = await _read_query(request)
+    if user_query is None:
+        return JSONResponse({'error': 'Query is required'}, status_code=400)
+
+    _admit_client(request)
+    try:
+        return JSONResponse(await query_runner.arun_query(user_query))
+    except Rejected:
+        raise
+    except Exception as e:
+        return JSONResponse({
+            'query': user_query,
+            'tool_used': 'error',
+            'result': f'Error processing query: {str(e)}',
+            'agent_used': False
+        }, status_code=500)
+
+
+async def handle_query_enhanced(request):
+    """Handle user queries with enhanced tracking - always uses agent if available."""
+    user_query = await _read_query(request)
+    if user_query is None:
+        return JSONResponse({'error': 'Query is required'}, status_code=400)
+
+    agent_executor = get_agent_executor()
+    if agent_executor is None:
+        return JSONResponse({
+            'error': 'Agent not available. Please configure GROQ_API_KEY in .env file'
+        }, status_code=503)
+
+    _admit_client(request)
+    try:
+        result_dict = await agent_executor.ainvoke({"input": user_query})
+
+        tool_used = "unknown"
+        intermediate_steps = []
+
+        for action, observation in result_dict.get("intermediate_steps", []):
+            tool_used = action.tool.lower().replace("tool", "")
+            intermediate_steps.append({
+                "tool": action.tool,
+                "tool_input": action.tool_input,
+                "tool_args": action.tool_args,
+                "observation": str(observation)[:200],  # Truncate for readability
+                **action.timing
+            })
+
+        response = {
+            'query': user_query,
+            'tool_used': tool_used,
+            'result': result_dict.get("output", str(result_dict)),
+            'agent_used': True,
+            'routing_tier': result_dict.get("routing_tier", "llm"),
+            'intermediate_steps': intermediate_steps
+        }
+        if "tools_used" in result_dict:
+            response['tool_used'] = 'multi'
+            response['tools_used'] = result_dict["tools_used"]
+            response['timing'] = result_dict["timing"]
+        return JSONResponse(response)
+
+    except Rejected:
+        raise
+    except Exception as e:
+        return JSONResponse({
+            'query': user_query,
+            'tool_used': 'error',
+            'result': f'Error processing query: {str(e)}',
+            'agent_used': False
+        }, status_code=500)
+
+
+async def astream_query_events(user_query):
+    """Yield (event, payload) pairs: routing, LLM tokens, then the result.
+
+    Mirrors stream_query_events in app/endpoints/streaming.py, including
+    the plan and step events of multi-intent queries.
+    """
+    steps = planner.plan(user_query)
+    if len(steps) > 1:
+        async for item in planner.astream_plan_events(user_query, steps, query_runner.arun_step):
+            yield item
+        return
+
+    started = time.perf_counter()
+    tool_used, tool_args, routing_tier = await query_runner.aroute(user_query)
+
+    with await get_admission().aacquire(tool_used):
+        yield 'routing', {
+            'query': user_query,
+            'tool_used': tool_used,
+            'routing_tier': routing_tier,
+            'routing_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+        first_token_at = None
+        if tool_used == "llm":
+            parts = []
+            tokens = get_tools()["llm"].astream(user_query)
+            try:
+                async for text in tokens:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(text)
+                    yield 'token', {'text': text}
+            finally:
+                await tokens.aclose()
+            result = "".join(parts)
+        else:
+            result = await get_tools()[tool_used]._arun(user_query, **tool_args)
+            first_token_at = time.perf_counter()
+
+    finished = time.perf_counter()
+    yield 'result', {
+        'query': user_query,
+        'tool_used': tool_used,
+        'result': result,
+        'routing_tier': routing_tier,
+        'ttft_ms': round(((first_token_at or finished) - started) * 1000, 1),
+        'total_ms': round((finished - started) * 1000, 1)
+    }
+
+
+async def stream_query(request):
+    """Stream the response for a query using server-sent events."""
+    user_query = await _read_query(request)
+    if user_query is None:
+        return JSONResponse({'error': 'Query is required'}, status_code=400)
+
+    _admit_client(request)
+    events = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for item in astream_query_events(user_query):
+                await events.put(item)
+        except Rejected as rejection:
+            await events.put(('rejected', rejection))
+        except Exception as e:
+            await events.put(('error', {
+                'query': user_query,
+                'tool_used': 'error',
+                'result': f'Error processing query: {str(e)}'
+            }))
+        finally:
+            await events.put(None)
+
+    producer = asyncio.create_task(produce())
+
+    # Admission is decided before the first event, so a shed request still
+    # gets a plain 503 response instead of a stream
+    try:
+        first = await events.get()
+    except asyncio.CancelledError:
+        producer.cancel()
+        raise
+    if first[0] == 'rejected':
+        raise first[1]
+
+    async def generate():
+        event_id = 1
+        try:
+            yield sse.format_event(event_id, *first)
+            while True:
+                try:
+                    item = await asyncio.wait_for(events.get(), Config.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield sse.HEARTBEAT
+                    continue
+
+                if item is None:
+                    return
+
+                event_id += 1
+                yield sse.format_event(event_id, *item)
+        finally:
+            # Client disconnected (or we are done): cancel the upstream call
+            producer.cancel()
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+async def _read_batch(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    return batch.validate_queries(data)
+
+
+async def query_batch(request):
+    """Route and run a list of queries concurrently; results in input order."""
+    queries, error = await _read_batch(request)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    _admit_client(request, len(queries))
+
+    results = [item async for item in batch.arun_batch(queries, query_runner.aroute, get_tools())]
+    return JSONResponse({'results': sorted(results, key=lambda item: item['index'])})
+
+
+async def query_batch_stream(request):
+    """Like /query/batch, but streams each result as NDJSON as soon as it completes."""
+    queries, error = await _read_batch(request)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+    _admit_client(request, len(queries))
+
+    async def generate():
+        results = batch.arun_batch(queries, query_runner.aroute, get_tools())
+        try:
+            async for item in results:
+                yield json.dumps(item) + "\n"
+        finally:
+            await results.aclose()
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+async def math_batch(request):
+    """Evaluate many expressions, or one expression over arrays of values."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    body, status = run_math_batch(data)
+    return JSONResponse(body, status_code=status)
+
+
+async def submit_job(request):
+    """Queue a query; mirrors app/endpoints/jobs.py. Jobs run on the worker threads of app/utils/jobs.py."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    job, error = jobs.create_job(data)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+
+    _admit_client(request)
+    runner = jobs.get_job_runner()
+    if runner.store.blocking:
+        await asyncio.to_thread(runner.submit, job)
+    else:
+        runner.submit(job)
+    location = f"/jobs/{job['id']}"
+    return JSONResponse({**jobs.public(job), 'url': location}, status_code=202, headers={'Location': location})
+
+
+async def get_job(request):
+    """Return a job; with ?wait=N, wait up to N seconds for it to finish (without holding a thread)."""
+    job = await jobs.aget_job(request.path_params['job_id'], jobs.wait_seconds(request.query_params.get('wait')))
+    if job is None:
+        return JSONResponse({'error': 'Job not found or expired'}, status_code=404)
+    return JSONResponse(jobs.public(job))
+
+
+async def metrics_endpoint(request):
+    """Counters and latency histograms in the Prometheus text format."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type='text/plain; version=0.0.4')
+
+
+async def stats(request):
+    """The in-process counters; mirrors app/endpoints/query.py. Redis-backed stores are read in a thread."""
+    return JSONResponse(await asyncio.to_thread(collect_stats))
+
+
+async def health(request):
+    """Upstream circuit breaker states; mirrors app/endpoints/metrics.py."""
+    return JSONResponse({
+        'status': 'degraded' if circuit_breaker.degraded() else 'ok',
+        'upstreams': circuit_breaker.stats()
+    })
+
+
+class RequestMetricsMiddleware:
+    """Observe request durations per route and add Server-Timing when enabled.
+
+    Mirrors app/endpoints/metrics.py; streamed responses are timed until
+    their headers are sent. Also starts the request deadline from the
+    X-Request-Timeout header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        token = tracing.start_request()
+        deadline_token = deadline.start(Headers(scope=scope))
+        # Unknown paths share one label to keep the series count bounded
+        route = scope["path"] if scope["path"] in ROUTE_PATHS else _templated_route(scope["path"])
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                metrics.observe("http_request_duration_seconds", elapsed,
+                                route=route, method=scope["method"], status=str(message["status"]))
+                if token is not None:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", tracing.server_timing_header(elapsed))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            deadline.reset(deadline_token)
+            tracing.end_request(token)
+
+
+async def handle_rejected(request, rejection):
+    """503 (overloaded) or 429 (client rate limit) with a Retry-After header."""
+    return JSONResponse(rejection.body(), status_code=rejection.status, headers=rejection.headers())
+
+
+routes = [
+    Route('/query', handle_query, methods=['POST']),
+    Route('/query_enhanced', handle_query_enhanced, methods=['POST']),
+    Route('/stream', stream_query, methods=['POST']),
+    Route('/query/batch', query_batch, methods=['POST']),
+    Route('/query/batch/stream', query_batch_stream, methods=['POST']),
+    Route('/math/batch', math_batch, methods=['POST']),
+    Route('/jobs', submit_job, methods=['POST']),
+    Route('/jobs/{job_id}', get_job, methods=['GET']),
+    Route('/stats', stats, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/health', health, methods=['GET']),
+]
+ROUTE_PATHS = {route.path for route in routes}
+TEMPLATED_ROUTES = [route for route in routes if "{" in route.path]
+
+
+def _templated_route(path):
+    """The template of a route with path parameters (e.g. /jobs/{job_id}) matching `path`."""
+    for route in TEMPLATED_ROUTES:
+        if route.path_regex.match(path):
+            return route.path
+    return "unmatched"
+
+app = Starlette(routes=routes, middleware=[Middleware(RequestMetricsMiddleware)],
+                exception_handlers={Rejected: handle_rejected})
@@ -11,9 +11,261 @@ class Config:
     GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
     OPENWEATHER_API_KEY = os.environ.get('OPENWEATHER_API_KEY')
     
+    # Upstream base URLs (override to point at local stand-ins, e.g. benchmarks/)
+    GROQ_BASE_URL = os.environ.get('GROQ_BASE_URL')  # None uses the SDK default
+    OPENWEATHER_BASE_URL = os.environ.get('OPENWEATHER_BASE_URL', 'http://api.openweathermap.org/data/2.5')
+    
+    # LLM upstream pool (app/utils/llm_pool.py): Groq calls are spread over
+    # GROQ_API_KEY plus GROQ_API_KEYS (comma-separated extra keys) on Groq's
+    # API, and LLM_ENDPOINTS, other OpenAI-compatible APIs given as comma-
+    # separated "base_url|api_key" entries (e.g. http://host:8000/v1|key).
+    # Requests go to the least loaded, fastest (EWMA) upstream not throttled
+    # by its rate limit; an upstream with LLM_POOL_MIN_REMAINING_TOKENS or
+    # fewer tokens left counts as throttled until its window resets. A 429
+    # or failed connection is retried at once on another upstream
+    GROQ_API_KEYS = [key.strip() for key in os.environ.get('GROQ_API_KEYS', '').split(',') if key.strip()]
+    LLM_ENDPOINTS = [entry.strip() for entry in os.environ.get('LLM_ENDPOINTS', '').split(',') if entry.strip()]
+    LLM_POOL_EWMA_DECAY = float(os.environ.get('LLM_POOL_EWMA_DECAY', '0.3'))
+    LLM_POOL_MIN_REMAINING_TOKENS = int(os.environ.get('LLM_POOL_MIN_REMAINING_TOKENS', '0'))
+    LLM_POOL_FAILOVER = os.environ.get('LLM_POOL_FAILOVER', 'true').lower() == 'true'
+    
+    # Shared upstream HTTP clients (app/utils/clients.py)
+    HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '100'))
+    HTTP_KEEPALIVE_CONNECTIONS = int(os.environ.get('HTTP_KEEPALIVE_CONNECTIONS', '20'))
+    HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '30'))
+    HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '30'))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+    HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', '0.25'))
+    HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', '4'))
+    HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', 'true').lower() == 'true'
+    
+    # Serving mode for main.py outside development: "gunicorn" (Flask app and
+    # SocketIO on gunicorn workers), "asgi" (app/asgi.py on gunicorn with
+    # uvicorn workers) or "werkzeug" (single-process development server)
+    SERVER_MODE = os.environ.get('SERVER_MODE', 'gunicorn')
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', str(os.cpu_count() or 1)))
+    WEB_WORKER_CLASS = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+    WEB_WORKER_CONNECTIONS = int(os.environ.get('WEB_WORKER_CONNECTIONS', '1000'))
+    WEB_TIMEOUT = int(os.environ.get('WEB_TIMEOUT', '120'))
+    WEB_GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+    WEB_KEEPALIVE = int(os.environ.get('WEB_KEEPALIVE', '5'))
+    
+    # When the tools, agent and SDKs load (see app/warmup.py): "preload" (in
+    # the gunicorn master before forking), "post_fork" (in each worker as it
+    # starts) or "lazy" (on first use)
+    WARMUP = os.environ.get('WARMUP', 'preload')
+    
+    # Message queue shared by all workers/nodes so SocketIO events reach
+    # clients connected to any worker (e.g. redis://redis:6379/1)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    
+    # Seconds between SSE heartbeat comments on /stream
+    SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+    
     # Default values for testing
     DEFAULT_GROQ_MODEL = "llama-3.3-70b-versatile"
     
+    # Groq model and completion cap per LLM stage (app/utils/models.py).
+    # Routing and city extraction answer in a few tokens, so a small fast
+    # model is enough; a reply that fails validation is retried once on
+    # ESCALATION_MODEL. A cap of 0 leaves the length to the model
+    STAGE_MODELS = {
+        "select": os.environ.get('SELECTOR_MODEL', 'llama-3.1-8b-instant'),
+        "extract_city": os.environ.get('EXTRACTOR_MODEL', 'llama-3.1-8b-instant'),
+        "answer": os.environ.get('ANSWER_MODEL', DEFAULT_GROQ_MODEL),
+    }
+    STAGE_MAX_TOKENS = {
+        "select": int(os.environ.get('SELECTOR_MAX_TOKENS', '48')),
+        "extract_city": int(os.environ.get('EXTRACTOR_MAX_TOKENS', '16')),
+        "answer": int(os.environ.get('ANSWER_MAX_TOKENS', '1024')),
+    }
+    MODEL_ESCALATION_ENABLED = os.environ.get('MODEL_ESCALATION_ENABLED', 'true').lower() == 'true'
+    ESCALATION_MODEL = os.environ.get('ESCALATION_MODEL', DEFAULT_GROQ_MODEL)
+    
+    # Tool routing: the local classifier decides when its confidence is at
+    # least this value, otherwise the LLM selector is consulted
+    LOCAL_ROUTER_THRESHOLD = float(os.environ.get('LOCAL_ROUTER_THRESHOLD', '0.75'))
+    
+    # "structured": the LLM selector also extracts tool arguments in the same
+    # call (city/country, expression); "simple": it returns only the tool name
+    ROUTING_MODE = os.environ.get('ROUTING_MODE', 'structured')
+    
+    # Distinct tool-selection prompts arriving within this window are sent to
+    # the LLM as one batched prompt (0 disables batching)
+    SELECTOR_BATCH_WINDOW_MS = float(os.environ.get('SELECTOR_BATCH_WINDOW_MS', '0'))
+    SELECTOR_BATCH_MAX_SIZE = int(os.environ.get('SELECTOR_BATCH_MAX_SIZE', '16'))
+    
+    # Tool response cache ("memory" or "redis")
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    
+    # Per-tool TTL in seconds; None means the entry never expires
+    CACHE_TTLS = {
+        "weather": int(os.environ.get('CACHE_TTL_WEATHER', '600')),
+        "llm": int(os.environ.get('CACHE_TTL_LLM', '21600')),
+        "math": None,
+    }
+    
+    # Weather observations: served stale for up to WEATHER_STALE_TTL seconds
+    # while refreshed in the background; locations with WEATHER_HOT_HITS hits
+    # since their last fetch are refetched at WEATHER_REFRESH_AHEAD of the TTL.
+    # OpenWeatherMap calls are capped per process at the per-minute quota
+    WEATHER_STALE_TTL = int(os.environ.get('WEATHER_STALE_TTL', '3600'))
+    WEATHER_REFRESH_AHEAD = float(os.environ.get('WEATHER_REFRESH_AHEAD', '0.8'))
+    WEATHER_HOT_HITS = int(os.environ.get('WEATHER_HOT_HITS', '3'))
+    WEATHER_REFRESH_INTERVAL = float(os.environ.get('WEATHER_REFRESH_INTERVAL', '5'))
+    WEATHER_GEO_PRECISION = int(os.environ.get('WEATHER_GEO_PRECISION', '1'))
+    OPENWEATHER_QUOTA_PER_MINUTE = int(os.environ.get('OPENWEATHER_QUOTA_PER_MINUTE', '60'))
+    WEATHER_QUOTA_WAIT = float(os.environ.get('WEATHER_QUOTA_WAIT', '2'))
+    WEATHER_REFRESH_RESERVE = float(os.environ.get('WEATHER_REFRESH_RESERVE', '0.25'))
+    
+    # /query/batch: maximum queries per request, and how many routing
+    # decisions and tool calls may run at once across all batches
+    QUERY_BATCH_MAX_QUERIES = int(os.environ.get('QUERY_BATCH_MAX_QUERIES', '10000'))
+    QUERY_BATCH_CONCURRENCY = {
+        "routing": int(os.environ.get('QUERY_BATCH_CONCURRENCY_ROUTING', '32')),
+        "weather": int(os.environ.get('QUERY_BATCH_CONCURRENCY_WEATHER', '16')),
+        "math": int(os.environ.get('QUERY_BATCH_CONCURRENCY_MATH', '4')),
+        "llm": int(os.environ.get('QUERY_BATCH_CONCURRENCY_LLM', '16')),
+    }
+    
+    # Asynchronous jobs (/jobs): JOBS_WORKERS background threads per process
+    # run queued queries; a submission beyond JOBS_MAX_QUEUE waiting jobs is
+    # refused with 503. JOBS_BACKEND "memory" keeps jobs in the process that
+    # took them, so it only suits a single worker; "redis" (the default when
+    # REDIS_URL is set) shares them between all workers and nodes through
+    # the Redis-protocol store at JOBS_REDIS_URL. A job has JOBS_TIMEOUT
+    # seconds from submission (its `timeout` may ask for up to
+    # JOBS_TIMEOUT_MAX), is kept JOBS_TTL seconds after it finishes, and its
+    # result is cut to JOBS_MAX_RESULT_BYTES. Callbacks go only to
+    # JOBS_CALLBACK_HOSTS (comma-separated; when empty, to any host with
+    # public addresses only), signed with HMAC-SHA256 when
+    # JOBS_CALLBACK_SECRET is set
+    JOBS_BACKEND = os.environ.get('JOBS_BACKEND', 'redis' if os.environ.get('REDIS_URL') else 'memory')
+    JOBS_REDIS_URL = os.environ.get('JOBS_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', '8'))
+    JOBS_MAX_QUEUE = int(os.environ.get('JOBS_MAX_QUEUE', '1000'))
+    JOBS_TIMEOUT = float(os.environ.get('JOBS_TIMEOUT', '300'))
+    JOBS_TIMEOUT_MAX = float(os.environ.get('JOBS_TIMEOUT_MAX', '900'))
+    JOBS_TTL = int(os.environ.get('JOBS_TTL', '3600'))
+    JOBS_MAX_QUERY_CHARS = int(os.environ.get('JOBS_MAX_QUERY_CHARS', '4000'))
+    JOBS_MAX_RESULT_BYTES = int(os.environ.get('JOBS_MAX_RESULT_BYTES', '65536'))
+    JOBS_MAX_WAIT = float(os.environ.get('JOBS_MAX_WAIT', '30'))
+    JOBS_CALLBACK_HOSTS = set(filter(None, os.environ.get('JOBS_CALLBACK_HOSTS', '').split(',')))
+    JOBS_CALLBACK_SECRET = os.environ.get('JOBS_CALLBACK_SECRET')
+    JOBS_CALLBACK_RETRIES = int(os.environ.get('JOBS_CALLBACK_RETRIES', '3'))
+    
+    # Admission control for /query, /query_enhanced, /stream and SocketIO:
+    # per-tool concurrency per worker (the LLM and weather limits back off
+    # on upstream 429s and recover gradually), a bounded wait queue that
+    # sheds requests unable to start before their deadline with 503, and
+    # optional per-client rate limits (0 disables them). Clients are keyed
+    # on their API key only if it is listed in ADMISSION_API_KEYS, else on
+    # their IP, so made-up keys cannot buy fresh buckets
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+    ADMISSION_CONCURRENCY = {
+        "llm": int(os.environ.get('ADMISSION_CONCURRENCY_LLM', '64')),
+        "weather": int(os.environ.get('ADMISSION_CONCURRENCY_WEATHER', '64')),
+        "math": int(os.environ.get('ADMISSION_CONCURRENCY_MATH', '16')),
+    }
+    ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '512'))
+    ADMISSION_AIMD_DECREASE = float(os.environ.get('ADMISSION_AIMD_DECREASE', '0.5'))
+    ADMISSION_AIMD_COOLDOWN = float(os.environ.get('ADMISSION_AIMD_COOLDOWN', '1'))
+    ADMISSION_TRUST_FORWARDED = os.environ.get('ADMISSION_TRUST_FORWARDED', 'false').lower() == 'true'
+    ADMISSION_API_KEYS = set(filter(None, (key.strip() for key in os.environ.get('ADMISSION_API_KEYS', '').split(','))))
+    CLIENT_RATE_LIMIT_PER_MINUTE = float(os.environ.get('CLIENT_RATE_LIMIT_PER_MINUTE', '0'))
+    CLIENT_RATE_LIMIT_BURST = int(os.environ.get('CLIENT_RATE_LIMIT_BURST', '20'))
+    
+    # Seconds a query may take end to end, unless the client asks for less
+    # (X-Request-Timeout header or `timeout` body field, up to the maximum).
+    # Each stage gets the time left, capped by its own budget (upstream
+    # retries only while the full budget is left); stages starting with
+    # less than STAGE_MIN_BUDGET left use their local fallback
+    REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', '30'))
+    REQUEST_TIMEOUT_MAX = float(os.environ.get('REQUEST_TIMEOUT_MAX', '120'))
+    STAGE_TIMEOUTS = {
+        "select": float(os.environ.get('STAGE_TIMEOUT_SELECT', '5')),
+        "extract_city": float(os.environ.get('STAGE_TIMEOUT_EXTRACT_CITY', '3')),
+        "weather": float(os.environ.get('STAGE_TIMEOUT_WEATHER', '10')),
+        "answer": float(os.environ.get('STAGE_TIMEOUT_ANSWER', '20')),
+    }
+    STAGE_MIN_BUDGET = float(os.environ.get('STAGE_MIN_BUDGET', '0.2'))
+    
+    # Hedged requests: a duplicate upstream call is sent when the first is
+    # slower than the stage's recent HEDGE_QUANTILE latency, for at most
+    # HEDGE_MAX_RATIO of the calls (comma-separated stages from STAGE_TIMEOUTS)
+    HEDGE_ENABLED = os.environ.get('HEDGE_ENABLED', 'false').lower() == 'true'
+    HEDGE_STAGES = set(os.environ.get('HEDGE_STAGES', 'select,extract_city,weather').split(','))
+    HEDGE_QUANTILE = float(os.environ.get('HEDGE_QUANTILE', '0.95'))
+    HEDGE_MIN_DELAY_MS = float(os.environ.get('HEDGE_MIN_DELAY_MS', '20'))
+    HEDGE_MAX_RATIO = float(os.environ.get('HEDGE_MAX_RATIO', '0.1'))
+    HEDGE_THREADS = int(os.environ.get('HEDGE_THREADS', '256'))
+    
+    # Speculative execution: while the LLM selector decides, the keyword
+    # router's guess starts running if it is one of these tools (comma-
+    # separated tool keys, e.g. "math,weather"; side-effect-free tools only)
+    SPECULATIVE_TOOLS = set(filter(None, os.environ.get('SPECULATIVE_TOOLS', '').split(',')))
+    SPECULATIVE_THREADS = int(os.environ.get('SPECULATIVE_THREADS', '256'))
+    
+    # Multi-intent queries are split into up to PLANNER_MAX_STEPS steps,
+    # run concurrently where independent, on at most PLANNER_THREADS at once
+    PLANNER_ENABLED = os.environ.get('PLANNER_ENABLED', 'true').lower() == 'true'
+    PLANNER_MAX_STEPS = int(os.environ.get('PLANNER_MAX_STEPS', '5'))
+    PLANNER_THREADS = int(os.environ.get('PLANNER_THREADS', '64'))
+    
+    # Circuit breakers per upstream: a breaker opens when, over the last
+    # BREAKER_WINDOW seconds (at least BREAKER_MIN_CALLS calls), the share of
+    # failed calls (errors, timeouts, 5xx, 429) or of calls slower than the
+    # upstream's slow-call threshold reaches its rate. While open, queries
+    # use local fallbacks; a probe every BREAKER_OPEN_SECONDS checks for
+    # recovery, then BREAKER_HALF_OPEN_CALLS trial calls must succeed
+    BREAKER_ENABLED = os.environ.get('BREAKER_ENABLED', 'true').lower() == 'true'
+    BREAKER_WINDOW = int(os.environ.get('BREAKER_WINDOW', '30'))
+    BREAKER_MIN_CALLS = int(os.environ.get('BREAKER_MIN_CALLS', '20'))
+    BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+    BREAKER_SLOW_RATE = float(os.environ.get('BREAKER_SLOW_RATE', '0.8'))
+    BREAKER_SLOW_CALL_MS = {
+        "groq": float(os.environ.get('BREAKER_SLOW_CALL_MS_GROQ', '10000')),
+        "openweathermap": float(os.environ.get('BREAKER_SLOW_CALL_MS_OPENWEATHERMAP', '5000')),
+    }
+    BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '10'))
+    BREAKER_HALF_OPEN_CALLS = int(os.environ.get('BREAKER_HALF_OPEN_CALLS', '3'))
+    BREAKER_PROBE_CITY = os.environ.get('BREAKER_PROBE_CITY', 'London')
+    
+    # Semantic cache for LLM answers: a query whose similarity to a cached
+    # query is at least the threshold gets the cached answer. With a path,
+    # entries persist in <path>.vectors (memory-mapped) and <path>.json
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', '5000'))
+    SEMANTIC_CACHE_DIM = int(os.environ.get('SEMANTIC_CACHE_DIM', '1024'))
+    SEMANTIC_CACHE_PATH = os.environ.get('SEMANTIC_CACHE_PATH')
+    
+    # Offline gazetteer used to find the city in weather queries before
+    # asking the LLM. The index is built next to the source on first use
+    GAZETTEER_ENABLED = os.environ.get('GAZETTEER_ENABLED', 'true').lower() == 'true'
+    GAZETTEER_SOURCE = os.environ.get(
+        'GAZETTEER_SOURCE', os.path.join(os.path.dirname(__file__), 'data', 'cities.tsv'))
+    GAZETTEER_INDEX = os.environ.get('GAZETTEER_INDEX')
+    GAZETTEER_COUNTRIES = os.environ.get(
+        'GAZETTEER_COUNTRIES', os.path.join(os.path.dirname(__file__), 'data', 'countries.tsv'))
+    
+    # Observability: Server-Timing response headers with per-stage spans, and
+    # OpenTelemetry span export to an OTLP/HTTP collector (needs the SDK)
+    SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+    OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT')
+    OTEL_SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'ai-agent-backend')
+    
+    # Math engine work limits
+    MATH_MAX_EXPRESSION_LENGTH = int(os.environ.get('MATH_MAX_EXPRESSION_LENGTH', '500'))
+    MATH_MAX_NODES = int(os.environ.get('MATH_MAX_NODES', '1000'))
+    MATH_MAX_INT_BITS = int(os.environ.get('MATH_MAX_INT_BITS', '4096'))
+    MATH_MAX_EXPONENT = float(os.environ.get('MATH_MAX_EXPONENT', '10000'))
+    MATH_MAX_ARRAY_SIZE = int(os.environ.get('MATH_MAX_ARRAY_SIZE', '100000'))
+    MATH_BATCH_MAX_ITEMS = int(os.environ.get('MATH_BATCH_MAX_ITEMS', '1000'))
+    
     @classmethod
     def validate_keys(cls):
         """Validate that required API keys are present."""
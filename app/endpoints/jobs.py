@@ -0,0 +1,27 @@
+from flask import Blueprint, request, jsonify
+from app.endpoints.query import admit_client
+from app.utils import jobs
+
+jobs_bp = Blueprint('jobs_bp', __name__)
+
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a query; answers 202 with the job id at once (503 when the queue is full)."""
+    job, error = jobs.create_job(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    admit_client()
+    jobs.get_job_runner().submit(job)
+    location = f"/jobs/{job['id']}"
+    return jsonify({**jobs.public(job), 'url': location}), 202, {'Location': location}
+
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return a job; with ?wait=N, hold the request up to N seconds until it finishes."""
+    job = jobs.get_job(job_id, jobs.wait_seconds(request.args.get('wait')))
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(jobs.public(job))
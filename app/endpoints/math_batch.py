@@ -0,0 +1,56 @@
+from flask import Blueprint, request, jsonify
+import math
+from app.config import Config
+from app.tools import get_tools
+from app.utils import math_engine
+
+math_bp = Blueprint('math_bp', __name__)
+
+
+def _json_number(value):
+    """Convert a float for JSON; nan and inf become None."""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def run_math_batch(data):
+    """Evaluate a /math/batch request body; returns (response_body, status).
+
+    Accepts either {"expressions": [...]} to evaluate many expressions, or
+    {"expression": "...", "variables": {"x": [...]}} to evaluate one
+    expression over arrays of values in a single vectorized pass.
+    """
+    if not isinstance(data, dict):
+        return {'error': 'JSON body is required'}, 400
+
+    if 'expressions' in data:
+        expressions = data['expressions']
+        if not isinstance(expressions, list) or not all(isinstance(e, str) for e in expressions):
+            return {'error': 'expressions must be a list of strings'}, 400
+        if len(expressions) > Config.MATH_BATCH_MAX_ITEMS:
+            return {'error': f'At most {Config.MATH_BATCH_MAX_ITEMS} expressions per request'}, 400
+
+        return {'results': get_tools()["math"].evaluate_batch(expressions)}, 200
+
+    expression = data.get('expression')
+    variables = data.get('variables') or {}
+    if not isinstance(expression, str) or not isinstance(variables, dict):
+        return {'error': 'Either expressions, or expression with variables, is required'}, 400
+
+    try:
+        compiled = math_engine.compile_expression(expression.replace('^', '**'), tuple(sorted(variables)))
+        values = compiled.evaluate_array(**variables)
+    except (math_engine.MathEngineError, ValueError, TypeError) as e:
+        return {'error': f'Error: {str(e)}'}, 400
+
+    return {
+        'expression': expression,
+        'results': [_json_number(value) for value in values]
+    }, 200
+
+
+@math_bp.route('/math/batch', methods=['POST'])
+def math_batch():
+    """Evaluate many expressions, or one expression over arrays of values."""
+    body, status = run_math_batch(request.get_json(silent=True))
+    return jsonify(body), status
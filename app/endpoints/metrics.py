@@ -0,0 +1,53 @@
+from flask import Blueprint, Response, g, jsonify, request
+import time
+from app.utils import circuit_breaker, metrics, tracing
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+
+@metrics_bp.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    g.timing_token = tracing.start_request()
+
+
+@metrics_bp.after_app_request
+def record_request(response):
+    """Observe the request duration per route and add Server-Timing when enabled.
+
+    Streamed responses are timed until their headers are sent.
+    """
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe("http_request_duration_seconds", elapsed,
+                    route=route, method=request.method, status=str(response.status_code))
+    if g.get('timing_token') is not None:
+        response.headers['Server-Timing'] = tracing.server_timing_header(elapsed)
+    return response
+
+
+@metrics_bp.teardown_app_request
+def end_timer(error=None):
+    tracing.end_request(g.pop('timing_token', None))
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def handle_metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@metrics_bp.route('/health', methods=['GET'])
+def handle_health():
+    """Upstream circuit breaker states; "degraded" while any breaker is not closed.
+
+    Answers 200 either way: degraded queries are still served from local paths.
+    """
+    return jsonify({
+        'status': 'degraded' if circuit_breaker.degraded() else 'ok',
+        'upstreams': circuit_breaker.stats()
+    })
@@ -1,12 +1,37 @@
-from flask import Blueprint, request, jsonify
-from app.utils.tool_selector import create_tool_selector
-import os
-import re
+from flask import Blueprint, Response, g, request, jsonify
+from app.tools import get_tools
+from app.utils.tool_selector import get_agent_executor
+from app.utils import batch, circuit_breaker, deadline, hedge, jobs, llm_pool, metrics, query_runner, speculation
+from app.utils.admission import Rejected, client_key, get_admission
+from app.utils.cache import get_response_cache
+from app.utils.semantic_cache import get_semantic_cache
+from app.utils.weather_cache import get_weather_cache
+import json
 
 query_bp = Blueprint('query_bp', __name__)
 
-# Initialize the agent once
-agent_executor = create_tool_selector()
+
+@query_bp.before_app_request
+def start_deadline():
+    """Give the request its deadline (X-Request-Timeout, body `timeout` or the default)."""
+    g.deadline_token = deadline.start(request.headers, request.get_json(silent=True))
+
+
+@query_bp.teardown_app_request
+def end_deadline(error=None):
+    deadline.reset(g.pop('deadline_token', None))
+
+
+@query_bp.app_errorhandler(Rejected)
+def handle_rejected(rejection):
+    """503 (overloaded) or 429 (client rate limit) with a Retry-After header."""
+    return jsonify(rejection.body()), rejection.status, rejection.headers()
+
+
+def admit_client(cost=1):
+    """Apply the per-client rate limit to this request (`cost` queries); raises RateLimited."""
+    get_admission().check_client(client_key(request.headers, request.remote_addr), cost)
+
 
 @query_bp.route('/query', methods=['POST'])
 def handle_query():
@@ -17,64 +42,12 @@ def handle_query():
         return jsonify({'error': 'Query is required'}), 400
     
     user_query = data['query']
+    admit_client()
     
     try:
-        # Try to use the LangChain agent if available
-        if agent_executor is not None:
-            try:
-                result_dict = agent_executor.invoke({"input": user_query})
-                
-                # Extract the tool used from the agent's intermediate steps
-                tool_used = "agent"
-                if "intermediate_steps" in result_dict and len(result_dict["intermediate_steps"]) > 0:
-                    tool_name = result_dict["intermediate_steps"][0][0].tool
-                    tool_used = tool_name.lower().replace("tool", "")
-                
-                response = {
-                    'query': user_query,
-                    'tool_used': tool_used,
-                    'result': result_dict.get("output", str(result_dict)),
-                    'agent_used': True
-                }
-                
-                return jsonify(response)
-                
-            except Exception as agent_error:
-                print(f"Agent error: {str(agent_error)}")
-                # Fall back to keyword-based routing
-                pass
-        
-        # Fallback: Simple keyword-based routing
-        query_lower = user_query.lower()
-        
-        if any(keyword in query_lower for keyword in ["weather", "temperature", "rain", "sunny", "cloudy", "hot", "cold"]):
-            tool_used = "weather"
-            from app.tools.weather_tool import WeatherTool
-            result = WeatherTool()._run(user_query)
-        elif any(op in query_lower for op in ["+", "-", "*", "x", "/", "multiply", "divide", "add", "subtract", "what is"]):
-            # Check if it contains numbers to avoid false positives
-            if re.search(r'\d', query_lower):
-                tool_used = "math"
-                from app.tools.math_tool import MathTool
-                result = MathTool()._run(user_query)
-            else:
-                tool_used = "llm"
-                from app.tools.llm_tool import LLMTool
-                result = LLMTool()._run(user_query)
-        else:
-            tool_used = "llm"
-            from app.tools.llm_tool import LLMTool
-            result = LLMTool()._run(user_query)
-        
-        response = {
-            'query': user_query,
-            'tool_used': tool_used,
-            'result': result,
-            'agent_used': False
-        }
-        
-        return jsonify(response)
-    
+        return jsonify(query_runner.run_query(user_query))
+    except Rejected:
+        raise
     except Exception as e:
         return jsonify({
             'query': user_query,
@@ -94,12 +67,15 @@ def handle_query_enhanced():
         return jsonify({'error': 'Query is required'}), 400
     
     user_query = data['query']
+    agent_executor = get_agent_executor()
     
     if agent_executor is None:
         return jsonify({
             'error': 'Agent not available. Please configure GROQ_API_KEY in .env file'
         }), 503
     
+    admit_client()
+    
     try:
         result_dict = agent_executor.invoke({"input": user_query})
         
@@ -114,7 +90,9 @@ def handle_query_enhanced():
                 intermediate_steps.append({
                     "tool": action.tool,
                     "tool_input": action.tool_input,
-                    "observation": str(observation)[:200]  # Truncate for readability
+                    "tool_args": action.tool_args,
+                    "observation": str(observation)[:200],  # Truncate for readability
+                    **action.timing
                 })
         
         response = {
@@ -122,15 +100,79 @@ def handle_query_enhanced():
             'tool_used': tool_used,
             'result': result_dict.get("output", str(result_dict)),
             'agent_used': True,
+            'routing_tier': result_dict.get("routing_tier", "llm"),
             'intermediate_steps': intermediate_steps
         }
+        if "tools_used" in result_dict:
+            response['tool_used'] = 'multi'
+            response['tools_used'] = result_dict["tools_used"]
+            response['timing'] = result_dict["timing"]
         
         return jsonify(response)
         
+    except Rejected:
+        raise
     except Exception as e:
         return jsonify({
             'query': user_query,
             'tool_used': 'error',
             'result': f'Error processing query: {str(e)}',
             'agent_used': False
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+@query_bp.route('/query/batch', methods=['POST'])
+def handle_query_batch():
+    """Route and run a list of queries concurrently; results in input order."""
+    queries, error = batch.validate_queries(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    admit_client(len(queries))
+    
+    results = sorted(batch.run_batch(queries, query_runner.route, get_tools()), key=lambda item: item['index'])
+    return jsonify({'results': results})
+
+
+@query_bp.route('/query/batch/stream', methods=['POST'])
+def handle_query_batch_stream():
+    """Like /query/batch, but streams each result as NDJSON as soon as it completes."""
+    queries, error = batch.validate_queries(request.get_json(silent=True))
+    if error:
+        return jsonify({'error': error}), 400
+    admit_client(len(queries))
+    
+    def generate():
+        results = batch.run_batch(queries, query_runner.route, get_tools())
+        try:
+            for item in results:
+                yield json.dumps(item) + "\n"
+        finally:
+            results.close()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def collect_stats():
+    """The /stats body, shared with the ASGI app."""
+    semantic_cache = get_semantic_cache()
+    return {
+        'counters': metrics.snapshot(),
+        'response_cache': get_response_cache().stats(),
+        'semantic_cache': semantic_cache.stats() if semantic_cache is not None else None,
+        'weather_cache': get_weather_cache().stats(),
+        'admission': get_admission().stats(),
+        'hedging': hedge.stats(),
+        'speculation': speculation.stats(),
+        'circuit_breakers': circuit_breaker.stats(),
+        'llm_pool': llm_pool.stats(),
+        'jobs': jobs.stats()
+    }
+
+
+@query_bp.route('/stats', methods=['GET'])
+def handle_stats():
+    """Return the in-process counters (routing tiers, cache hits, etc.)."""
+    return jsonify(collect_stats())
@@ -1,67 +1,148 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_socketio import emit
-import os
+import contextvars
+import queue
+import threading
 import time
+from app.config import Config
+from app.endpoints.query import admit_client
+from app.tools import get_tools
+from app.utils import deadline, planner, query_runner, sse
+from app.utils.admission import Rejected, get_admission
 
 streaming_bp = Blueprint('streaming_bp', __name__)
 
-# For the SocketIO events, we'll define them in the main app
-# but we'll include a regular endpoint for streaming as well
+
+def stream_query_events(user_query):
+    """Yield (event, payload) pairs for a query.
+
+    A `routing` event goes out as soon as the tool is selected, LLM answers
+    follow as `token` events while Groq streams them, and a final `result`
+    event carries the full answer with time-to-first-token and total time.
+    Raises admission.Overloaded before the first event if the selected tool
+    cannot be started before the request deadline.
+
+    A multi-intent query instead gets a `plan` event, a `step` event as each
+    of its steps finishes, and a `result` event with the composed answer
+    (see app/utils/planner.py).
+    """
+    steps = planner.plan(user_query)
+    if len(steps) > 1:
+        yield from planner.stream_plan_events(user_query, steps, query_runner.run_step)
+        return
+
+    started = time.perf_counter()
+    tool_used, tool_args, routing_tier = query_runner.route(user_query)
+
+    with get_admission().acquire(tool_used):
+        yield 'routing', {
+            'query': user_query,
+            'tool_used': tool_used,
+            'routing_tier': routing_tier,
+            'routing_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+        first_token_at = None
+        if tool_used == "llm":
+            parts = []
+            tokens = get_tools()["llm"].stream(user_query)
+            try:
+                for text in tokens:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(text)
+                    yield 'token', {'text': text}
+            finally:
+                # Closes the upstream Groq response if the client went away
+                tokens.close()
+            result = "".join(parts)
+        else:
+            result = get_tools()[tool_used]._run(user_query, **tool_args)
+            first_token_at = time.perf_counter()
+
+    finished = time.perf_counter()
+    yield 'result', {
+        'query': user_query,
+        'tool_used': tool_used,
+        'result': result,
+        'routing_tier': routing_tier,
+        'ttft_ms': round(((first_token_at or finished) - started) * 1000, 1),
+        'total_ms': round((finished - started) * 1000, 1)
+    }
+
+
+def _error_payload(user_query, error):
+    return {
+        'query': user_query,
+        'tool_used': 'error',
+        'result': f'Error processing query: {str(error)}'
+    }
+
 
 @streaming_bp.route('/stream', methods=['POST'])
 def stream_query():
     """Stream the response for a query using server-sent events."""
     data = request.get_json()
-    
+
     if not data or 'query' not in data:
         return jsonify({'error': 'Query is required'}), 400
-    
+
     user_query = data['query']
-    
-    def generate():
+    admit_client()
+
+    # Events are produced on a worker thread so heartbeats keep flowing (and
+    # disconnects are noticed) while the upstream call is still pending
+    events = queue.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        generator = stream_query_events(user_query)
         try:
-            # Simple keyword-based routing for now
-            query_lower = user_query.lower()
-            
-            if any(keyword in query_lower for keyword in ["weather", "temperature", "rain", "sunny", "cloudy", "hot", "cold"]):
-                tool_used = "weather"
-                from app.tools.weather_tool import WeatherTool
-                result = WeatherTool()._run(user_query)
-            elif any(op in query_lower for op in ["+", "-", "*", "x", "/", "multiply", "divide", "add", "subtract", "what is"]):
-                # Check if it contains numbers to avoid false positives
-                import re
-                if re.search(r'\d', query_lower):
-                    tool_used = "math"
-                    from app.tools.math_tool import MathTool
-                    result = MathTool()._run(user_query)
-                else:
-                    tool_used = "llm"
-                    from app.tools.llm_tool import LLMTool
-                    result = LLMTool()._run(user_query)
-            else:
-                tool_used = "llm"
-                from app.tools.llm_tool import LLMTool
-                result = LLMTool()._run(user_query)
-            
-            # Stream the response in chunks
-            response = {
-                'query': user_query,
-                'tool_used': tool_used,
-                'result': result
-            }
-            
-            # Yield each part of the response
-            yield f"data: {jsonify(response).get_json()}\n\n"
-            
+            for item in generator:
+                if cancelled.is_set():
+                    break
+                events.put(item)
+        except Rejected as rejection:
+            events.put(('rejected', rejection))
         except Exception as e:
-            error_response = {
-                'query': user_query,
-                'tool_used': 'error',
-                'result': f'Error processing query: {str(e)}'
-            }
-            yield f"data: {jsonify(error_response).get_json()}\n\n"
-    
-    return generate(), {'Content-Type': 'text/event-stream'}
+            events.put(('error', _error_payload(user_query, e)))
+        finally:
+            generator.close()
+            events.put(None)
+
+    # The copied context carries the request deadline into the thread
+    threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+
+    # Admission is decided before the first event, so a shed request still
+    # gets a plain 503 response instead of a stream
+    first = events.get()
+    if first[0] == 'rejected':
+        raise first[1]
+
+    def generate():
+        event_id = 1
+        try:
+            yield sse.format_event(event_id, *first)
+            while True:
+                try:
+                    item = events.get(timeout=Config.SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield sse.HEARTBEAT
+                    continue
+
+                if item is None:
+                    return
+
+                event_id += 1
+                yield sse.format_event(event_id, *item)
+        finally:
+            # Runs when the client disconnects; stops the upstream stream
+            cancelled.set()
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 
 # For SocketIO, we'll add the event handlers to the main app
@@ -69,49 +150,26 @@ def stream_query():
 def register_socketio_events(socketio):
     @socketio.on('query')
     def handle_query_socket(data):
-        """Handle query via WebSocket."""
+        """Handle query via WebSocket, emitting routing, token and result events."""
         user_query = data.get('query', '')
-        
+
         if not user_query:
             emit('error', {'message': 'Query is required'})
             return
-        
+
+        sid = request.sid
+        events = stream_query_events(user_query)
         try:
-            # Simple keyword-based routing for now
-            query_lower = user_query.lower()
-            
-            if any(keyword in query_lower for keyword in ["weather", "temperature", "rain", "sunny", "cloudy", "hot", "cold"]):
-                tool_used = "weather"
-                from app.tools.weather_tool import WeatherTool
-                result = WeatherTool()._run(user_query)
-            elif any(op in query_lower for op in ["+", "-", "*", "x", "/", "multiply", "divide", "add", "subtract", "what is"]):
-                # Check if it contains numbers to avoid false positives
-                import re
-                if re.search(r'\d', query_lower):
-                    tool_used = "math"
-                    from app.tools.math_tool import MathTool
-                    result = MathTool()._run(user_query)
-                else:
-                    tool_used = "llm"
-                    from app.tools.llm_tool import LLMTool
-                    result = LLMTool()._run(user_query)
-            else:
-                tool_used = "llm"
-                from app.tools.llm_tool import LLMTool
-                result = LLMTool()._run(user_query)
-            
-            response = {
-                'query': user_query,
-                'tool_used': tool_used,
-                'result': result
-            }
-            
-            emit('result', response)
-            
+            admit_client()
+            with deadline.scope(time.monotonic() + deadline.parse_timeout({}, data)):
+                for event, payload in events:
+                    if not socketio.server.manager.is_connected(sid, '/'):
+                        # Client went away; closing the generator stops the upstream call
+                        break
+                    emit(event, payload)
+        except Rejected as rejection:
+            emit('error', {'query': user_query, 'status': rejection.status, **rejection.body()})
         except Exception as e:
-            error_response = {
-                'query': user_query,
-                'tool_used': 'error',
-                'result': f'Error processing query: {str(e)}'
-            }
-            emit('error', error_response)
\ No newline at end of file
+            emit('error', _error_payload(user_query, e))
+        finally:
+            events.close()
@@ -1,5 +1,39 @@
-from .weather_tool import WeatherTool
-from .math_tool import MathTool
-from .llm_tool import LLMTool
+import importlib
+import threading
 
-__all__ = ['WeatherTool', 'MathTool', 'LLMTool']
\ No newline at end of file
+__all__ = ['WeatherTool', 'MathTool', 'LLMTool', 'get_tools']
+
+# The tool classes build on langchain_core, which takes most of a second to
+# import, so their modules load on first use (or during app.warmup)
+_TOOL_MODULES = {
+    'WeatherTool': '.weather_tool',
+    'MathTool': '.math_tool',
+    'LLMTool': '.llm_tool',
+}
+
+_tools = None
+_tools_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name in _TOOL_MODULES:
+        return getattr(importlib.import_module(_TOOL_MODULES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_tools():
+    """Return the shared tool instances, keyed by tool key."""
+    global _tools
+    if _tools is None:
+        with _tools_lock:
+            if _tools is None:
+                from .weather_tool import WeatherTool
+                from .math_tool import MathTool
+                from .llm_tool import LLMTool
+
+                _tools = {
+                    "weather": WeatherTool(),
+                    "math": MathTool(),
+                    "llm": LLMTool(),
+                }
+    return _tools
@@ -1,17 +1,47 @@
-from langchain.tools import BaseTool
+from langchain_core.tools import BaseTool
 from pydantic import Field
-from typing import Optional, Type
+from typing import AsyncIterator, Iterator, Optional, Type
 from langchain_core.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun
 )
-from groq import Groq
 from app.config import Config
+from app.utils import deadline, models
+from app.utils.cache import get_response_cache
+from app.utils.circuit_breaker import CircuitOpen, get_breaker
+from app.utils.clients import get_groq_client, get_async_groq_client
+from app.utils.semantic_cache import get_semantic_cache
+from app.utils.tracing import span, traced
 
 class LLMTool(BaseTool):
     name: str = "llm"
     description: str = "Useful for answering general questions that don't fit other tools"
     
+    def _messages(self, query: str) -> list:
+        return [
+            {
+                "role": "user",
+                "content": query,
+            }
+        ]
+    
+    def _similar_answer(self, model: str, query: str) -> Optional[str]:
+        """Return the cached answer to a similarly worded query, if any."""
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is None:
+            return None
+        found, answer = semantic_cache.lookup(model, query)
+        return answer if found else None
+    
+    def _unavailable(self, error: CircuitOpen) -> str:
+        return f"Could not get an answer right now: {error}. Please try again shortly."
+    
+    def _remember(self, model: str, query: str, answer: str) -> None:
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is not None and answer:
+            semantic_cache.store(model, query, answer)
+    
+    @traced("tool", tool="llm")
     def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
         """Use the tool to get an answer from the LLM."""
         # Get Groq API key from config
@@ -21,24 +51,174 @@ class LLMTool(BaseTool):
             # Return mock response if no API key is provided
             return f"Based on general knowledge, the answer to '{query}' is a placeholder response from the LLM tool."
         
-        try:
-            client = Groq(api_key=api_key)
-            
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "user",
-                        "content": query,
-                    }
-                ],
-                model=Config.DEFAULT_GROQ_MODEL,  # Using a free model from Groq
-            )
+        model = models.model_for("answer")
+        
+        def ask_llm():
+            # Exact-match miss: try a similarly worded question before Groq
+            answer = self._similar_answer(model, query)
+            if answer is not None:
+                return answer
             
-            return chat_completion.choices[0].message.content
+            # Only cached answers while Groq's circuit breaker is open
+            get_breaker("groq").check()
+            client = get_groq_client(deadline.retries("answer"))
             
+            with span("upstream", service="groq", operation="answer"):
+                chat_completion = client.chat.completions.create(
+                    messages=self._messages(query),
+                    model=model,
+                    timeout=deadline.timeout("answer"),
+                    **models.max_tokens("answer"),
+                )
+            
+            answer = chat_completion.choices[0].message.content
+            self._remember(model, query, answer)
+            return answer
+        
+        try:
+            # Identical prompts to the same model share one cached answer
+            return get_response_cache().get_or_compute("llm", f"{model}\n{query.strip()}", ask_llm)
+            
+        except CircuitOpen as e:
+            return self._unavailable(e)
         except Exception as e:
             return f"Error calling LLM: {str(e)}"
     
+    @traced("tool", tool="llm")
     async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         """Asynchronous version of the tool."""
-        return self._run(query, run_manager=run_manager)
\ No newline at end of file
+        api_key = Config.GROQ_API_KEY
+        
+        if not api_key or api_key == "your_groq_api_key_here":
+            return f"Based on general knowledge, the answer to '{query}' is a placeholder response from the LLM tool."
+        
+        model = models.model_for("answer")
+        
+        async def ask_llm():
+            answer = self._similar_answer(model, query)
+            if answer is not None:
+                return answer
+            
+            get_breaker("groq").check()
+            client = get_async_groq_client(deadline.retries("answer"))
+            
+            with span("upstream", service="groq", operation="answer"):
+                chat_completion = await client.chat.completions.create(
+                    messages=self._messages(query),
+                    model=model,
+                    timeout=deadline.timeout("answer"),
+                    **models.max_tokens("answer"),
+                )
+            
+            answer = chat_completion.choices[0].message.content
+            self._remember(model, query, answer)
+            return answer
+        
+        try:
+            return await get_response_cache().aget_or_compute("llm", f"{model}\n{query.strip()}", ask_llm)
+            
+        except CircuitOpen as e:
+            return self._unavailable(e)
+        except Exception as e:
+            return f"Error calling LLM: {str(e)}"
+    
+    def stream(self, query: str) -> Iterator[str]:
+        """Yield the answer chunk by chunk as Groq streams tokens.
+        
+        Closing the generator early closes the upstream response. A cached
+        answer (or, while Groq's circuit breaker is open, a notice that no
+        answer is available) is yielded in one chunk; a fully streamed
+        answer is cached.
+        """
+        api_key = Config.GROQ_API_KEY
+        
+        if not api_key or api_key == "your_groq_api_key_here":
+            yield f"Based on general knowledge, the answer to '{query}' is a placeholder response from the LLM tool."
+            return
+        
+        model = models.model_for("answer")
+        cache = get_response_cache()
+        cache_input = f"{model}\n{query.strip()}"
+        
+        found, answer = cache.lookup("llm", cache_input)
+        if not found:
+            answer = self._similar_answer(model, query)
+            found = answer is not None
+        if found:
+            yield answer
+            return
+        
+        try:
+            get_breaker("groq").check()
+        except CircuitOpen as e:
+            yield self._unavailable(e)
+            return
+        
+        # Timed until Groq starts streaming, i.e. time to first token
+        with span("upstream", service="groq", operation="answer_stream"):
+            stream = get_groq_client(deadline.retries("answer")).chat.completions.create(
+                messages=self._messages(query),
+                model=model,
+                stream=True,
+                timeout=deadline.timeout("answer"),
+                **models.max_tokens("answer"),
+            )
+        parts = []
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+        
+        answer = "".join(parts)
+        cache.store("llm", cache_input, answer)
+        self._remember(model, query, answer)
+    
+    async def astream(self, query: str) -> AsyncIterator[str]:
+        """Asynchronous version of stream."""
+        api_key = Config.GROQ_API_KEY
+        
+        if not api_key or api_key == "your_groq_api_key_here":
+            yield f"Based on general knowledge, the answer to '{query}' is a placeholder response from the LLM tool."
+            return
+        
+        model = models.model_for("answer")
+        cache = get_response_cache()
+        cache_input = f"{model}\n{query.strip()}"
+        
+        found, answer = await cache.alookup("llm", cache_input)
+        if not found:
+            answer = self._similar_answer(model, query)
+            found = answer is not None
+        if found:
+            yield answer
+            return
+        
+        try:
+            get_breaker("groq").check()
+        except CircuitOpen as e:
+            yield self._unavailable(e)
+            return
+        
+        with span("upstream", service="groq", operation="answer_stream"):
+            stream = await get_async_groq_client(deadline.retries("answer")).chat.completions.create(
+                messages=self._messages(query),
+                model=model,
+                stream=True,
+                timeout=deadline.timeout("answer"),
+                **models.max_tokens("answer"),
+            )
+        parts = []
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+        
+        answer = "".join(parts)
+        await cache.astore("llm", cache_input, answer)
+        self._remember(model, query, answer)
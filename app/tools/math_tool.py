@@ -1,152 +1,150 @@
 import re
-import ast
-import operator
 import math
-from langchain.tools import BaseTool
+from langchain_core.tools import BaseTool
 from pydantic import Field
-from typing import Optional, Type
+from typing import List, Optional, Type
 from langchain_core.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun
 )
+from app.utils.cache import get_response_cache
+from app.utils import math_engine
+from app.utils.tracing import traced
+
+# Filler phrases dropped from natural-language queries
+FILLER_PATTERN = re.compile(
+    r"what is |what's |whats |calculate |compute |solve |evaluate |math: |math |give me |tell me |"
+    r"find |the result |the answer |of |for "
+)
+
+WORD_OPERATORS = {
+    "plus": "+",
+    "minus": "-",
+    "times": "*",
+    "divided by": "/",
+    "multiply": "*",
+    "divide": "/",
+    "add": "+",
+    "subtract": "-",
+    "x": "*",
+}
+WORD_OPERATOR_PATTERN = re.compile(r" (divided by|plus|minus|times|multiply|divide|add|subtract|x) ")
+
+# 'x' between numbers means multiplication, e.g. "3x4" or "3 x 4"
+NUMERIC_TIMES_PATTERN = re.compile(r"(\d)\s*x\s*(\d)")
+
+# "square root of 16" -> "sqrt(16)"
+SQUARE_ROOT_PATTERN = re.compile(r"square root (?:of )?(\d+(?:\.\d+)?)")
+
+# "10 percent of 250" -> "(10/100)*250"
+PERCENT_OF_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|percent) of ")
+
+# "1,000,000" -> "1000000"; not inside function calls, where commas
+# separate arguments ("log(8,2)")
+THOUSANDS_PATTERN = re.compile(r"(?<![\d.])\d{1,3}(?:,\d{3})+(?![\d.])")
+CALL_PATTERN = re.compile(r"[a-z0-9_]\s*\(")
+
+# Words, but not the exponent in numbers such as 1e6
+WORD_PATTERN = re.compile(r"(?<![\d.])[a-z_][a-z0-9_]*")
+KNOWN_NAMES = set(math_engine.FUNCTIONS) | set(math_engine.CONSTANTS)
+
 
 class MathTool(BaseTool):
     name: str = "math"
-    description: str = "Useful for performing mathematical operations including complex expressions with multiple operations, parentheses, exponents, etc."
+    description: str = "Useful for performing mathematical operations including complex expressions with multiple operations, parentheses, exponents, and functions such as sqrt, log and sin."
     
     def _extract_expression(self, query: str) -> str:
         """Extract mathematical expression from natural language query."""
-        query_lower = query.lower()
-        
-        # Common phrases to remove
-        phrases_to_remove = [
-            "what is ",
-            "what's ",
-            "whats ",
-            "calculate ",
-            "compute ",
-            "solve ",
-            "evaluate ",
-            "math: ",
-            "math ",
-            "give me ",
-            "tell me ",
-            "find ",
-            "the result ",
-            "the answer ",
-            "of ",
-            "for ",
-        ]
-        
-        for phrase in phrases_to_remove:
-            query_lower = query_lower.replace(phrase, "")
+        query_lower = SQUARE_ROOT_PATTERN.sub(r"sqrt(\1)", query.lower())
+        query_lower = PERCENT_OF_PATTERN.sub(r"(\1/100)*", query_lower)
+        query_lower = FILLER_PATTERN.sub("", query_lower)
         
         # Remove question marks and extra whitespace
         query_lower = query_lower.replace("?", "").strip()
         
-        # Replace 'x' with '*' for multiplication (both standalone and adjacent to numbers)
-        query_lower = re.sub(r'(\d)\s*x\s*(\d)', r'\1*\2', query_lower)
-        query_lower = query_lower.replace(' x ', '*')
+        # Replace 'x' and word operators with symbols
+        query_lower = NUMERIC_TIMES_PATTERN.sub(r"\1*\2", query_lower)
+        query_lower = WORD_OPERATOR_PATTERN.sub(lambda m: WORD_OPERATORS[m.group(1)], query_lower)
         
-        # Replace common word operators
-        query_lower = query_lower.replace(" plus ", "+")
-        query_lower = query_lower.replace(" minus ", "-")
-        query_lower = query_lower.replace(" times ", "*")
-        query_lower = query_lower.replace(" divided by ", "/")
-        query_lower = query_lower.replace(" multiply ", "*")
-        query_lower = query_lower.replace(" divide ", "/")
-        query_lower = query_lower.replace(" add ", "+")
-        query_lower = query_lower.replace(" subtract ", "-")
-        
-        # Remove any remaining non-mathematical words
-        # Keep only digits, operators, parentheses, decimal points, and whitespace
-        expression = re.sub(r'[a-zA-Z]+', '', query_lower)
+        # Remove any remaining non-mathematical words, keeping function
+        # names and constants the math engine understands
+        expression = WORD_PATTERN.sub(lambda m: m.group(0) if m.group(0) in KNOWN_NAMES else "", query_lower)
         
         # Clean up extra whitespace
         expression = ' '.join(expression.split())
         
         return expression.strip()
     
-    def _safe_eval(self, expression: str) -> float:
-        """Safely evaluate a mathematical expression using AST."""
-        # Define allowed operators
-        operators = {
-            ast.Add: operator.add,
-            ast.Sub: operator.sub,
-            ast.Mult: operator.mul,
-            ast.Div: operator.truediv,
-            ast.Pow: operator.pow,
-            ast.Mod: operator.mod,
-            ast.FloorDiv: operator.floordiv,
-            ast.UAdd: operator.pos,
-            ast.USub: operator.neg,
-        }
+    def _evaluate(self, expression: str) -> str:
+        """Evaluate a validated expression and format the result."""
+        # Evaluate the expression with the compiled, bounded-cost engine
+        result = math_engine.evaluate(expression)
         
-        def eval_node(node):
-            if isinstance(node, ast.Constant):  # Python 3.8+
-                return node.value
-            elif isinstance(node, ast.Num):  # Python 3.7 and earlier
-                return node.n
-            elif isinstance(node, ast.BinOp):
-                left = eval_node(node.left)
-                right = eval_node(node.right)
-                return operators[type(node.op)](left, right)
-            elif isinstance(node, ast.UnaryOp):
-                operand = eval_node(node.operand)
-                return operators[type(node.op)](operand)
-            else:
-                raise ValueError(f"Unsupported operation: {type(node).__name__}")
+        # A negative base to a fractional power, e.g. (-8)**(1/3)
+        if isinstance(result, complex):
+            return "Error: Result is not a real number"
         
+        # Convert to float for consistent handling; integers within the
+        # engine's bit limit can still be beyond the float range
         try:
-            # Parse the expression into an AST
-            tree = ast.parse(expression, mode='eval')
-            # Evaluate the AST
-            result = eval_node(tree.body)
-            return result
-        except Exception as e:
-            raise ValueError(f"Invalid expression: {str(e)}")
+            result = float(result)
+        except OverflowError:
+            raise math_engine.MathEngineError("Result too large")
+        
+        # Format the result
+        # Check for invalid results
+        if math.isinf(result):
+            return "Error: Result is infinite"
+        elif math.isnan(result):
+            return "Error: Result is not a number"
+        elif result.is_integer():
+            return str(int(result))
+        else:
+            # Round to reasonable precision
+            return str(round(result, 10))
+    
+    def evaluate_batch(self, expressions: List[str]) -> List[str]:
+        """Evaluate many expressions, returning formatted results in order."""
+        return [self._run(expression, expression=expression) for expression in expressions]
     
-    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
-        """Use the tool to perform math operations."""
+    @traced("tool", tool="math")
+    def _run(self, query: str, expression: Optional[str] = None,
+             run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Use the tool to perform math operations.
+
+        When the router already extracted a normalized `expression`, it is
+        used instead of parsing the query.
+        """
         try:
             # Extract the mathematical expression
-            expression = self._extract_expression(query)
+            if not expression:
+                expression = self._extract_expression(query)
             
             if not expression:
                 return "Could not extract a mathematical expression from the query."
             
+            if not CALL_PATTERN.search(expression):
+                expression = THOUSANDS_PATTERN.sub(lambda m: m.group(0).replace(",", ""), expression)
+            
             # Remove all whitespace for processing
             expression = expression.replace(" ", "")
             
             # Check if expression contains valid mathematical characters
-            if not re.search(r'\d', expression):
+            if not re.search(r'\d', expression) and not set(WORD_PATTERN.findall(expression)) & set(math_engine.CONSTANTS):
                 return "No valid mathematical expression found in the query."
             
             # Replace '^' with '**' for exponentiation
             expression = expression.replace('^', '**')
             
-            # Validate that expression only contains allowed characters
-            allowed_chars = set('0123456789+-*/().** ')
-            if not all(c in allowed_chars for c in expression):
-                return f"Error: Invalid characters in expression. Only numbers and operators (+, -, *, /, ^, parentheses) are allowed."
-            
-            # Evaluate the expression safely
-            result = self._safe_eval(expression)
-            
-            # Convert to float for consistent handling
-            result = float(result)
+            # Validate that expression only contains allowed characters and names
+            allowed_chars = set('0123456789+-*/%().,_abcdefghijklmnopqrstuvwxyz')
+            if not all(c in allowed_chars for c in expression) or not set(WORD_PATTERN.findall(expression)) <= KNOWN_NAMES:
+                return f"Error: Invalid characters in expression. Only numbers, operators (+, -, *, /, ^, %, parentheses) and functions ({', '.join(sorted(math_engine.FUNCTIONS))}) are allowed."
             
-            # Format the result
-            # Check for invalid results
-            if math.isinf(result):
-                return "Error: Result is infinite"
-            elif math.isnan(result):
-                return "Error: Result is not a number"
-            elif result.is_integer():
-                return str(int(result))
-            else:
-                # Round to reasonable precision
-                return str(round(result, 10))
+            # The canonical expression fully determines the answer
+            return get_response_cache().get_or_compute(
+                "math", expression, lambda: self._evaluate(expression)
+            )
                 
         except ZeroDivisionError:
             return "Error: Division by zero"
@@ -155,6 +153,8 @@ class MathTool(BaseTool):
         except Exception as e:
             return f"Error calculating: {str(e)}"
     
-    async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+    @traced("tool", tool="math")
+    async def _arun(self, query: str, expression: Optional[str] = None,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         """Asynchronous version of the tool."""
-        return self._run(query, run_manager=run_manager)
\ No newline at end of file
+        return self._run(query, expression=expression)
\ No newline at end of file
@@ -1,52 +1,128 @@
-import requests
 import re
-from langchain.tools import BaseTool
+from langchain_core.tools import BaseTool
 from pydantic import Field
-from typing import Optional, Type
+from typing import TYPE_CHECKING, Optional, Type
 from langchain_core.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun
 )
-from langchain_groq import ChatGroq
 from app.config import Config
+from app.utils import deadline, models
+from app.utils.circuit_breaker import CircuitOpen, get_breaker
+from app.utils.clients import get_chat_groq, get_with_retries, aget_with_retries
+from app.utils.gazetteer import Place, get_gazetteer
+from app.utils.hedge import get_hedger
+from app.utils.tracing import traced
+from app.utils.weather_cache import WeatherQuotaExceeded, get_weather_cache
+
+
+if TYPE_CHECKING:
+    # langchain_groq is heavy to import; it loads with the first extraction (or warmup)
+    from langchain_groq import ChatGroq
+
+
+class WeatherLookupError(Exception):
+    """Raised when OpenWeatherMap answers with an error for a city."""
+
 
 class WeatherTool(BaseTool):
     name: str = "weather"
     description: str = "Useful for getting weather information for a specific city"
-    
+
+    def _extraction_llm(self, model: Optional[str] = None) -> Optional["ChatGroq"]:
+        """Return a ChatGroq for city extraction (on the extractor model by default), or None without an API key."""
+        api_key = Config.GROQ_API_KEY
+        if not api_key or api_key == "your_groq_api_key_here":
+            return None
+
+        return get_chat_groq(model or models.model_for("extract_city"), max_retries=deadline.retries("extract_city"))
+
+    def _extraction_prompt(self, query: str) -> str:
+        return f"""Extract ONLY the city name from this query. Return just the city name, nothing else.
+If there's a country or state mentioned, include it (e.g., "Paris, France" or "Portland, Oregon").
+
+Query: {query}
+
+City name:"""
+
+    def _clean_extracted_city(self, content: str) -> Optional[str]:
+        """Clean up the LLM's answer; None if it does not look like a city."""
+        extracted_city = content.strip()
+
+        # Clean up the extracted city
+        extracted_city = extracted_city.strip('"\'.,!?')
+
+        # Validate it's not empty or too long (likely not a city)
+        if extracted_city and len(extracted_city) < 100:
+            return extracted_city
+        return None
+
+    def _validate_extracted_city(self, query: str, content: str) -> Optional[str]:
+        """The extracted city if it is named in the query or known to the gazetteer, else None.
+
+        A reply that fails is escalated to the larger model (app/utils/models.py).
+        """
+        city = self._clean_extracted_city(content)
+        if city is None:
+            return None
+        if city.split(",")[0].strip().lower() in query.lower() or self._find_place(city) is not None:
+            return city
+        return None
+
+    @traced("extract_city")
     def _extract_city_smart(self, query: str) -> str:
         """Smartly extract city name from query using multiple approaches."""
-        query_lower = query.lower().strip()
-        
-        # Method 1: Try using LLM to extract city name
+        # Method 1: Try using LLM to extract city name, time and Groq permitting
         try:
-            api_key = Config.GROQ_API_KEY
-            if api_key and api_key != "your_groq_api_key_here":
-                llm = ChatGroq(
-                    temperature=0,
-                    groq_api_key=api_key,
-                    model_name=Config.DEFAULT_GROQ_MODEL
+            if self._extraction_llm() is not None and deadline.allows("extract_city") and get_breaker("groq").allow():
+                prompt = self._extraction_prompt(query)
+
+                def ask(model):
+                    llm = self._extraction_llm(model)
+                    return get_hedger("extract_city").call(
+                        lambda: llm.invoke(prompt, timeout=deadline.timeout("extract_city"),
+                                           **models.max_tokens("extract_city"))
+                    ).content
+
+                city = models.with_escalation(
+                    "extract_city", ask, lambda content: self._validate_extracted_city(query, content)
                 )
-                
-                extraction_prompt = f"""Extract ONLY the city name from this query. Return just the city name, nothing else.
-If there's a country or state mentioned, include it (e.g., "Paris, France" or "Portland, Oregon").
+                if city:
+                    return city
+        except Exception as e:
+            print(f"LLM extraction failed: {e}")
 
-Query: {query}
+        return self._extract_city_local(query)
 
-City name:"""
-                
-                response = llm.invoke(extraction_prompt)
-                extracted_city = response.content.strip()
-                
-                # Clean up the extracted city
-                extracted_city = extracted_city.strip('"\'.,!?')
-                
-                # Validate it's not empty or too long (likely not a city)
-                if extracted_city and len(extracted_city) < 100:
-                    return extracted_city
+    @traced("extract_city")
+    async def _aextract_city_smart(self, query: str) -> str:
+        """Asynchronous version of _extract_city_smart."""
+        # Method 1: Try using LLM to extract city name, time and Groq permitting
+        try:
+            if self._extraction_llm() is not None and deadline.allows("extract_city") and get_breaker("groq").allow():
+                prompt = self._extraction_prompt(query)
+
+                async def ask(model):
+                    llm = self._extraction_llm(model)
+                    return (await get_hedger("extract_city").acall(
+                        lambda: llm.ainvoke(prompt, timeout=deadline.timeout("extract_city"),
+                                            **models.max_tokens("extract_city"))
+                    )).content
+
+                city = await models.awith_escalation(
+                    "extract_city", ask, lambda content: self._validate_extracted_city(query, content)
+                )
+                if city:
+                    return city
         except Exception as e:
             print(f"LLM extraction failed: {e}")
-        
+
+        return self._extract_city_local(query)
+
+    def _extract_city_local(self, query: str) -> str:
+        """Extract the city without an LLM (patterns, then word filtering)."""
+        query_lower = query.lower().strip()
+
         # Method 2: Pattern-based extraction
         patterns = [
             r"weather\s+in\s+([a-zA-Z\s,'-]+?)(?:\s*\?|$|\s+weather|\s+today|\s+now)",
@@ -55,7 +131,7 @@ City name:"""
             r"([a-zA-Z\s,'-]+?)'s\s+weather",
             r"temperature\s+in\s+([a-zA-Z\s,'-]+?)(?:\s*\?|$)",
         ]
-        
+
         for pattern in patterns:
             match = re.search(pattern, query_lower, re.IGNORECASE)
             if match:
@@ -65,62 +141,179 @@ City name:"""
                 city = re.sub(r'\s+', ' ', city)  # Normalize whitespace
                 if city:
                     return city
-        
+
         # Method 3: Remove common weather-related words and get what's left
         words_to_remove = [
             'what', 'is', 'the', 'weather', 'today', 'now', 'current',
             'temperature', 'in', 'at', 'for', 'like', 'how', 'whats',
             'tell', 'me', 'about', 'give', 'show', 'a', 'an'
         ]
-        
+
         words = query_lower.split()
         city_words = [w for w in words if w.strip('.,!?\'"') not in words_to_remove]
-        
+
         if city_words:
             city = ' '.join(city_words)
             city = city.strip('"\'.,!?')
             # Capitalize properly
             city = ' '.join(word.capitalize() for word in city.split())
             return city
-        
+
         return "San Francisco"  # Default fallback
-    
-    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
-        """Use the tool to get weather information."""
-        # Extract city name using smart extraction
-        city = self._extract_city_smart(query)
-        
+
+    def _find_place(self, text: str, country: Optional[str] = None) -> Optional[Place]:
+        """Look the location up in the offline gazetteer; None if unknown."""
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            return None
+        try:
+            return gazetteer.find(text, country)
+        except Exception as e:
+            print(f"Gazetteer lookup failed: {e}")
+            return None
+
+    @traced("locate")
+    def _resolve_location(self, query: str, city: Optional[str], country: Optional[str]):
+        """Return (city, place) for the query.
+
+        The gazetteer is tried first, on the router's city if it extracted
+        one, otherwise on the query itself; the LLM (then the regexes) is
+        only asked when it finds nothing.
+        """
+        place = self._find_place(city or query, country)
+        if place is not None:
+            return place.name, place
+
+        if city:
+            return self._location(city, country), None
+        return self._extract_city_smart(query), None
+
+    @traced("locate")
+    async def _aresolve_location(self, query: str, city: Optional[str], country: Optional[str]):
+        """Asynchronous version of _resolve_location."""
+        place = self._find_place(city or query, country)
+        if place is not None:
+            return place.name, place
+
+        if city:
+            return self._location(city, country), None
+        return await self._aextract_city_smart(query), None
+
+    def _weather_request(self, city: str, api_key: str, place: Optional[Place] = None):
+        """Return the OpenWeatherMap URL and query parameters for a city.
+
+        Known places are queried by coordinates, which avoids OpenWeatherMap
+        guessing between cities that share a name.
+        """
+        base_url = f"{Config.OPENWEATHER_BASE_URL}/weather"
+        if place is not None:
+            location = {"lat": place.latitude, "lon": place.longitude}
+        else:
+            location = {"q": city}
+        params = {
+            **location,
+            "appid": api_key,
+            "units": "metric"
+        }
+        return base_url, params
+
+    def _parse_observation(self, status_code: int, data: dict) -> dict:
+        """Reduce an OpenWeatherMap response to the cached observation.
+
+        Raises WeatherLookupError on API errors.
+        """
+        if status_code != 200:
+            raise WeatherLookupError(data.get('message', 'Unknown error'))
+
+        return {
+            "name": data.get("name"),
+            "temp": data["main"]["temp"],
+            "description": data["weather"][0]["description"],
+        }
+
+    def _format_weather(self, city: str, observation: dict, place: Optional[Place] = None) -> str:
+        # By coordinates OpenWeatherMap names the nearest station (often a
+        # district), so keep the gazetteer's name for known places
+        actual_city = city if place is not None else observation.get("name") or city
+        return f"It's {observation['description']} and {observation['temp']}°C in {actual_city}."
+
+    @traced("upstream", service="openweathermap", operation="weather")
+    def _fetch_weather(self, city: str, api_key: str, place: Optional[Place] = None) -> dict:
+        """Call OpenWeatherMap for a city; raises CircuitOpen while it is failing."""
+        get_breaker("openweathermap").check()
+        # Make API call to OpenWeatherMap
+        base_url, params = self._weather_request(city, api_key, place)
+        response = get_hedger("weather").call(lambda: get_with_retries(base_url, params=params, stage="weather"))
+        return self._parse_observation(response.status_code, response.json())
+
+    @traced("upstream", service="openweathermap", operation="weather")
+    async def _afetch_weather(self, city: str, api_key: str, place: Optional[Place] = None) -> dict:
+        """Call OpenWeatherMap for a city without blocking the event loop."""
+        get_breaker("openweathermap").check()
+        base_url, params = self._weather_request(city, api_key, place)
+        response = await get_hedger("weather").acall(
+            lambda: aget_with_retries(base_url, params=params, stage="weather")
+        )
+        return self._parse_observation(response.status_code, response.json())
+
+    def _location(self, city: str, country: Optional[str]) -> str:
+        """Combine pre-extracted city and country into an OpenWeatherMap query."""
+        return f"{city},{country}" if country else city
+
+    @traced("tool", tool="weather")
+    def _run(self, query: str, city: Optional[str] = None, country: Optional[str] = None,
+             run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Use the tool to get weather information.
+
+        When the router already extracted `city` (and optionally an ISO
+        `country` code), the extraction step is skipped.
+        """
+        city, place = self._resolve_location(query, city, country)
+
         # Get OpenWeatherMap API key from config
         api_key = Config.OPENWEATHER_API_KEY
-        
+
         if not api_key or api_key == "your_openweather_api_key_here":
             # Return mock data if no API key is provided
             return f"It's sunny and 24°C in {city}."
-        
-        # Make API call to OpenWeatherMap
-        base_url = "http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "q": city,
-            "appid": api_key,
-            "units": "metric"
-        }
-        
+
         try:
-            response = requests.get(base_url, params=params)
-            data = response.json()
-            
-            if response.status_code == 200:
-                temp = data["main"]["temp"]
-                description = data["weather"][0]["description"]
-                actual_city = data.get("name", city)
-                return f"It's {description} and {temp}°C in {actual_city}."
-            else:
-                error_msg = data.get('message', 'Unknown error')
-                return f"Could not get weather for '{city}'. Error: {error_msg}. Please check the city name."
-                
+            # Observations are shared by every query that resolves to the same location
+            weather_cache = get_weather_cache()
+            observation = weather_cache.get(
+                weather_cache.key_for(city, place), lambda: self._fetch_weather(city, api_key, place)
+            )
+            return self._format_weather(city, observation, place)
+        except (WeatherQuotaExceeded, CircuitOpen) as e:
+            return f"Could not get weather for '{city}' right now: {e}."
+        except WeatherLookupError as e:
+            return f"Could not get weather for '{city}'. Error: {e}. Please check the city name."
         except Exception as e:
             return f"Error fetching weather: {str(e)}"
-    
-    async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
+
+    @traced("tool", tool="weather")
+    async def _arun(self, query: str, city: Optional[str] = None, country: Optional[str] = None,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
         """Asynchronous version of the tool."""
-        return self._run(query, run_manager=run_manager)
\ No newline at end of file
+        city, place = await self._aresolve_location(query, city, country)
+
+        api_key = Config.OPENWEATHER_API_KEY
+
+        if not api_key or api_key == "your_openweather_api_key_here":
+            # Return mock data if no API key is provided
+            return f"It's sunny and 24°C in {city}."
+
+        try:
+            weather_cache = get_weather_cache()
+            observation = await weather_cache.aget(
+                weather_cache.key_for(city, place),
+                lambda: self._afetch_weather(city, api_key, place),
+                lambda: self._fetch_weather(city, api_key, place),
+            )
+            return self._format_weather(city, observation, place)
+        except (WeatherQuotaExceeded, CircuitOpen) as e:
+            return f"Could not get weather for '{city}' right now: {e}."
+        except WeatherLookupError as e:
+            return f"Could not get weather for '{city}'. Error: {e}. Please check the city name."
+        except Exception as e:
+            return f"Error fetching weather: {str(e)}"
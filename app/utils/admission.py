@@ -0,0 +1,387 @@
+"""Admission control for the query endpoints.
+
+Every tool has a concurrency limit per worker process. A request whose tool
+has no free slot waits in a FIFO queue, unless its estimated wait (its
+queue position times the tool's recent service time, divided by the limit)
+is longer than what is left of the request's deadline. Such a request is
+shed at once with 503 and a Retry-After hint instead of joining a queue it
+cannot get through in time.
+
+The limits adapt to the upstreams (AIMD): a 429 from Groq halves the LLM
+limit, at most once per cooldown, and every successful Groq call raises it
+by 1/limit, i.e. by about one slot per round of `limit` calls, back up to
+the configured maximum. OpenWeatherMap 429s do the same for the weather
+limit. The upstream responses are observed by the shared HTTP clients
+(app/utils/clients.py).
+
+Clients, identified by API key or else by IP address, can additionally be
+held to a token-bucket rate (429 with Retry-After when exceeded).
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from app.config import Config
+from app.utils import metrics
+from app.utils.deadline import current as current_deadline
+from app.utils.rate_limit import TokenBucket
+
+
+# Upstream services and the tool whose concurrency follows their 429s
+UPSTREAM_TOOLS = {
+    "groq": "llm",
+    "openweathermap": "weather",
+}
+
+
+class Rejected(Exception):
+    """A request turned away by admission control; carries a Retry-After hint."""
+
+    status = 503
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+    def headers(self):
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+    def body(self):
+        return {"error": str(self), "reason": self.reason, "retry_after": round(self.retry_after, 2)}
+
+
+class Overloaded(Rejected):
+    """Raised when a tool's queue cannot admit the request before its deadline."""
+
+    status = 503
+
+
+class RateLimited(Rejected):
+    """Raised when a client exceeds its request rate."""
+
+    status = 429
+
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Slot:
+    """A held concurrency slot; released on exit from a with block (or release())."""
+
+    __slots__ = ("limiter", "started")
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = time.monotonic()
+
+    def release(self):
+        if self.limiter is not None:
+            limiter, self.limiter = self.limiter, None
+            limiter.release(time.monotonic() - self.started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release()
+        return False
+
+
+class ConcurrencyLimiter:
+    """Bounded concurrency with a deadline-aware FIFO queue and an AIMD limit.
+
+    Usable from threads (acquire) and from asyncio code (aacquire); slots
+    freed by either are handed to the longest waiting request.
+    """
+
+    def __init__(self, name, limit, min_limit=1, max_queue=256, decrease=0.5,
+                 cooldown=1.0, service_time=1.0):
+        self.name = name
+        self.max_limit = limit
+        self.min_limit = min(min_limit, limit)
+        self.limit = float(limit)
+        self.max_queue = max_queue
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        # Moving average of how long a slot is held, for wait estimates;
+        # `service_time` is only a prior until the first releases
+        self.service_time = service_time
+        self._samples = 0
+        self._waiters = deque()
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _capacity(self):
+        return max(self.min_limit, int(self.limit))
+
+    def _estimated_wait(self):
+        """Seconds until a newly queued request would get a slot (lock held)."""
+        if self.in_flight < self._capacity() and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) / self._capacity() * self.service_time
+
+    def estimated_wait(self):
+        with self._lock:
+            return self._estimated_wait()
+
+    def _publish(self):
+        metrics.set_gauge("admission_in_flight", self.in_flight, tool=self.name)
+        metrics.set_gauge("admission_queue_depth", len(self._waiters), tool=self.name)
+        metrics.set_gauge("admission_limit", self._capacity(), tool=self.name)
+
+    def _shed(self, reason, retry_after):
+        metrics.increment("admission_shed_total", tool=self.name, reason=reason)
+        return Overloaded(f"Too many {self.name} requests in progress, try again shortly",
+                          retry_after, reason)
+
+    def _enqueue(self, deadline, loop=None):
+        """Take a free slot (returns None) or queue a waiter; raises Overloaded to shed."""
+        with self._lock:
+            if self.in_flight < self._capacity() and not self._waiters:
+                self.in_flight += 1
+                self._publish()
+                return None
+
+            wait = self._estimated_wait()
+            if len(self._waiters) >= self.max_queue:
+                raise self._shed("queue_full", wait)
+            if deadline is not None and wait > deadline - time.monotonic():
+                raise self._shed("deadline", wait)
+
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            self._publish()
+            return waiter
+
+    def _abandon(self, waiter):
+        """Drop a waiter that gave up; returns True if it was granted a slot meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._publish()
+            return False
+
+    def _observe_wait(self, started):
+        metrics.observe("admission_wait_seconds", time.monotonic() - started, tool=self.name)
+
+    def acquire(self, deadline=None):
+        """Return a Slot, waiting up to `deadline` (a time.monotonic() value) for one."""
+        started = time.monotonic()
+        waiter = self._enqueue(deadline)
+        if waiter is not None:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not waiter.event.wait(timeout) and not self._abandon(waiter):
+                raise self._shed("timeout", self.estimated_wait())
+        self._observe_wait(started)
+        return Slot(self)
+
+    async def aacquire(self, deadline=None):
+        """Asynchronous version of acquire."""
+        started = time.monotonic()
+        waiter = self._enqueue(deadline, asyncio.get_running_loop())
+        if waiter is not None:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(waiter.future, timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._shed("timeout", self.estimated_wait())
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self.release(None)
+                raise
+        self._observe_wait(started)
+        return Slot(self)
+
+    def _dispatch(self):
+        """Hand free slots to queued requests (lock held)."""
+        while self._waiters and self.in_flight < self._capacity():
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.wake()
+
+    def release(self, elapsed):
+        with self._lock:
+            if elapsed is not None:
+                self._samples += 1
+                self.service_time += max(0.2, 1.0 / self._samples) * (elapsed - self.service_time)
+            self.in_flight -= 1
+            self._dispatch()
+            self._publish()
+
+    def on_throttled(self):
+        """Multiplicative decrease after an upstream 429."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._decreased_at < self.cooldown:
+                return
+            self._decreased_at = now
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._publish()
+        metrics.increment("admission_limit_decreases_total", tool=self.name)
+
+    def on_success(self):
+        """Additive increase after a successful upstream call."""
+        if self.limit >= self.max_limit:
+            return
+        with self._lock:
+            capacity = self._capacity()
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            if self._capacity() != capacity:
+                self._dispatch()
+                self._publish()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self._capacity(),
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "service_time_ms": round(self.service_time * 1000, 1),
+                "estimated_wait_ms": round(self._estimated_wait() * 1000, 1),
+            }
+
+
+class AdmissionController:
+    """Per-tool concurrency limiters plus per-client rate limits."""
+
+    def __init__(self, concurrency, max_queue=256, client_rate=0.0, client_burst=1,
+                 max_clients=10000, decrease=0.5, cooldown=1.0):
+        self.limiters = {
+            tool: ConcurrencyLimiter(tool, limit, max_queue=max_queue, decrease=decrease, cooldown=cooldown)
+            for tool, limit in concurrency.items() if limit > 0
+        }
+        self.client_rate = client_rate
+        self.client_burst = max(1, client_burst)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, tool, deadline=None):
+        """Return a Slot for `tool` (a no-op Slot for unlimited tools); may raise Overloaded.
+
+        Waits until `deadline`, by default the current request's deadline.
+        """
+        limiter = self.limiters.get(tool)
+        if limiter is None:
+            return Slot(None)
+        return limiter.acquire(deadline if deadline is not None else current_deadline())
+
+    async def aacquire(self, tool, deadline=None):
+        limiter = self.limiters.get(tool)
+        if limiter is None:
+            return Slot(None)
+        return await limiter.aacquire(deadline if deadline is not None else current_deadline())
+
+    def check_client(self, key, cost=1):
+        """Take `cost` requests from the client's bucket; raises RateLimited when it is short.
+
+        A batch costs one request per query, capped at the burst so that a
+        large batch is still admitted when the bucket is full.
+        """
+        cost = min(cost, self.client_burst)
+        if self.client_rate <= 0 or key is None:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.client_rate, self.client_burst)
+                # Least recently seen clients are forgotten (their bucket was refilling anyway)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+
+        if not bucket.try_acquire(cost):
+            metrics.increment("client_rate_limited_total")
+            raise RateLimited("Rate limit exceeded, slow down", bucket.wait_time(cost), "client_rate")
+
+    def on_upstream_response(self, service, status_code):
+        """Feed an upstream response status into the AIMD limit of the matching tool."""
+        limiter = self.limiters.get(UPSTREAM_TOOLS.get(service))
+        if status_code == 429:
+            metrics.increment("upstream_throttled_total", service=service)
+            if limiter is not None:
+                limiter.on_throttled()
+        elif status_code < 400 and limiter is not None:
+            limiter.on_success()
+
+    def stats(self):
+        return {
+            "tools": {tool: limiter.stats() for tool, limiter in self.limiters.items()},
+            "shed": metrics.snapshot().get("admission_shed_total", []),
+            "client_rate_limited": metrics.get_counter("client_rate_limited_total"),
+            "tracked_clients": len(self._buckets),
+        }
+
+
+def client_key(headers, remote_addr):
+    """Identify a client by its API key header, else by its IP address.
+
+    Only keys listed in ADMISSION_API_KEYS count; any other key falls back
+    to the IP, since a client could otherwise send a new key per request
+    and get a fresh bucket each time. X-Forwarded-For is only honoured with
+    ADMISSION_TRUST_FORWARDED, i.e. behind a proxy that sets it.
+    """
+    api_key = headers.get("X-API-Key")
+    if not api_key:
+        authorization = headers.get("Authorization", "")
+        if authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+    if api_key and api_key in Config.ADMISSION_API_KEYS:
+        return "key:" + api_key
+
+    if Config.ADMISSION_TRUST_FORWARDED:
+        forwarded = headers.get("X-Forwarded-For")
+        if forwarded:
+            return "ip:" + forwarded.split(",")[0].strip()
+    return "ip:" + remote_addr if remote_addr else None
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission():
+    """Return the process-wide admission controller."""
+    global _admission
+
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = AdmissionController(
+                    Config.ADMISSION_CONCURRENCY if Config.ADMISSION_ENABLED else {},
+                    max_queue=Config.ADMISSION_MAX_QUEUE,
+                    client_rate=Config.CLIENT_RATE_LIMIT_PER_MINUTE / 60.0,
+                    client_burst=Config.CLIENT_RATE_LIMIT_BURST,
+                    decrease=Config.ADMISSION_AIMD_DECREASE,
+                    cooldown=Config.ADMISSION_AIMD_COOLDOWN,
+                )
+
+    return _admission
@@ -0,0 +1,126 @@
+"""Bulk execution of queries for /query/batch.
+
+Each query is routed with the normal routing tiers, then its tool call is
+queued on that tool's pool, so weather lookups, math and LLM calls from one
+batch run concurrently with each other. Concurrency is capped per tool
+(Config.QUERY_BATCH_CONCURRENCY) across all batches in the process, so a
+large batch cannot exhaust the upstream quota on its own. Results are
+yielded as they complete, tagged with the index of their query.
+"""
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import Config
+from app.utils import metrics
+
+
+_executors = {}
+_semaphores = {}
+_lock = threading.Lock()
+
+
+def _executor(pool):
+    with _lock:
+        if pool not in _executors:
+            _executors[pool] = ThreadPoolExecutor(
+                max_workers=Config.QUERY_BATCH_CONCURRENCY[pool],
+                thread_name_prefix=f"batch-{pool}",
+            )
+        return _executors[pool]
+
+
+def _semaphore(pool):
+    if pool not in _semaphores:
+        _semaphores[pool] = asyncio.Semaphore(Config.QUERY_BATCH_CONCURRENCY[pool])
+    return _semaphores[pool]
+
+
+def validate_queries(data):
+    """Return (queries, error) for a /query/batch request body."""
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return None, 'queries must be a non-empty list of strings'
+    if not all(isinstance(query, str) for query in queries):
+        return None, 'queries must be a non-empty list of strings'
+    if len(queries) > Config.QUERY_BATCH_MAX_QUERIES:
+        return None, f'At most {Config.QUERY_BATCH_MAX_QUERIES} queries per batch'
+    return queries, None
+
+
+def _result(index, query, tool_used, result, routing_tier):
+    metrics.increment("batch_queries_total", tool=tool_used)
+    return {
+        'index': index,
+        'query': query,
+        'tool_used': tool_used,
+        'result': result,
+        'routing_tier': routing_tier
+    }
+
+
+def _error(index, query, error):
+    return _result(index, query, 'error', f'Error processing query: {str(error)}', None)
+
+
+def run_batch(queries, route, tools):
+    """Yield result dicts as queries complete.
+
+    `route(query)` returns (tool_key, tool_args, routing_tier) and `tools`
+    maps tool keys to tool instances. Routing and tool calls run in the
+    caller's context, so they keep its request deadline and trace. Closing
+    the generator cancels the queries that have not started yet.
+    """
+    results = queue.Queue()
+    futures = []
+    cancelled = threading.Event()
+
+    def execute(index, query, tool_key, tool_args, tier):
+        try:
+            results.put(_result(index, query, tool_key, tools[tool_key]._run(query, **tool_args), tier))
+        except Exception as e:
+            results.put(_error(index, query, e))
+
+    def route_and_submit(index, query):
+        try:
+            tool_key, tool_args, tier = route(query)
+        except Exception as e:
+            results.put(_error(index, query, e))
+            return
+        if not cancelled.is_set():
+            futures.append(_executor(tool_key).submit(
+                contextvars.copy_context().run, execute, index, query, tool_key, tool_args, tier))
+
+    for index, query in enumerate(queries):
+        futures.append(_executor("routing").submit(contextvars.copy_context().run, route_and_submit, index, query))
+
+    try:
+        for _ in queries:
+            yield results.get()
+    finally:
+        cancelled.set()
+        for future in futures:
+            future.cancel()
+
+
+async def arun_batch(queries, aroute, tools):
+    """Asynchronous version of run_batch; `aroute` is a coroutine function."""
+    async def run_one(index, query):
+        try:
+            async with _semaphore("routing"):
+                tool_key, tool_args, tier = await aroute(query)
+            async with _semaphore(tool_key):
+                result = await tools[tool_key]._arun(query, **tool_args)
+            return _result(index, query, tool_key, result, tier)
+        except Exception as e:
+            return _error(index, query, e)
+
+    tasks = [asyncio.ensure_future(run_one(index, query)) for index, query in enumerate(queries)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
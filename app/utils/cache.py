@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import Config
+from app.utils import metrics
+from app.utils.coalesce import SingleFlight
+
+
+class InMemoryBackend:
+    """Bounded in-process store with per-entry expiry and LRU eviction."""
+
+    # Operations never block on I/O, so async callers can use them directly
+    blocking = False
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value) for a key."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        """Store a value; ttl is in seconds, None means no expiry."""
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment("cache_evictions_total", backend="memory")
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Store backed by any Redis-protocol server (see docker-compose.yml).
+
+    Bounded memory is left to the server's own policy, e.g.
+    ``maxmemory-policy allkeys-lru``.
+    """
+
+    blocking = True
+
+    def __init__(self, url, prefix="ai-agent:cache:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        raw = json.dumps(value)
+        if ttl is None:
+            self.client.set(self.prefix + key, raw)
+        else:
+            self.client.set(self.prefix + key, raw, ex=max(1, int(ttl)))
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+class ResponseCache:
+    """Content-addressed cache for tool results.
+
+    Entries are keyed on a hash of the tool name and its normalized input
+    (resolved city, canonical expression, model + prompt) and expire after
+    the tool's TTL.
+    """
+
+    def __init__(self, backend, ttls=None):
+        self.backend = backend
+        self.ttls = ttls or {}
+        self._flights = {}
+
+    def _flight(self, tool):
+        # One SingleFlight per tool so coalescing counters are labelled by tool
+        flight = self._flights.get(tool)
+        if flight is None:
+            flight = self._flights.setdefault(tool, SingleFlight(tool))
+        return flight
+
+    @staticmethod
+    def make_key(tool, normalized_input):
+        digest = hashlib.sha256(f"{tool}\x00{normalized_input}".encode("utf-8")).hexdigest()
+        return f"{tool}:{digest}"
+
+    def lookup(self, tool, normalized_input):
+        """Return (found, value) for the input and count the hit or miss."""
+        try:
+            found, value = self.backend.get(self.make_key(tool, normalized_input))
+        except Exception as e:
+            print(f"Cache read failed: {e}")
+            found, value = False, None
+
+        metrics.increment("cache_requests_total", tool=tool, result="hit" if found else "miss")
+        return found, value
+
+    def store(self, tool, normalized_input, value):
+        """Store a result under the tool's TTL."""
+        try:
+            self.backend.set(self.make_key(tool, normalized_input), value, self.ttls.get(tool))
+        except Exception as e:
+            print(f"Cache write failed: {e}")
+
+    def get_or_compute(self, tool, normalized_input, compute):
+        """Return the cached result for the input, calling compute() on a miss.
+
+        Concurrent misses for the same input share a single compute() call.
+        Exceptions raised by compute() propagate and nothing is cached.
+        """
+        found, value = self.lookup(tool, normalized_input)
+        if found:
+            return value
+
+        def compute_and_store():
+            result = compute()
+            self.store(tool, normalized_input, result)
+            return result
+
+        return self._flight(tool).do(self.make_key(tool, normalized_input), compute_and_store)
+
+    async def alookup(self, tool, normalized_input):
+        """Asynchronous version of lookup."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.lookup, tool, normalized_input)
+        return self.lookup(tool, normalized_input)
+
+    async def astore(self, tool, normalized_input, value):
+        """Asynchronous version of store."""
+        if self.backend.blocking:
+            await asyncio.to_thread(self.store, tool, normalized_input, value)
+        else:
+            self.store(tool, normalized_input, value)
+
+    async def aget_or_compute(self, tool, normalized_input, compute):
+        """Asynchronous version of get_or_compute; compute() returns an awaitable."""
+        found, value = await self.alookup(tool, normalized_input)
+        if found:
+            return value
+
+        async def compute_and_store():
+            result = await compute()
+            await self.astore(tool, normalized_input, result)
+            return result
+
+        return await self._flight(tool).ado(self.make_key(tool, normalized_input), compute_and_store)
+
+    def stats(self):
+        """Return hit/miss counters per tool and the current entry count."""
+        tools = sorted(set(self.ttls) | {"weather", "math", "llm"})
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "tools": {
+                tool: {
+                    "hits": metrics.get_counter("cache_requests_total", tool=tool, result="hit"),
+                    "misses": metrics.get_counter("cache_requests_total", tool=tool, result="miss"),
+                }
+                for tool in tools
+            },
+        }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, creating it from Config on first use."""
+    global _response_cache
+
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                if Config.CACHE_BACKEND == "redis":
+                    backend = RedisBackend(Config.REDIS_URL)
+                else:
+                    backend = InMemoryBackend(Config.CACHE_MAX_ENTRIES)
+                _response_cache = ResponseCache(backend, Config.CACHE_TTLS)
+
+    return _response_cache
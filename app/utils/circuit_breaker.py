@@ -0,0 +1,271 @@
+"""Circuit breakers for the Groq and OpenWeatherMap upstreams.
+
+The shared HTTP clients (app/utils/clients.py) report the outcome and
+latency of every upstream call to the upstream's breaker. A breaker keeps
+per-second counts over a rolling window and opens when, with enough calls
+in the window, too many of them failed (transport errors, timeouts, 5xx,
+429) or were slow.
+
+While a breaker is open, callers check allow() before calling out and
+use their local path instead: the keyword router for tool selection, the
+gazetteer and regexes for city extraction, cached answers and stale
+weather observations. A degraded response then takes milliseconds rather
+than the seconds a failing upstream call (and its retries) would.
+
+A background thread probes an open upstream every BREAKER_OPEN_SECONDS
+with a cheap request. Once a probe succeeds the breaker is half-open and
+lets BREAKER_HALF_OPEN_CALLS real calls through; it closes when they all
+succeed and opens again on the first failure.
+"""
+import threading
+import time
+from collections import deque
+
+from app.config import Config
+from app.utils import metrics
+
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Gauge values for circuit_breaker_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+UPSTREAM_NAMES = {
+    "groq": "Groq",
+    "openweathermap": "OpenWeatherMap",
+}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, upstream):
+        super().__init__(f"{UPSTREAM_NAMES.get(upstream, upstream)} is temporarily unavailable")
+        self.upstream = upstream
+
+
+def is_failure(status_code):
+    """Whether an upstream status counts against its breaker (other 4xx are the caller's fault)."""
+    return status_code >= 500 or status_code == 429
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a rolling window of per-second counts."""
+
+    def __init__(self, name, enabled=True, window=30, min_calls=20, error_rate=0.5,
+                 slow_call=10.0, slow_rate=0.8, open_seconds=10.0, half_open_calls=3, probe=None):
+        self.name = name
+        self.enabled = enabled
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.probe = probe
+        self.state = CLOSED
+        self.changed_at = time.monotonic()
+        # [second, calls, failures, slow calls], oldest first
+        self._buckets = deque()
+        self._permits = 0
+        self._successes = 0
+        self._prober = None
+        self._lock = threading.Lock()
+        metrics.set_gauge("circuit_breaker_state", STATE_VALUES[CLOSED], upstream=name)
+
+    def allow(self):
+        """Whether a call may go out now; takes one of the trial calls when half-open."""
+        if self.state == CLOSED or not self.enabled:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._permits > 0:
+                self._permits -= 1
+                return True
+        metrics.increment("circuit_breaker_rejected_total", upstream=self.name)
+        return False
+
+    def check(self):
+        """Raise CircuitOpen unless a call may go out now."""
+        if not self.allow():
+            raise CircuitOpen(self.name)
+
+    def record(self, elapsed, failed=False):
+        """Count one finished upstream call (`elapsed` seconds until its response started)."""
+        if not self.enabled:
+            return
+        slow = elapsed >= self.slow_call
+        with self._lock:
+            if self.state == OPEN:
+                # Stragglers sent before the breaker opened, or probes
+                return
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN, "failed trial call")
+                else:
+                    self._successes += 1
+                    if self._successes >= self.half_open_calls:
+                        self._transition(CLOSED, "trial calls succeeded")
+                return
+
+            second = int(time.monotonic())
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+            self._evaluate(second)
+
+    def record_status(self, status_code, elapsed):
+        self.record(elapsed, is_failure(status_code))
+
+    def _counts(self, now):
+        """(calls, failures, slow calls) within the window (lock held)."""
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        calls = sum(bucket[1] for bucket in self._buckets)
+        failures = sum(bucket[2] for bucket in self._buckets)
+        slow = sum(bucket[3] for bucket in self._buckets)
+        return calls, failures, slow
+
+    def _evaluate(self, now):
+        calls, failures, slow = self._counts(now)
+        if calls < self.min_calls:
+            return
+        if failures >= self.error_rate * calls:
+            self._transition(OPEN, f"{failures}/{calls} calls failed")
+        elif slow >= self.slow_rate * calls:
+            self._transition(OPEN, f"{slow}/{calls} calls slower than {self.slow_call:g}s")
+
+    def _transition(self, state, reason):
+        """Move to `state` (lock held)."""
+        self.state = state
+        self.changed_at = time.monotonic()
+        self._buckets.clear()
+        self._permits = self.half_open_calls if state == HALF_OPEN else 0
+        self._successes = 0
+        metrics.set_gauge("circuit_breaker_state", STATE_VALUES[state], upstream=self.name)
+        metrics.increment("circuit_breaker_transitions_total", upstream=self.name, state=state)
+        print(f"Circuit breaker for {self.name} is now {state}: {reason}")
+
+        if state == OPEN and self._prober is None:
+            self._prober = threading.Thread(target=self._run_prober, name=f"breaker-{self.name}", daemon=True)
+            self._prober.start()
+
+    def _run_prober(self):
+        """Probe the upstream until the breaker closes again."""
+        while True:
+            time.sleep(self.open_seconds)
+            with self._lock:
+                if self.state == CLOSED:
+                    self._prober = None
+                    return
+                if self.state == HALF_OPEN:
+                    # Trial calls were handed out but not all came back (e.g. the
+                    # callers were served from cache); hand out a new round
+                    self._permits = self.half_open_calls
+                    continue
+
+            if self._probe_succeeded():
+                with self._lock:
+                    if self.state == OPEN:
+                        self._transition(HALF_OPEN, "probe succeeded")
+
+    def _probe_succeeded(self):
+        """Run the probe; without one (or when it is skipped), trial calls decide."""
+        if self.probe is None:
+            return True
+        try:
+            result = self.probe()
+        except Exception as e:
+            print(f"Circuit breaker probe for {self.name} failed: {e}")
+            result = False
+        metrics.increment("circuit_breaker_probes_total", upstream=self.name,
+                          result="skipped" if result is None else "success" if result else "failure")
+        return result is not False
+
+    def stats(self):
+        with self._lock:
+            calls, failures, slow = self._counts(int(time.monotonic()))
+            return {
+                "state": self.state,
+                "since_seconds": round(time.monotonic() - self.changed_at, 1),
+                "window_calls": calls,
+                "window_failures": failures,
+                "window_slow_calls": slow,
+            }
+
+
+def _probe_groq():
+    """List the models: cheap, and fails when the API does."""
+    from app.utils.clients import get_http_client
+
+    api_key = Config.GROQ_API_KEY
+    if not api_key or api_key == "your_groq_api_key_here":
+        return None
+    base_url = (Config.GROQ_BASE_URL or "https://api.groq.com").rstrip("/")
+    response = get_http_client().get(f"{base_url}/openai/v1/models",
+                                     headers={"Authorization": f"Bearer {api_key}"},
+                                     timeout=Config.HTTP_CONNECT_TIMEOUT)
+    return not is_failure(response.status_code)
+
+
+def _probe_openweathermap():
+    """Fetch one city's weather, if the quota bucket can spare a call."""
+    from app.utils.clients import get_http_client
+    from app.utils.weather_cache import get_weather_cache
+
+    api_key = Config.OPENWEATHER_API_KEY
+    if not api_key or api_key == "your_openweather_api_key_here":
+        return None
+    if not get_weather_cache().bucket.try_acquire():
+        return None
+    response = get_http_client().get(f"{Config.OPENWEATHER_BASE_URL}/weather",
+                                     params={"q": Config.BREAKER_PROBE_CITY, "appid": api_key},
+                                     timeout=Config.HTTP_CONNECT_TIMEOUT)
+    return not is_failure(response.status_code)
+
+
+PROBES = {
+    "groq": _probe_groq,
+    "openweathermap": _probe_openweathermap,
+}
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream):
+    """Return the process-wide breaker for an upstream ("groq" or "openweathermap")."""
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(upstream)
+            if breaker is None:
+                breaker = _breakers[upstream] = CircuitBreaker(
+                    upstream,
+                    enabled=Config.BREAKER_ENABLED,
+                    window=Config.BREAKER_WINDOW,
+                    min_calls=Config.BREAKER_MIN_CALLS,
+                    error_rate=Config.BREAKER_ERROR_RATE,
+                    slow_call=Config.BREAKER_SLOW_CALL_MS.get(upstream, Config.HTTP_TIMEOUT * 1000) / 1000,
+                    slow_rate=Config.BREAKER_SLOW_RATE,
+                    open_seconds=Config.BREAKER_OPEN_SECONDS,
+                    half_open_calls=Config.BREAKER_HALF_OPEN_CALLS,
+                    probe=PROBES.get(upstream),
+                )
+    return breaker
+
+
+def stats():
+    return {upstream: get_breaker(upstream).stats() for upstream in UPSTREAM_NAMES}
+
+
+def degraded():
+    """Whether any upstream breaker is not closed."""
+    return any(get_breaker(upstream).state != CLOSED for upstream in UPSTREAM_NAMES)
@@ -0,0 +1,399 @@
+"""Process-wide registry of long-lived, connection-pooled upstream clients.
+
+Every tool and the tool selector get their Groq, ChatGroq and HTTP clients
+from here instead of constructing them per call, so TCP/TLS handshakes and
+client setup are paid once per connection rather than once per request.
+Groq requests are spread over the configured API keys and endpoints by
+the LLM pool (app/utils/llm_pool.py) at the transport level.
+
+Async clients are bound to the event loop they are first used on; the ASGI
+app runs a single loop per process, so sharing them is safe there.
+"""
+import asyncio
+import importlib.util
+import threading
+import time
+
+import httpx
+
+from app.config import Config
+from app.utils import deadline, metrics
+from app.utils.admission import get_admission
+from app.utils.circuit_breaker import get_breaker
+from app.utils.llm_pool import get_llm_pool, request_model
+
+
+# HTTP status codes worth retrying with backoff
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_clients = {}
+# Re-entrant: SDK client factories fetch the shared httpx clients
+_lock = threading.RLock()
+
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def http2_available():
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])."""
+    return Config.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=Config.HTTP_POOL_SIZE,
+        max_keepalive_connections=Config.HTTP_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+
+
+def _upstream_of(request):
+    # Groq serves its OpenAI-compatible API under /openai/v1
+    return "groq" if "/openai/" in request.url.path else "openweathermap"
+
+
+def _observe_response(response):
+    """Report every upstream status, retries included, to admission control (AIMD)."""
+    get_admission().on_upstream_response(_upstream_of(response.request), response.status_code)
+
+
+async def _aobserve_response(response):
+    _observe_response(response)
+
+
+class _BreakerTransport(httpx.BaseTransport):
+    """Reports each upstream call's outcome and latency to the upstream's circuit breaker.
+
+    Latency is measured until the response headers arrive, so streamed
+    answers are judged by their time to first byte.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        breaker = get_breaker(_upstream_of(request))
+        started = time.monotonic()
+        try:
+            response = self._transport.handle_request(request)
+        except httpx.TransportError:
+            breaker.record(time.monotonic() - started, failed=True)
+            raise
+        breaker.record_status(response.status_code, time.monotonic() - started)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class _AsyncBreakerTransport(httpx.AsyncBaseTransport):
+    """Asynchronous version of _BreakerTransport."""
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        breaker = get_breaker(_upstream_of(request))
+        started = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError:
+            breaker.record(time.monotonic() - started, failed=True)
+            raise
+        breaker.record_status(response.status_code, time.monotonic() - started)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class _PoolTransport(httpx.BaseTransport):
+    """Sends each Groq request to the upstream (key and endpoint) the LLM pool picks.
+
+    A 429 or a failed connection is retried at once on another upstream
+    that is not throttled, before the SDK's own retry policy applies.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        pool = get_llm_pool()
+        if not pool.upstreams or _upstream_of(request) != "groq":
+            return self._transport.handle_request(request)
+
+        model = request_model(request)
+        # Only buffered bodies (all SDK calls) can be sent twice
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        tried = []
+        while True:
+            upstream = pool.acquire(model, exclude=tried)
+            tried.append(upstream)
+            started = time.monotonic()
+            try:
+                response = self._transport.handle_request(upstream.prepare(request))
+            except httpx.TransportError as e:
+                pool.release(upstream, model, time.monotonic() - started)
+                if not (isinstance(e, httpx.ConnectError) and replayable and pool.can_fail_over(model, tried)):
+                    raise
+                metrics.increment("llm_pool_failovers_total", upstream=upstream.name, reason="connect")
+                continue
+            pool.release(upstream, model, time.monotonic() - started, response.status_code, response.headers)
+            if response.status_code != 429 or not (replayable and pool.can_fail_over(model, tried)):
+                return response
+            response.close()
+            metrics.increment("llm_pool_failovers_total", upstream=upstream.name, reason="throttled")
+
+    def close(self):
+        self._transport.close()
+
+
+class _AsyncPoolTransport(httpx.AsyncBaseTransport):
+    """Asynchronous version of _PoolTransport."""
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        pool = get_llm_pool()
+        if not pool.upstreams or _upstream_of(request) != "groq":
+            return await self._transport.handle_async_request(request)
+
+        model = request_model(request)
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        tried = []
+        while True:
+            upstream = pool.acquire(model, exclude=tried)
+            tried.append(upstream)
+            started = time.monotonic()
+            try:
+                response = await self._transport.handle_async_request(upstream.prepare(request))
+            except httpx.TransportError as e:
+                pool.release(upstream, model, time.monotonic() - started)
+                if not (isinstance(e, httpx.ConnectError) and replayable and pool.can_fail_over(model, tried)):
+                    raise
+                metrics.increment("llm_pool_failovers_total", upstream=upstream.name, reason="connect")
+                continue
+            pool.release(upstream, model, time.monotonic() - started, response.status_code, response.headers)
+            if response.status_code != 429 or not (replayable and pool.can_fail_over(model, tried)):
+                return response
+            await response.aclose()
+            metrics.increment("llm_pool_failovers_total", upstream=upstream.name, reason="throttled")
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def get_http_client():
+    """Shared synchronous httpx client (OpenWeatherMap, Groq, ChatGroq)."""
+    return _get_or_create("http", lambda: httpx.Client(
+        limits=_limits(),
+        timeout=_timeout(),
+        http2=http2_available(),
+        event_hooks={"response": [_observe_response]},
+        # Transport-level retries cover failed connection attempts only
+        transport=_BreakerTransport(_PoolTransport(
+            httpx.HTTPTransport(retries=Config.HTTP_RETRIES, http2=http2_available())
+        )),
+    ))
+
+
+def get_async_http_client():
+    """Shared asynchronous httpx client."""
+    return _get_or_create("async_http", lambda: httpx.AsyncClient(
+        limits=_limits(),
+        timeout=_timeout(),
+        http2=http2_available(),
+        event_hooks={"response": [_aobserve_response]},
+        transport=_AsyncBreakerTransport(_AsyncPoolTransport(
+            httpx.AsyncHTTPTransport(retries=Config.HTTP_RETRIES, http2=http2_available())
+        )),
+    ))
+
+
+def _retries(max_retries):
+    return Config.HTTP_RETRIES if max_retries is None else max_retries
+
+
+def _retries_suffix(max_retries):
+    # The default clients keep their plain names
+    return "" if max_retries is None or max_retries == Config.HTTP_RETRIES else f":retries={max_retries}"
+
+
+def get_groq_client(max_retries=None):
+    """Shared Groq SDK client; the SDK applies its own retry/backoff policy.
+
+    `max_retries` (default HTTP_RETRIES) selects a variant sharing the same
+    connection pool, e.g. one without retries for calls near their deadline.
+    """
+    from groq import Groq
+
+    return _get_or_create("groq" + _retries_suffix(max_retries), lambda: Groq(
+        api_key=Config.GROQ_API_KEY,
+        base_url=Config.GROQ_BASE_URL,
+        http_client=get_http_client(),
+        max_retries=_retries(max_retries),
+        timeout=_timeout(),
+    ))
+
+
+def get_async_groq_client(max_retries=None):
+    """Shared AsyncGroq SDK client."""
+    from groq import AsyncGroq
+
+    return _get_or_create("async_groq" + _retries_suffix(max_retries), lambda: AsyncGroq(
+        api_key=Config.GROQ_API_KEY,
+        base_url=Config.GROQ_BASE_URL,
+        http_client=get_async_http_client(),
+        max_retries=_retries(max_retries),
+        timeout=_timeout(),
+    ))
+
+
+def get_chat_groq(model=None, max_retries=None):
+    """Shared ChatGroq for a model, usable from both sync and async code."""
+    from langchain_groq import ChatGroq
+
+    model = model or Config.DEFAULT_GROQ_MODEL
+    return _get_or_create(f"chat_groq:{model}" + _retries_suffix(max_retries), lambda: ChatGroq(
+        temperature=0,
+        groq_api_key=Config.GROQ_API_KEY,
+        groq_api_base=Config.GROQ_BASE_URL,
+        model_name=model,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        max_retries=_retries(max_retries),
+        request_timeout=Config.HTTP_TIMEOUT,
+    ))
+
+
+def get_webhook_client():
+    """Shared httpx client for job callbacks; kept apart from the upstream clients and their breakers.
+
+    Proxy settings from the environment are ignored: a proxy would resolve
+    the callback host itself, bypassing the address jobs checked.
+    """
+    return _get_or_create("webhook", lambda: httpx.Client(
+        limits=_limits(),
+        timeout=_timeout(),
+        trust_env=False,
+        transport=httpx.HTTPTransport(retries=Config.HTTP_RETRIES),
+    ))
+
+
+def _backoff_delay(attempt, response=None):
+    """Exponential backoff, honouring a Retry-After header when present."""
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), Config.HTTP_BACKOFF_MAX)
+            except ValueError:
+                pass
+    return min(Config.HTTP_BACKOFF_BASE * (2 ** attempt), Config.HTTP_BACKOFF_MAX)
+
+
+def _can_retry(attempt, delay, stage):
+    """Whether another attempt fits: retries left and the backoff ends before the deadline."""
+    if attempt >= (Config.HTTP_RETRIES if stage is None else deadline.retries(stage)):
+        return False
+    left = deadline.remaining()
+    return left is None or delay + Config.STAGE_MIN_BUDGET < left
+
+
+def _attempt_timeout(stage):
+    """Per-attempt timeout: the stage's share of the request deadline, else the client default."""
+    return deadline.timeout(stage) if stage is not None else httpx.USE_CLIENT_DEFAULT
+
+
+def get_with_retries(url, params=None, stage=None):
+    """GET through the shared client, retrying transient failures with backoff.
+
+    With a `stage` (a STAGE_TIMEOUTS key), each attempt is limited to the
+    time left for it and no retry is started that could not finish in time.
+    """
+    client = get_http_client()
+    for attempt in range(Config.HTTP_RETRIES + 1):
+        try:
+            response = client.get(url, params=params, timeout=_attempt_timeout(stage))
+        except httpx.TransportError:
+            delay = _backoff_delay(attempt)
+            if not _can_retry(attempt, delay, stage):
+                raise
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        delay = _backoff_delay(attempt, response)
+        if not _can_retry(attempt, delay, stage):
+            return response
+        time.sleep(delay)
+
+
+def post_with_retries(client, url, content, headers=None, retries=None, extensions=None):
+    """POST through `client`, retrying transient failures with backoff; returns the last response.
+
+    Raises httpx.TransportError when the last attempt fails to connect.
+    """
+    retries = Config.HTTP_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            response = client.post(url, content=content, headers=headers, extensions=extensions)
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+            return response
+        time.sleep(_backoff_delay(attempt, response))
+
+
+async def aget_with_retries(url, params=None, stage=None):
+    """Asynchronous version of get_with_retries."""
+    client = get_async_http_client()
+    for attempt in range(Config.HTTP_RETRIES + 1):
+        try:
+            response = await client.get(url, params=params, timeout=_attempt_timeout(stage))
+        except httpx.TransportError:
+            delay = _backoff_delay(attempt)
+            if not _can_retry(attempt, delay, stage):
+                raise
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response
+        delay = _backoff_delay(attempt, response)
+        if not _can_retry(attempt, delay, stage):
+            return response
+        await asyncio.sleep(delay)
+
+
+def reset_clients():
+    """Drop all clients, e.g. in a worker after fork so sockets are not shared."""
+    with _lock:
+        _clients.clear()
+
+
+def close_clients():
+    """Close the pooled synchronous connections and drop all clients (worker shutdown)."""
+    with _lock:
+        for client in _clients.values():
+            if isinstance(client, httpx.Client):
+                client.close()
+        _clients.clear()
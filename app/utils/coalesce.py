@@ -0,0 +1,168 @@
+"""Request coalescing for upstream calls.
+
+SingleFlight lets concurrent callers with the same key share one in-flight
+call instead of each hitting the upstream. MicroBatcher groups distinct
+items that arrive within a short window into one batched call.
+"""
+import asyncio
+import threading
+
+from app.utils import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls by key; callers share the leader's result."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn()'s result, joining an identical in-flight call if there is one."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.increment("upstream_calls_total", call=self.name, outcome="coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.increment("upstream_calls_total", call=self.name, outcome="issued")
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, fn):
+        """Asynchronous version of do; fn() returns an awaitable."""
+        task = self._tasks.get(key)
+        if task is not None:
+            metrics.increment("upstream_calls_total", call=self.name, outcome="coalesced")
+        else:
+            metrics.increment("upstream_calls_total", call=self.name, outcome="issued")
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+        # Shielded so one caller going away does not cancel the shared call
+        return await asyncio.shield(task)
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Group items submitted within `window` seconds into one run_batch() call.
+
+    run_batch receives the list of items and returns a list of results in the
+    same order. The first caller of a batch waits out the window (or until
+    `max_size` items arrive) and runs it on behalf of everyone.
+    """
+
+    def __init__(self, name, run_batch, window, max_size=16):
+        self.name = name
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                self._pending = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+
+            metrics.increment("batches_total", batcher=self.name)
+            metrics.increment("batched_items_total", amount=len(batch.items), batcher=self.name)
+            try:
+                batch.results = self.run_batch(batch.items)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+
+class AsyncMicroBatcher:
+    """Asynchronous version of MicroBatcher; run_batch is a coroutine function."""
+
+    def __init__(self, name, run_batch, window, max_size=16):
+        self.name = name
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self._pending = None
+
+    async def _flush(self, items, future):
+        metrics.increment("batches_total", batcher=self.name)
+        metrics.increment("batched_items_total", amount=len(items), batcher=self.name)
+        try:
+            future.set_result(await self.run_batch(items))
+        except Exception as e:
+            future.set_exception(e)
+
+    async def _flush_after_window(self, batch):
+        items, future = batch
+        await asyncio.sleep(self.window)
+        if self._pending is batch:
+            self._pending = None
+            await self._flush(items, future)
+
+    async def submit(self, item):
+        if self._pending is None:
+            self._pending = ([], asyncio.get_running_loop().create_future())
+            asyncio.ensure_future(self._flush_after_window(self._pending))
+
+        items, future = self._pending
+        index = len(items)
+        items.append(item)
+        if len(items) >= self.max_size:
+            self._pending = None
+            asyncio.ensure_future(self._flush(items, future))
+
+        results = await asyncio.shield(future)
+        return results[index]
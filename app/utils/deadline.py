@@ -0,0 +1,122 @@
+"""End-to-end request deadlines.
+
+Each query gets a deadline when it arrives: `timeout` seconds from the
+X-Request-Timeout header or the `timeout` field of the JSON body, else
+REQUEST_TIMEOUT, capped at REQUEST_TIMEOUT_MAX. The deadline lives in a
+context variable, so every stage (admission, tool selection, city
+extraction, tool execution) and every upstream call can ask how much time
+is left without passing it through each signature:
+
+    timeout = deadline.timeout("select")   # for one upstream call
+    retries = deadline.retries("select")   # and its retries
+
+A stage gets what is left of the request, capped by its own budget in
+STAGE_TIMEOUTS. When too little is left, stages with a local alternative
+(keyword routing, regex city extraction) use it instead of calling out.
+
+Context variables follow asyncio tasks, but not new threads: run code on
+another thread through contextvars.copy_context().run to keep the deadline.
+"""
+import contextvars
+import math
+import time
+
+from app.config import Config
+from app.utils import metrics
+
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage is reached with no time left before the request deadline."""
+
+    def __init__(self, stage):
+        super().__init__(f"Request deadline exceeded before {stage}")
+        self.stage = stage
+
+
+def parse_timeout(headers, body=None):
+    """Seconds allowed for a request, from its X-Request-Timeout header or body `timeout`."""
+    value = headers.get("X-Request-Timeout")
+    if value is None and isinstance(body, dict):
+        value = body.get("timeout")
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return Config.REQUEST_TIMEOUT
+    if not math.isfinite(seconds) or seconds <= 0:
+        return Config.REQUEST_TIMEOUT
+    return min(seconds, Config.REQUEST_TIMEOUT_MAX)
+
+
+def start(headers, body=None):
+    """Set the deadline of the request being handled; returns a token for reset()."""
+    return _deadline.set(time.monotonic() + parse_timeout(headers, body))
+
+
+def reset(token):
+    if token is not None:
+        _deadline.reset(token)
+
+
+class scope:
+    """Context manager running a block under a given deadline (a time.monotonic() value)."""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self._token = None
+
+    def __enter__(self):
+        self._token = _deadline.set(self.deadline)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        _deadline.reset(self._token)
+        return False
+
+
+def current():
+    """The current request's deadline as a time.monotonic() value, or None."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left before the deadline (may be negative), or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def budget(stage):
+    """Seconds `stage` may use: the time left, capped by its STAGE_TIMEOUTS entry."""
+    cap = Config.STAGE_TIMEOUTS.get(stage, Config.HTTP_TIMEOUT)
+    left = remaining()
+    return cap if left is None else min(cap, left)
+
+
+def allows(stage):
+    """Whether enough time is left to start `stage`; counts a fallback if not."""
+    if budget(stage) >= Config.STAGE_MIN_BUDGET:
+        return True
+    metrics.increment("deadline_fallbacks_total", stage=stage)
+    return False
+
+
+def retries(stage):
+    """Upstream retries for `stage`: none once the deadline leaves less than the stage's full budget.
+
+    A retry after a timed-out attempt could not finish in time anyway.
+    """
+    left = remaining()
+    if left is None or left >= Config.STAGE_TIMEOUTS.get(stage, Config.HTTP_TIMEOUT):
+        return Config.HTTP_RETRIES
+    return 0
+
+
+def timeout(stage):
+    """Timeout for one upstream call in `stage`; raises DeadlineExceeded if no time is left."""
+    seconds = budget(stage)
+    if seconds <= 0:
+        metrics.increment("deadline_exceeded_total", stage=stage)
+        raise DeadlineExceeded(stage)
+    return seconds
@@ -0,0 +1,329 @@
+"""Offline city gazetteer for weather location extraction.
+
+The bundled cities file (app/data/cities.tsv, GeoNames columns) is compiled
+once into a binary index: a sorted table of normalized names and aliases,
+each pointing at its places ordered by population. The index is memory
+mapped on first use, so importing the app does not pay for it, and finding
+a place in a query is a handful of binary searches over the mapped table,
+walking it like a trie one word at a time.
+
+A full GeoNames dump (e.g. cities15000.txt) can be used instead by pointing
+GAZETTEER_SOURCE at it; the index is rebuilt whenever the source is newer.
+
+    python -m app.utils.gazetteer [source] [index]
+
+builds the index ahead of time (the Docker image does this).
+"""
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import unicodedata
+import zlib
+from array import array
+from collections import defaultdict, namedtuple
+
+from app.config import Config
+from app.utils import metrics
+
+
+Place = namedtuple("Place", "name country latitude longitude population")
+
+MAGIC = b"GAZ1"
+# magic, key count, posting count, record count, longest key in words
+HEADER = struct.Struct("=4s4I")
+# latitude, longitude, population, country code, name length, name offset
+RECORD = struct.Struct("=ffI2sHI")
+
+MAX_WORDS = 6
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Place names that are also everyday words only match when capitalized
+# ("weather in Nice" but not "it's nice out"), and never start a match
+COMMON_WORDS = frozenset(
+    "a about an and are as at be bath best by can cold day do does for from get give going good "
+    "hope hot how i if in is it its like man march me mobile most my nice now of on or out please "
+    "reading rain right show split sunny tell the there this to today tomorrow what whats when where "
+    "which will with weather temperature forecast".split()
+)
+
+
+def normalize(text):
+    """Lowercased, accent-stripped word tokens."""
+    if text.isascii():
+        return TOKEN_PATTERN.findall(text.lower())
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(text)
+
+
+def _read_places(source):
+    """Yield (name, aliases, latitude, longitude, country, population) rows.
+
+    Accepts the bundled 7-column layout and full 19-column GeoNames dumps.
+    """
+    with open(source, encoding="utf-8") as rows:
+        for line in rows:
+            if not line.strip() or line.startswith("#"):
+                continue
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) >= 19:
+                name, ascii_name, alternates = columns[1:4]
+                latitude, longitude, country, population = columns[4], columns[5], columns[8], columns[14]
+            elif len(columns) == 7:
+                name, ascii_name, alternates, latitude, longitude, country, population = columns
+            else:
+                continue
+
+            # Two-letter upper-case aliases are codes ("LA", "DC"), not names
+            aliases = {name, ascii_name}
+            aliases.update(alias for alias in alternates.split(",")
+                           if alias and not (len(alias) <= 2 and alias.isupper()))
+            yield name, aliases, float(latitude), float(longitude), country, int(population or 0)
+
+
+def build_index(source, index_path):
+    """Compile the cities file into the binary index at index_path."""
+    records = list(_read_places(source))
+    postings_by_key = defaultdict(set)
+    for record_id, (_, aliases, *_rest) in enumerate(records):
+        for alias in aliases:
+            words = normalize(alias)
+            if 0 < len(words) <= MAX_WORDS:
+                postings_by_key[" ".join(words).encode("utf-8")].add(record_id)
+
+    keys = sorted(postings_by_key)
+    key_offsets, posting_starts, postings = array("I", [0]), array("I", [0]), array("I")
+    key_blob = bytearray()
+    for key in keys:
+        key_blob += key
+        key_offsets.append(len(key_blob))
+        postings.extend(sorted(postings_by_key[key], key=lambda record_id: -records[record_id][5]))
+        posting_starts.append(len(postings))
+
+    record_blob, name_blob = bytearray(), bytearray()
+    for name, _, latitude, longitude, country, population in records:
+        encoded = name.encode("utf-8")
+        record_blob += RECORD.pack(latitude, longitude, population, country.encode("ascii")[:2],
+                                   len(encoded), len(name_blob))
+        name_blob += encoded
+
+    max_words = max((key.count(b" ") + 1 for key in keys), default=0)
+    temporary = f"{index_path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as index:
+        index.write(HEADER.pack(MAGIC, len(keys), len(postings), len(records), max_words))
+        for section in (key_offsets, posting_starts, postings):
+            index.write(section.tobytes())
+        index.write(record_blob)
+        index.write(key_blob)
+        index.write(name_blob)
+    # Atomic, so concurrently starting workers never map a half-written file
+    os.replace(temporary, index_path)
+    return len(records), len(keys)
+
+
+def _load_countries(path):
+    """Return {normalized country name: ISO code} from the countries file."""
+    countries = {}
+    if not path or not os.path.exists(path):
+        return countries
+    with open(path, encoding="utf-8") as rows:
+        for line in rows:
+            if not line.strip() or line.startswith("#"):
+                continue
+            code, name, *rest = line.rstrip("\n").split("\t")
+            for alias in [name] + (rest[0].split(",") if rest and rest[0] else []):
+                countries[" ".join(normalize(alias))] = code
+    return countries
+
+
+class Gazetteer:
+    """Find known places in free text using the memory-mapped index."""
+
+    def __init__(self, source, index_path=None, countries_path=None):
+        self.source = source
+        self.index_path = index_path or f"{source}.idx"
+        self.countries_path = countries_path
+        self._lock = threading.Lock()
+        self._map = None
+
+    def _open(self):
+        with self._lock:
+            if self._map is not None:
+                return
+            if (not os.path.exists(self.index_path)
+                    or os.path.getmtime(self.index_path) < os.path.getmtime(self.source)):
+                build_index(self.source, self.index_path)
+
+            with open(self.index_path, "rb") as index:
+                mapped = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, key_count, posting_count, record_count, self._max_words = HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError(f"{self.index_path} is not a gazetteer index")
+
+            view = memoryview(mapped)
+            offset = HEADER.size
+            sections = []
+            for length in (key_count + 1, key_count + 1, posting_count):
+                sections.append(view[offset:offset + length * 4].cast("I"))
+                offset += length * 4
+            self._key_offsets, self._posting_starts, self._posting_ids = sections
+            self._records_at = offset
+            self._keys_at = offset + record_count * RECORD.size
+            self._names_at = self._keys_at + self._key_offsets[key_count]
+            self._key_count = key_count
+            self._countries = _load_countries(self.countries_path)
+            self._map = mapped
+
+    def _key(self, position):
+        start = self._keys_at + self._key_offsets[position]
+        return self._map[start:self._keys_at + self._key_offsets[position + 1]]
+
+    def _lower_bound(self, key):
+        low, high = 0, self._key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _place(self, record_id):
+        latitude, longitude, population, country, length, offset = RECORD.unpack_from(
+            self._map, self._records_at + record_id * RECORD.size)
+        start = self._names_at + offset
+        name = self._map[start:start + length].decode("utf-8")
+        return Place(name, country.decode("ascii"), round(latitude, 4), round(longitude, 4), population)
+
+    def _population(self, position):
+        record_id = self._posting_ids[self._posting_starts[position]]
+        return RECORD.unpack_from(self._map, self._records_at + record_id * RECORD.size)[2]
+
+    def _postings(self, position):
+        return self._posting_ids[self._posting_starts[position]:self._posting_starts[position + 1]]
+
+    def _longest_match(self, words, start):
+        """Return (word count, key position) of the longest key at words[start:]."""
+        best = None
+        phrase = words[start].encode("utf-8")
+        end = start
+        while True:
+            position = self._lower_bound(phrase)
+            if position == self._key_count:
+                break
+            key = self._key(position)
+            if key == phrase:
+                best = (end - start + 1, position)
+            elif not key.startswith(phrase):
+                break
+            end += 1
+            if end == len(words) or end - start >= self._max_words:
+                break
+            phrase += b" " + words[end].encode("utf-8")
+        return best
+
+    def _country_in(self, words):
+        for size in range(min(4, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                code = self._countries.get(" ".join(words[start:start + size]))
+                if code:
+                    return code
+        return None
+
+    def find(self, text, country=None):
+        """Return the best Place mentioned in text, or None.
+
+        Longer names win over shorter ones ("new york" over "york"), then
+        more populous places. A country named elsewhere in the text, or the
+        ISO `country` argument, picks among places sharing a name.
+        """
+        if self._map is None:
+            self._open()
+
+        words = normalize(text)
+        capitalized = None
+        best = None
+        for start, word in enumerate(words):
+            if word in COMMON_WORDS:
+                if capitalized is None:
+                    # The first word is capitalized anyway ("Nice weather today")
+                    capitalized = {token.casefold() for token in TOKEN_PATTERN.findall(text)[1:]
+                                   if token[:1].isupper()}
+                if word not in capitalized:
+                    continue
+            match = self._longest_match(words, start)
+            if match is None:
+                continue
+            if best is None or match[0] > best[0] or (
+                    match[0] == best[0] and self._population(match[1]) > self._population(best[1])):
+                best = match + (start,)
+
+        if best is None:
+            metrics.increment("gazetteer_lookups_total", result="miss")
+            return None
+
+        size, position, start = best
+        record_ids = self._postings(position)
+        if len(record_ids) > 1:
+            if not country:
+                country = self._country_in(words[:start] + words[start + size:])
+            if country:
+                for record_id in record_ids:
+                    place = self._place(record_id)
+                    if place.country == country.upper():
+                        metrics.increment("gazetteer_lookups_total", result="hit")
+                        return place
+        metrics.increment("gazetteer_lookups_total", result="hit")
+        return self._place(record_ids[0])
+
+    def __len__(self):
+        if self._map is None:
+            self._open()
+        return self._key_count
+
+
+def default_index_path(source):
+    """Next to the source when writable, else in the temp directory."""
+    directory = os.path.dirname(os.path.abspath(source))
+    if os.access(directory, os.W_OK):
+        return f"{source}.idx"
+    digest = zlib.crc32(os.path.abspath(source).encode("utf-8"))
+    return os.path.join(tempfile.gettempdir(), f"gazetteer-{digest:08x}.idx")
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """Return the process-wide gazetteer, or None when disabled or missing.
+
+    Construction is cheap; the index is built or mapped on the first lookup.
+    """
+    global _gazetteer
+
+    if not Config.GAZETTEER_ENABLED or not os.path.exists(Config.GAZETTEER_SOURCE):
+        return None
+
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer(
+                    Config.GAZETTEER_SOURCE,
+                    Config.GAZETTEER_INDEX or default_index_path(Config.GAZETTEER_SOURCE),
+                    Config.GAZETTEER_COUNTRIES,
+                )
+
+    return _gazetteer
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else Config.GAZETTEER_SOURCE
+    index_path = sys.argv[2] if len(sys.argv) > 2 else (Config.GAZETTEER_INDEX or default_index_path(source))
+    places, keys = build_index(source, index_path)
+    print(f"Indexed {places} places under {keys} names into {index_path}")
@@ -0,0 +1,181 @@
+"""Hedged upstream calls for tail-latency-sensitive stages.
+
+When a call has not returned after the stage's recent p95 latency, a
+duplicate is sent and whichever answers first wins (the other is cancelled
+when async, or left to finish and ignored when threaded). Only about one
+call in twenty is slower than the p95, so hedging costs few extra upstream
+calls while cutting the slow tail; HEDGE_MAX_RATIO additionally caps hedges
+at a fraction of all calls, so a slow upstream is not hit with twice the
+load. No hedge is sent when the request deadline would pass first.
+
+    hedger = get_hedger("select")
+    reply = hedger.call(lambda: llm.invoke(prompt))
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app.config import Config
+from app.utils import deadline, metrics
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.HEDGE_THREADS, thread_name_prefix="hedge")
+    return _executor
+
+
+class Hedger:
+    """Tracks a stage's recent latencies and hedges calls slower than their p95."""
+
+    def __init__(self, stage, enabled=True, quantile=0.95, window=200, min_samples=20,
+                 min_delay=0.02, max_ratio=0.1):
+        self.stage = stage
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self._latencies = deque(maxlen=window)
+        self._delay = None
+        self._calls = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed):
+        with self._lock:
+            self._latencies.append(elapsed)
+            self._calls += 1
+            # Re-derive the quantile every few samples rather than on every call
+            if len(self._latencies) >= self.min_samples and self._calls % 10 == 0:
+                ordered = sorted(self._latencies)
+                self._delay = max(self.min_delay, ordered[int(self.quantile * (len(ordered) - 1))])
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples."""
+        return self._delay
+
+    def _should_hedge(self):
+        """Whether a hedge may be sent now (within the ratio cap and the deadline)."""
+        left = deadline.remaining()
+        if left is not None and left <= self._delay:
+            return False
+        with self._lock:
+            if self._hedges + 1 > self.max_ratio * self._calls:
+                return False
+            self._hedges += 1
+        metrics.increment("hedged_requests_total", stage=self.stage)
+        return True
+
+    def _timed(self, fn):
+        started = time.perf_counter()
+        result = fn()
+        self.observe(time.perf_counter() - started)
+        return result
+
+    def call(self, fn):
+        """Run fn(), hedging it with a second fn() once it is slower than the p95."""
+        if not self.enabled:
+            return fn()
+        if self._delay is None:
+            return self._timed(fn)
+
+        executor = _get_executor()
+        primary = executor.submit(contextvars.copy_context().run, self._timed, fn)
+        done, _ = wait([primary], timeout=self._delay)
+        if done or not self._should_hedge():
+            return primary.result()
+
+        backup = executor.submit(contextvars.copy_context().run, self._timed, fn)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    metrics.increment("hedge_wins_total", stage=self.stage,
+                                      winner="primary" if future is primary else "hedge")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def acall(self, coro_fn):
+        """Asynchronous version of call; the losing call is cancelled."""
+        if not self.enabled:
+            return await coro_fn()
+
+        async def timed():
+            started = time.perf_counter()
+            result = await coro_fn()
+            self.observe(time.perf_counter() - started)
+            return result
+
+        if self._delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self._delay)
+            if done or not self._should_hedge():
+                return await primary
+
+            backup = asyncio.ensure_future(timed())
+            pending = {primary, backup}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        metrics.increment("hedge_wins_total", stage=self.stage,
+                                          winner="primary" if task is primary else "hedge")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "delay_ms": round(self._delay * 1000, 1) if self._delay is not None else None,
+                "calls": self._calls,
+                "hedges": self._hedges,
+            }
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(stage):
+    """Return the process-wide hedger for a stage (disabled unless listed in HEDGE_STAGES)."""
+    hedger = _hedgers.get(stage)
+    if hedger is None:
+        with _hedgers_lock:
+            hedger = _hedgers.get(stage)
+            if hedger is None:
+                hedger = _hedgers[stage] = Hedger(
+                    stage,
+                    enabled=Config.HEDGE_ENABLED and stage in Config.HEDGE_STAGES,
+                    quantile=Config.HEDGE_QUANTILE,
+                    min_delay=Config.HEDGE_MIN_DELAY_MS / 1000,
+                    max_ratio=Config.HEDGE_MAX_RATIO,
+                )
+    return hedger
+
+
+def stats():
+    return {stage: hedger.stats() for stage, hedger in sorted(_hedgers.items()) if hedger.enabled}
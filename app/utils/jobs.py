@@ -0,0 +1,518 @@
+"""Asynchronous jobs for long-running queries.
+
+A long LLM answer holds a worker thread and a client connection open for
+seconds, and clients behind proxies that time out retry, adding load.
+POST /jobs instead answers at once with a job id. Background workers
+(JOBS_WORKERS threads per process) take jobs from a bounded queue and run
+them like /query: tool selection and the tools, admission control and
+deadlines included. The client then gets the result in one of three ways:
+
+- polling GET /jobs/<id>;
+- long-polling GET /jobs/<id>?wait=<seconds>, which returns as soon as the
+  job finishes;
+- a POST of the finished job to the `callback_url` it was submitted with.
+
+The store is in-process ("memory") or any Redis-protocol server ("redis").
+In-process jobs are only known to the process that took them; with several
+workers or nodes, use the shared store. A job is taken by one worker at
+most once; a job whose process dies while running it stays "running"
+until it expires.
+
+    job, error = create_job(data)
+    get_job_runner().submit(job)
+"""
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import math
+import queue
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import Config
+from app.utils import deadline, metrics
+from app.utils.admission import Overloaded
+from app.utils.clients import get_webhook_client, post_with_retries
+from app.utils.query_runner import run_query
+
+
+FINISHED = ("succeeded", "failed", "expired")
+
+# Long-poll interval of the asynchronous waiters (ASGI)
+POLL_INTERVAL = 0.05
+
+
+def _now():
+    # Wall-clock time: jobs may move between processes and nodes
+    return time.time()
+
+
+class InMemoryJobStore:
+    """Jobs and their queue in this process."""
+
+    # Operations never block on I/O, so async callers can use them directly
+    blocking = False
+
+    def __init__(self, max_queue=1000):
+        self._jobs = {}
+        self._queue = queue.Queue(max_queue)
+        self._changed = threading.Condition()
+
+    def _expire(self):
+        now = _now()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['expires_at'] <= now]:
+            del self._jobs[job_id]
+
+    def submit(self, job):
+        """Store and enqueue a new job; False when the queue is full."""
+        with self._changed:
+            self._expire()
+            self._jobs[job['id']] = dict(job)
+        try:
+            self._queue.put_nowait(job['id'])
+        except queue.Full:
+            with self._changed:
+                self._jobs.pop(job['id'], None)
+            return False
+        return True
+
+    def next(self, timeout):
+        """The next queued job, or None after `timeout` seconds."""
+        try:
+            job_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return self.get(job_id)
+
+    def update(self, job):
+        with self._changed:
+            self._jobs[job['id']] = dict(job)
+            self._changed.notify_all()
+
+    def get(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None or job['expires_at'] <= _now():
+                return None
+            return dict(job)
+
+    def wait(self, job_id, timeout):
+        """The job once it has finished, or as it is after `timeout` seconds (None if unknown)."""
+        until = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                left = until - time.monotonic()
+                if job is None or job['status'] in FINISHED or left <= 0:
+                    return self.get(job_id)
+                self._changed.wait(left)
+
+    def depth(self):
+        return self._queue.qsize()
+
+
+class RedisJobStore:
+    """Jobs in any Redis-protocol server, shared by every worker and node.
+
+    Each job is a JSON string expiring with the job; the queue is a list
+    (LPUSH/BRPOP) and finished jobs are announced on a per-job channel for
+    long-polling clients.
+    """
+
+    blocking = True
+
+    def __init__(self, url, max_queue=1000, prefix="ai-agent:jobs:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.max_queue = max_queue
+        self.prefix = prefix
+        self.queue = prefix + "queue"
+
+    def _key(self, job_id):
+        return self.prefix + "job:" + job_id
+
+    def _channel(self, job_id):
+        return self.prefix + "done:" + job_id
+
+    def _ttl(self, job):
+        return max(1, math.ceil(job['expires_at'] - _now()))
+
+    def submit(self, job):
+        """Store and enqueue a new job; False when the queue is full.
+
+        The length check and the push are not atomic, so concurrent
+        submissions may overshoot JOBS_MAX_QUEUE by a few jobs.
+        """
+        if self.client.llen(self.queue) >= self.max_queue:
+            return False
+        pipeline = self.client.pipeline()
+        pipeline.set(self._key(job['id']), json.dumps(job), ex=self._ttl(job))
+        pipeline.lpush(self.queue, job['id'])
+        pipeline.execute()
+        return True
+
+    def next(self, timeout):
+        item = self.client.brpop(self.queue, timeout=max(1, math.ceil(timeout)))
+        if item is None:
+            return None
+        return self.get(item[1].decode())
+
+    def update(self, job):
+        self.client.set(self._key(job['id']), json.dumps(job), ex=self._ttl(job))
+        if job['status'] in FINISHED:
+            self.client.publish(self._channel(job['id']), job['status'])
+
+    def get(self, job_id):
+        raw = self.client.get(self._key(job_id))
+        return json.loads(raw) if raw is not None else None
+
+    def wait(self, job_id, timeout):
+        until = time.monotonic() + timeout
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel(job_id))
+        try:
+            # Read after subscribing, so a job finishing in between is not missed
+            job = self.get(job_id)
+            while job is not None and job['status'] not in FINISHED:
+                left = until - time.monotonic()
+                if left <= 0:
+                    break
+                pubsub.get_message(timeout=left)
+                job = self.get(job_id)
+            return job
+        finally:
+            pubsub.close()
+
+    def depth(self):
+        return self.client.llen(self.queue)
+
+
+def public(job):
+    """A job as returned to clients and callbacks."""
+    return {key: value for key, value in job.items() if key != 'callback_url'}
+
+
+def _limit_result(response):
+    """Cut the response's `result` so the response fits JOBS_MAX_RESULT_BYTES; returns (response, truncated)."""
+    size = len(json.dumps(response).encode())
+    if size <= Config.JOBS_MAX_RESULT_BYTES:
+        return response, False
+    result = str(response.get('result', ''))
+    encoded = len(json.dumps(result).encode())
+    budget = Config.JOBS_MAX_RESULT_BYTES - (size - encoded)
+    # Characters encode to different lengths (escapes, UTF-8): estimate, then shrink to fit
+    keep = max(0, int(len(result) * budget / encoded))
+    while keep and len(json.dumps(result[:keep]).encode()) > budget:
+        keep = int(keep * 0.9)
+    metrics.increment("jobs_truncated_results_total")
+    return {**response, 'result': result[:keep]}, True
+
+
+def _public(address):
+    """Whether an IP address is globally routable (not loopback, private, link-local, ...)."""
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+def _check_callback_host(host, resolve=False):
+    """(address, error) for a callback to `host`; error is a message when it may not go there.
+
+    Hosts in JOBS_CALLBACK_HOSTS are allowed as they are (address None:
+    connect by name). Without that list, a callback may only reach public
+    addresses, so submitters cannot make the server POST to loopback,
+    private or link-local services (such as a cloud metadata endpoint). IP
+    literals and "localhost" are checked at once; other names only with
+    `resolve`, by every address they resolve to, since resolving can block
+    for seconds. `address` is the checked address to connect to, so the
+    name cannot resolve somewhere else by the time the callback is sent.
+    """
+    if Config.JOBS_CALLBACK_HOSTS:
+        if host not in Config.JOBS_CALLBACK_HOSTS:
+            return None, f'callback_url host {host} is not allowed'
+        return None, None
+    if host == "localhost" or host.endswith(".localhost"):
+        return None, f'callback_url host {host} is not a public address'
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        if not resolve:
+            return None, None
+        try:
+            addresses = [ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in socket.getaddrinfo(host, None)]
+        except (OSError, UnicodeError, ValueError):
+            return None, f'callback_url host {host} does not resolve'
+    if not addresses or not all(_public(address) for address in addresses):
+        return None, f'callback_url host {host} is not a public address'
+    return addresses[0], None
+
+
+def _pinned_request(url, address):
+    """(url, headers, extensions) that send a request for `url` to `address`.
+
+    The Host header and, for https, the TLS server name (SNI and certificate
+    check) keep the original host name.
+    """
+    parts = urlsplit(url)
+    host = f"[{address}]" if address.version == 6 else str(address)
+    netloc = f"{host}:{parts.port}" if parts.port else host
+    extensions = {"sni_hostname": parts.hostname} if parts.scheme == "https" else {}
+    return parts._replace(netloc=netloc).geturl(), {"Host": parts.netloc.rsplit("@", 1)[-1]}, extensions
+
+
+def _validate_callback(url):
+    """An error message for an unusable callback URL, else None."""
+    if not isinstance(url, str):
+        return 'callback_url must be a string'
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return 'callback_url must be an http(s) URL'
+    return _check_callback_host(parts.hostname)[1]
+
+
+def _job_timeout(data):
+    try:
+        seconds = float(data.get('timeout', Config.JOBS_TIMEOUT))
+    except (TypeError, ValueError):
+        return Config.JOBS_TIMEOUT
+    if not math.isfinite(seconds) or seconds <= 0:
+        return Config.JOBS_TIMEOUT
+    return min(seconds, Config.JOBS_TIMEOUT_MAX)
+
+
+def create_job(data):
+    """Return (job, error) for a POST /jobs body: {"query", "callback_url"?, "timeout"?}."""
+    if not isinstance(data, dict) or not isinstance(data.get('query'), str) or not data['query'].strip():
+        return None, 'Query is required'
+    if len(data['query']) > Config.JOBS_MAX_QUERY_CHARS:
+        return None, f'Query is longer than {Config.JOBS_MAX_QUERY_CHARS} characters'
+    callback_url = data.get('callback_url')
+    if callback_url is not None:
+        error = _validate_callback(callback_url)
+        if error:
+            return None, error
+
+    now = _now()
+    timeout = _job_timeout(data)
+    return {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'query': data['query'],
+        'created_at': now,
+        'started_at': None,
+        'finished_at': None,
+        'deadline': now + timeout,
+        # Unfinished jobs expire too, in case the process running them dies
+        'expires_at': now + timeout + Config.JOBS_TTL,
+        'callback_url': callback_url,
+        'response': None,
+        'error': None,
+        'truncated': False,
+    }, None
+
+
+class JobRunner:
+    """Worker threads taking jobs from a store, running them and delivering callbacks."""
+
+    def __init__(self, store, run=run_query, workers=8):
+        self.store = store
+        self.run = run
+        self.workers = workers
+        self._threads = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._callbacks = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-callback")
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+
+    def submit(self, job):
+        """Enqueue a job from create_job; raises admission.Overloaded when the queue is full."""
+        self.start()
+        if not self.store.submit(job):
+            metrics.increment("jobs_total", status="rejected")
+            raise Overloaded("Job queue is full", retry_after=1.0, reason="job_queue_full")
+        metrics.increment("jobs_total", status="queued")
+        metrics.set_gauge("jobs_queue_depth", self.store.depth())
+        return job
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.store.next(timeout=1.0)
+            except Exception as e:
+                print(f"Job queue error: {e}")
+                time.sleep(1.0)
+                continue
+            if job is None or job['status'] != 'queued':
+                continue
+            with self._lock:
+                self._busy += 1
+            try:
+                self._execute(job)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+
+    def _execute(self, job):
+        now = _now()
+        metrics.observe("jobs_queue_wait_seconds", now - job['created_at'])
+        if now >= job['deadline']:
+            self._finish(job, 'expired', error='Job timed out before it started')
+            return
+
+        job.update(status='running', started_at=now)
+        self.store.update(job)
+        try:
+            # The job's deadline, on this process's clock
+            with deadline.scope(time.monotonic() + job['deadline'] - now):
+                response = self.run(job['query'])
+        except Exception as e:
+            self._finish(job, 'failed', error=str(e))
+            return
+        response, truncated = _limit_result(response)
+        self._finish(job, 'succeeded', response=response, truncated=truncated)
+
+    def _finish(self, job, status, response=None, error=None, truncated=False):
+        finished = _now()
+        job.update(status=status, finished_at=finished, response=response, error=error,
+                   truncated=truncated, expires_at=finished + Config.JOBS_TTL)
+        self.store.update(job)
+        metrics.increment("jobs_total", status=status)
+        if job['started_at'] is not None:
+            metrics.observe("jobs_run_seconds", finished - job['started_at'])
+        metrics.set_gauge("jobs_queue_depth", self.store.depth())
+        if job.get('callback_url'):
+            self._callbacks.submit(deliver_callback, job)
+
+    def stats(self):
+        with self._lock:
+            busy = self._busy
+        return {
+            'backend': type(self.store).__name__,
+            'workers': len(self._threads),
+            'busy': busy,
+            'queued': self.store.depth(),
+        }
+
+
+def deliver_callback(job):
+    """POST a finished job to its callback_url, retrying transient failures.
+
+    The host is checked again, resolved this time, right before delivery,
+    and the callback goes to the address that was checked; redirects are
+    not followed.
+    """
+    address, error = _check_callback_host(urlsplit(job['callback_url']).hostname, resolve=True)
+    if error:
+        print(f"Job callback refused for {job['id']}: {error}")
+        metrics.increment("jobs_callbacks_total", outcome="refused")
+        return False
+
+    url, headers, extensions = job['callback_url'], {}, {}
+    if address is not None:
+        url, headers, extensions = _pinned_request(url, address)
+
+    body = json.dumps(public(job)).encode()
+    headers.update({"Content-Type": "application/json", "X-Job-Id": job['id']})
+    if Config.JOBS_CALLBACK_SECRET:
+        signature = hmac.new(Config.JOBS_CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-Signature"] = f"sha256={signature}"
+    try:
+        response = post_with_retries(get_webhook_client(), url, body, headers,
+                                     retries=Config.JOBS_CALLBACK_RETRIES, extensions=extensions)
+        delivered = response.status_code < 300
+    except httpx.HTTPError as e:
+        print(f"Job callback failed for {job['id']}: {e}")
+        delivered = False
+    metrics.increment("jobs_callbacks_total", outcome="delivered" if delivered else "failed")
+    return delivered
+
+
+def wait_seconds(value):
+    """Long-poll time from a `wait` query parameter, capped at JOBS_MAX_WAIT (0 if absent or invalid)."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if not math.isfinite(seconds) or seconds <= 0:
+        return 0.0
+    return min(seconds, Config.JOBS_MAX_WAIT)
+
+
+def get_job(job_id, wait=0.0):
+    """The job (None if unknown or expired), after waiting up to `wait` seconds for it to finish."""
+    store = get_job_store()
+    return store.wait(job_id, wait) if wait > 0 else store.get(job_id)
+
+
+async def aget_job(job_id, wait=0.0):
+    """Asynchronous version of get_job; waits without holding a thread."""
+    store = get_job_store()
+
+    async def read():
+        return await asyncio.to_thread(store.get, job_id) if store.blocking else store.get(job_id)
+
+    until = time.monotonic() + wait
+    job = await read()
+    while job is not None and job['status'] not in FINISHED:
+        left = until - time.monotonic()
+        if left <= 0:
+            break
+        await asyncio.sleep(min(POLL_INTERVAL, left))
+        job = await read()
+    return job
+
+
+_store = None
+_runner = None
+_lock = threading.Lock()
+
+
+def get_job_store():
+    """Return the process-wide job store (JOBS_BACKEND)."""
+    global _store
+
+    if _store is None:
+        with _lock:
+            if _store is None:
+                if Config.JOBS_BACKEND == "redis":
+                    _store = RedisJobStore(Config.JOBS_REDIS_URL, Config.JOBS_MAX_QUEUE)
+                else:
+                    _store = InMemoryJobStore(Config.JOBS_MAX_QUEUE)
+    return _store
+
+
+def get_job_runner():
+    """Return the process-wide job runner; its workers start with the first submission."""
+    global _runner
+
+    if _runner is None:
+        store = get_job_store()
+        with _lock:
+            if _runner is None:
+                _runner = JobRunner(store, run_query, Config.JOBS_WORKERS)
+    return _runner
+
+
+def stats():
+    return get_job_runner().stats()
@@ -0,0 +1,91 @@
+"""Keyword routing, used when the agent is not available.
+
+All rules are compiled into one alternation regex with named groups per
+rule, so routing a query is a single regex scan over the lowercased text.
+Keywords match on word boundaries ("x" no longer matches "explain"), and
+rules earlier in the table win when several match.
+"""
+import re
+from collections import namedtuple
+
+
+# tool: tool key to route to
+# words: keywords, matched as whole words
+# patterns: raw regex fragments (symbols, digit-adjacent forms)
+# requires_digit: only applies when the query contains a number
+KeywordRule = namedtuple("KeywordRule", "tool words patterns requires_digit")
+
+KEYWORD_RULES = [
+    KeywordRule(
+        "weather",
+        ("weather", "temperature", "rain", "raining", "rainy", "sunny", "cloudy", "hot", "cold"),
+        (),
+        False,
+    ),
+    KeywordRule(
+        "math",
+        ("multiply", "divide", "add", "subtract", "what is", "x"),
+        (r"[-+*/]", r"(?<=\d)x(?=\d)"),
+        True,
+    ),
+]
+
+DIGIT_PATTERN = re.compile(r"\d")
+
+
+class KeywordRouter:
+    """Route a query to a tool key using a table of KeywordRule entries."""
+
+    def __init__(self, rules=KEYWORD_RULES, default="llm"):
+        self.default = default
+        self.rules = list(rules)
+        self._compile()
+
+    def _compile(self):
+        # Whole-word keywords share one \b(...)\b group, which is much cheaper
+        # for the regex engine than a word boundary per alternative
+        words, patterns = [], []
+        self._groups = {}
+        for index, rule in enumerate(self.rules):
+            if rule.words:
+                ordered = sorted(rule.words, key=len, reverse=True)
+                words.append(f"(?P<w{index}>" + "|".join(re.escape(w.lower()).replace(r"\ ", r"\s+") for w in ordered) + ")")
+                self._groups[f"w{index}"] = index
+            if rule.patterns:
+                patterns.append(f"(?P<p{index}>" + "|".join(rule.patterns) + ")")
+                self._groups[f"p{index}"] = index
+
+        alternatives = patterns
+        if words:
+            alternatives = [r"\b(?:" + "|".join(words) + r")\b"] + patterns
+        self._pattern = re.compile("|".join(alternatives))
+
+    def add_rule(self, rule, position=None):
+        """Add a rule (at the end by default, i.e. lowest priority) and recompile."""
+        self.rules.insert(len(self.rules) if position is None else position, rule)
+        self._compile()
+
+    def route(self, query):
+        """Return the tool key for a query."""
+        query = query.lower()
+        matched = set()
+        for match in self._pattern.finditer(query):
+            index = self._groups[match.lastgroup]
+            if index == 0 and not self.rules[0].requires_digit:
+                return self.rules[0].tool
+            matched.add(index)
+
+        has_digit = None
+        for index in sorted(matched):
+            rule = self.rules[index]
+            if rule.requires_digit:
+                if has_digit is None:
+                    has_digit = DIGIT_PATTERN.search(query) is not None
+                if not has_digit:
+                    continue
+            return rule.tool
+        return self.default
+
+
+# Built once at import and shared by the Flask endpoints
+keyword_router = KeywordRouter()
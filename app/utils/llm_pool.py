@@ -0,0 +1,296 @@
+"""Pool of LLM upstreams: several Groq API keys and OpenAI-compatible endpoints.
+
+A single key's rate limit caps throughput however many workers run, so
+Groq calls are spread over every configured upstream: GROQ_API_KEY and
+GROQ_API_KEYS on Groq's API, plus LLM_ENDPOINTS (other OpenAI-compatible
+APIs, e.g. the local stand-ins in benchmarks/). The shared HTTP clients
+(app/utils/clients.py) pick an upstream for each request, so the LLM tool,
+the tool selector and the weather tool's city extraction use the pool
+without knowing about it.
+
+A request goes to the upstream with the lowest (outstanding requests + 1)
+x EWMA latency among those not throttled for the request's model. An
+upstream is throttled after a 429 (until its Retry-After), or when its
+x-ratelimit-remaining-* headers show the requests or tokens of the current
+window used up (until the window resets). When every upstream is
+throttled, the one that frees up first is used.
+
+    upstream = pool.acquire(model)
+    response = send(upstream.prepare(request))
+    pool.release(upstream, model, elapsed, response.status_code, response.headers)
+"""
+import re
+import threading
+import time
+
+import httpx
+
+from app.config import Config
+from app.utils import metrics
+
+
+# Path under which Groq serves its OpenAI-compatible API; requests are
+# rewritten from here to the chosen upstream's base URL
+GROQ_API_PATH = "/openai/v1"
+DEFAULT_GROQ_BASE_URL = "https://api.groq.com"
+
+# Throttle time after a 429 that names no Retry-After or reset time
+DEFAULT_THROTTLE_SECONDS = 1.0
+
+MODEL_PATTERN = re.compile(rb'"model"\s*:\s*"([^"]+)"')
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value):
+    """Seconds in a Retry-After or Groq reset header ("2", "7.66s", "2m59.56s", "250ms"); None if absent."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers, name):
+    try:
+        return int(float(headers[name]))
+    except (KeyError, ValueError):
+        return None
+
+
+def request_model(request):
+    """The model named in a chat completion request body, or None."""
+    try:
+        match = MODEL_PATTERN.search(request.content)
+    except httpx.RequestNotRead:
+        return None
+    return match.group(1).decode() if match else None
+
+
+class RateLimit:
+    """An upstream's rate-limit state for one model, from its latest response headers."""
+
+    __slots__ = ("limit_requests", "remaining_requests", "remaining_tokens", "throttled_until")
+
+    def __init__(self):
+        self.limit_requests = None
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.throttled_until = 0.0
+
+
+class Upstream:
+    """One API key on one OpenAI-compatible base URL."""
+
+    def __init__(self, name, base_url, api_key):
+        self.name = name
+        self.base_url = httpx.URL(base_url.rstrip("/"))
+        self._authorization = f"Bearer {api_key}"
+        self.outstanding = 0
+        self.ewma = None
+        self.requests = 0
+        self.errors = 0
+        self.throttles = 0
+        self.limits = {}
+
+    def available_at(self, model):
+        """Monotonic time at which the upstream stops being throttled for `model`."""
+        limit = self.limits.get(model)
+        return limit.throttled_until if limit is not None else 0.0
+
+    def prepare(self, request):
+        """The request, addressed to this upstream and authorized with its key."""
+        path = request.url.path
+        suffix = path.split(GROQ_API_PATH, 1)[1] if GROQ_API_PATH in path else path
+        raw_path = (self.base_url.path.rstrip("/") + suffix).encode()
+        if request.url.query:
+            raw_path += b"?" + request.url.query
+        url = self.base_url.copy_with(raw_path=raw_path)
+        if url == request.url and request.headers.get("authorization") == self._authorization:
+            return request
+
+        headers = [(name, value) for name, value in request.headers.raw
+                   if name.lower() not in (b"host", b"authorization")]
+        # Requests built from a stream get no Host header of their own
+        headers += [(b"Host", url.netloc), (b"Authorization", self._authorization.encode())]
+        return httpx.Request(request.method, url, headers=headers, stream=request.stream,
+                             extensions=request.extensions)
+
+
+class LLMPool:
+    """Dispatches requests over upstreams by load and latency, around throttled ones."""
+
+    # A failed call counts as this many times the upstream's average latency
+    ERROR_PENALTY = 5.0
+
+    def __init__(self, upstreams, decay=0.3, min_remaining_tokens=0, failover=True):
+        self.upstreams = list(upstreams)
+        self.decay = decay
+        self.min_remaining_tokens = min_remaining_tokens
+        self.failover = failover
+        self._lock = threading.Lock()
+
+    def _default_latency(self):
+        # Upstreams without samples yet look like an average one
+        known = [upstream.ewma for upstream in self.upstreams if upstream.ewma is not None]
+        return sum(known) / len(known) if known else 1.0
+
+    def acquire(self, model=None, exclude=()):
+        """Pick the upstream for a request and count it as outstanding; None if there is none."""
+        with self._lock:
+            candidates = [upstream for upstream in self.upstreams if upstream not in exclude]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            ready = [upstream for upstream in candidates if upstream.available_at(model) <= now]
+            if ready:
+                default = self._default_latency()
+                upstream = min(ready, key=lambda u: (u.outstanding + 1) * (u.ewma or default))
+            else:
+                upstream = min(candidates, key=lambda u: u.available_at(model))
+                metrics.increment("llm_pool_all_throttled_total", model=model or "")
+            upstream.outstanding += 1
+            outstanding = upstream.outstanding
+        metrics.set_gauge("llm_pool_outstanding", outstanding, upstream=upstream.name)
+        return upstream
+
+    def can_fail_over(self, model, tried):
+        """Whether another, unthrottled upstream is left to retry a request on."""
+        if not self.failover:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            return any(upstream not in tried and upstream.available_at(model) <= now
+                       for upstream in self.upstreams)
+
+    def release(self, upstream, model, elapsed, status=None, headers=None):
+        """Record a finished request: its latency (until headers), status and rate-limit headers.
+
+        `status` None means the request failed without a response.
+        """
+        failed = status is None or status >= 500
+        with self._lock:
+            upstream.outstanding -= 1
+            upstream.requests += 1
+            upstream.errors += failed
+            # A 429 answers fast and says nothing about the upstream's speed
+            if status != 429:
+                sample = max(elapsed, self.ERROR_PENALTY * (upstream.ewma or elapsed)) if failed else elapsed
+                upstream.ewma = sample if upstream.ewma is None else upstream.ewma + self.decay * (sample - upstream.ewma)
+            if headers is not None:
+                self._update_limits(upstream, model, status, headers)
+            outstanding, ewma = upstream.outstanding, upstream.ewma
+            limit = upstream.limits.get(model)
+
+        metrics.increment("llm_pool_requests_total", upstream=upstream.name,
+                          status=str(status) if status is not None else "error")
+        metrics.set_gauge("llm_pool_outstanding", outstanding, upstream=upstream.name)
+        if ewma is not None:
+            metrics.set_gauge("llm_pool_latency_ewma_seconds", round(ewma, 4), upstream=upstream.name)
+        if limit is not None:
+            self._export_limit(upstream, model, limit)
+
+    def _update_limits(self, upstream, model, status, headers):
+        limit = upstream.limits.get(model)
+        if limit is None:
+            limit = upstream.limits[model] = RateLimit()
+        limit.limit_requests = _header_int(headers, "x-ratelimit-limit-requests") or limit.limit_requests
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining_requests is not None:
+            limit.remaining_requests = remaining_requests
+        if remaining_tokens is not None:
+            limit.remaining_tokens = remaining_tokens
+
+        wait = None
+        if status == 429:
+            wait = (parse_duration(headers.get("retry-after"))
+                    or parse_duration(headers.get("x-ratelimit-reset-requests"))
+                    or DEFAULT_THROTTLE_SECONDS)
+        elif remaining_requests is not None and remaining_requests <= 0:
+            wait = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        elif remaining_tokens is not None and remaining_tokens <= self.min_remaining_tokens:
+            wait = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        if wait:
+            limit.throttled_until = max(limit.throttled_until, time.monotonic() + wait)
+            upstream.throttles += 1
+            metrics.increment("llm_pool_throttled_total", upstream=upstream.name, model=model or "")
+
+    def _export_limit(self, upstream, model, limit):
+        labels = {"upstream": upstream.name, "model": model or ""}
+        if limit.remaining_requests is not None:
+            metrics.set_gauge("llm_pool_remaining_requests", limit.remaining_requests, **labels)
+            if limit.limit_requests:
+                metrics.set_gauge("llm_pool_rate_limit_utilization",
+                                  round(1 - limit.remaining_requests / limit.limit_requests, 3), **labels)
+        if limit.remaining_tokens is not None:
+            metrics.set_gauge("llm_pool_remaining_tokens", limit.remaining_tokens, **labels)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                upstream.name: {
+                    "base_url": str(upstream.base_url),
+                    "outstanding": upstream.outstanding,
+                    "requests": upstream.requests,
+                    "errors": upstream.errors,
+                    "throttles": upstream.throttles,
+                    "latency_ewma_ms": round(upstream.ewma * 1000, 1) if upstream.ewma is not None else None,
+                    "limits": {
+                        model or "": {
+                            "remaining_requests": limit.remaining_requests,
+                            "remaining_tokens": limit.remaining_tokens,
+                            "throttled_for_seconds": round(max(0.0, limit.throttled_until - now), 1),
+                        }
+                        for model, limit in upstream.limits.items()
+                    },
+                }
+                for upstream in self.upstreams
+            }
+
+
+def _usable_key(key):
+    return bool(key) and key != "your_groq_api_key_here"
+
+
+def configured_upstreams():
+    """Upstreams from GROQ_API_KEY, GROQ_API_KEYS and LLM_ENDPOINTS (no keys: none)."""
+    if not _usable_key(Config.GROQ_API_KEY):
+        return []
+    groq_url = (Config.GROQ_BASE_URL or DEFAULT_GROQ_BASE_URL).rstrip("/") + GROQ_API_PATH
+    keys = list(dict.fromkeys([Config.GROQ_API_KEY, *filter(_usable_key, Config.GROQ_API_KEYS)]))
+    upstreams = [Upstream(f"groq-{index}", groq_url, key) for index, key in enumerate(keys)]
+    for index, entry in enumerate(Config.LLM_ENDPOINTS):
+        base_url, _, key = entry.partition("|")
+        upstreams.append(Upstream(f"endpoint-{index}", base_url.strip(), key.strip()))
+    return upstreams
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_llm_pool():
+    """Return the process-wide pool of LLM upstreams."""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LLMPool(
+                    configured_upstreams(),
+                    decay=Config.LLM_POOL_EWMA_DECAY,
+                    min_remaining_tokens=Config.LLM_POOL_MIN_REMAINING_TOKENS,
+                    failover=Config.LLM_POOL_FAILOVER,
+                )
+    return _pool
+
+
+def stats():
+    return get_llm_pool().stats()
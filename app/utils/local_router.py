@@ -0,0 +1,190 @@
+import math
+import re
+import zlib
+from collections import defaultdict
+
+
+# Tool keys used throughout the app, and the LangChain-style names the
+# LLM selector answers with.
+TOOL_NAMES = {
+    "weather": "WeatherTool",
+    "math": "MathTool",
+    "llm": "LLMTool",
+}
+
+# Compiled keyword/regex rules: (tool key, pattern, score).
+# A rule that matches votes for its tool with the given score (0..1).
+RULES = [
+    # A bare arithmetic expression, optionally behind "what is"/"calculate"
+    ("math", re.compile(
+        r"^\s*(?:what\s+is|what's|whats|calculate|compute|solve|evaluate)?\s*"
+        r"[-+*/^().\d\s]*\d[-+*/^().\d\s]*\??\s*$", re.IGNORECASE), 1.0),
+    # Two numbers joined by an operator word or symbol other than - and /
+    ("math", re.compile(
+        r"\d+(?:\.\d+)?\s*(?:[+*^x%]|plus|minus|times|divided\s+by|multiplied\s+by|mod)\s*\(?\s*-?\d",
+        re.IGNORECASE), 0.9),
+    # A lone - or / also joins ranges, dates and ratios, so it only counts
+    # behind "what is"/"calculate" or in front of "="
+    ("math", re.compile(
+        r"(?:\b(?:what\s+is|what's|whats|calculate|compute|solve|evaluate)\s+\(?\s*-?\d+(?:\.\d+)?\s*[-/]\s*\(?\s*-?\d"
+        r"|\d\s*[-/]\s*\(?\s*-?\d[^=]*=)", re.IGNORECASE), 0.9),
+    ("math", re.compile(
+        r"\b(?:square\s+root|sqrt|percent\s+of|factorial)\b", re.IGNORECASE), 0.8),
+    ("weather", re.compile(
+        r"\b(?:weather|forecast|temperature|humidity|humid|raining|rain|snowing|snow|"
+        r"sunny|cloudy|windy|degrees\s+outside)\b", re.IGNORECASE), 0.9),
+    ("llm", re.compile(
+        r"^\s*(?:who|why|when|where|how\s+(?:do|does|did|to|can)|explain|describe|"
+        r"tell\s+me\s+(?:about|a)|what\s+(?:does|are|was|were))\b", re.IGNORECASE), 0.8),
+]
+
+# Year ranges, dates and "24/7" look like arithmetic to the math rules;
+# they only count as math with an arithmetic context.
+NOT_ARITHMETIC_PATTERN = re.compile(
+    r"\b\d{4}\s*-\s*\d{4}\b|\b\d{4}-\d{1,2}-\d{1,2}\b|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b|\b24/7\b")
+ARITHMETIC_CONTEXT_PATTERN = re.compile(
+    r"^\s*(?:what\s+is|what's|whats|calculate|compute|solve|evaluate)\b|=", re.IGNORECASE)
+
+# Small seed corpus for the in-process classifier.
+TRAINING_EXAMPLES = [
+    ("weather", "what is the weather in paris"),
+    ("weather", "how's the weather today in tokyo"),
+    ("weather", "is it raining in london"),
+    ("weather", "temperature in cape town"),
+    ("weather", "will it be sunny in jakarta tomorrow"),
+    ("weather", "how hot is it in dubai right now"),
+    ("weather", "how cold is it outside in moscow"),
+    ("weather", "how is it looking in the sky up in bogor"),
+    ("weather", "do i need an umbrella in seattle"),
+    ("weather", "forecast for berlin"),
+    ("weather", "is it cloudy in sydney"),
+    ("weather", "current conditions in new york"),
+    ("math", "what is 15 + 25"),
+    ("math", "what is 2*4+1"),
+    ("math", "calculate 100 / 4"),
+    ("math", "what is 42 times 7"),
+    ("math", "12 divided by 3"),
+    ("math", "compute 3^4 - 10"),
+    ("math", "solve (5 + 3) * 2"),
+    ("math", "what's 7 minus 2"),
+    ("math", "add 5 and 9"),
+    ("math", "multiply 6 by 8"),
+    ("math", "square root of 144"),
+    ("math", "what is 10 percent of 250"),
+    ("llm", "who is the president of italy"),
+    ("llm", "how to make an iceland volcano baked cake"),
+    ("llm", "tell me a joke"),
+    ("llm", "how does photosynthesis work"),
+    ("llm", "what is the capital of france"),
+    ("llm", "explain quantum computing in simple terms"),
+    ("llm", "write a haiku about autumn"),
+    ("llm", "who wrote pride and prejudice"),
+    ("llm", "what is machine learning"),
+    ("llm", "why is the sky blue"),
+    ("llm", "recommend a good book"),
+    ("llm", "translate hello into spanish"),
+    ("llm", "who was the us president from 2009-2017"),
+    ("llm", "what happened on 9/11"),
+    ("llm", "is a 24/7 gym worth it"),
+    ("llm", "how many days between 2024-01-01 and 2024-03-01"),
+    ("llm", "the 1939-1945 war"),
+]
+
+
+def _tokenize(text):
+    return re.findall(r"[a-z]+|\d+|[-+*/^%()]", text.lower())
+
+
+class HashedNgramClassifier:
+    """Multinomial naive Bayes over hashed word n-grams and character trigrams.
+
+    Features are hashed into a fixed number of buckets so the model stays tiny
+    and needs no vocabulary; it is trained in-process from a seed corpus.
+    """
+
+    def __init__(self, examples=TRAINING_EXAMPLES, buckets=2 ** 12, alpha=0.5):
+        self.buckets = buckets
+        self.alpha = alpha
+        self.labels = sorted({label for label, _ in examples})
+        self._counts = {label: defaultdict(int) for label in self.labels}
+        self._totals = dict.fromkeys(self.labels, 0)
+        self._priors = {}
+
+        label_counts = defaultdict(int)
+        for label, text in examples:
+            label_counts[label] += 1
+            for feature in self._features(text):
+                self._counts[label][feature] += 1
+                self._totals[label] += 1
+
+        for label in self.labels:
+            self._priors[label] = math.log(label_counts[label] / len(examples))
+
+    def _features(self, text):
+        tokens = _tokenize(text)
+        # Collapse numbers so "15 + 25" and "42 * 7" share features
+        tokens = ["<num>" if t.isdigit() else t for t in tokens]
+
+        grams = list(tokens)
+        grams.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        joined = f" {' '.join(tokens)} "
+        grams.extend(f"#{joined[i:i + 3]}" for i in range(len(joined) - 2))
+
+        return [zlib.crc32(g.encode("utf-8")) % self.buckets for g in grams]
+
+    def predict_proba(self, text):
+        """Return a {label: probability} dict for the given text."""
+        features = self._features(text)
+        scores = {}
+        for label in self.labels:
+            counts = self._counts[label]
+            denominator = self._totals[label] + self.alpha * self.buckets
+            score = self._priors[label]
+            for feature in features:
+                score += math.log((counts.get(feature, 0) + self.alpha) / denominator)
+            scores[label] = score
+
+        # Softmax over the log scores
+        top = max(scores.values())
+        exp_scores = {label: math.exp(s - top) for label, s in scores.items()}
+        total = sum(exp_scores.values())
+        return {label: s / total for label, s in exp_scores.items()}
+
+
+class LocalRouter:
+    """Confidence-scored local tool classifier.
+
+    Combines the compiled regex rules with the hashed n-gram classifier.
+    Callers consult the LLM selector only when the returned confidence is
+    below their threshold.
+    """
+
+    RULE_WEIGHT = 0.6
+
+    def __init__(self, rules=RULES, classifier=None):
+        self.rules = rules
+        self.classifier = classifier or HashedNgramClassifier()
+
+    def _rule_scores(self, query):
+        scores = {}
+        dates = (NOT_ARITHMETIC_PATTERN.search(query)
+                 and not ARITHMETIC_CONTEXT_PATTERN.search(query))
+        for tool, pattern, score in self.rules:
+            if dates and tool == "math":
+                continue
+            if score > scores.get(tool, 0.0) and pattern.search(query):
+                scores[tool] = score
+        return scores
+
+    def classify(self, query):
+        """Return (tool_key, confidence) for a query."""
+        rule_scores = self._rule_scores(query)
+        model_scores = self.classifier.predict_proba(query)
+
+        combined = {
+            tool: self.RULE_WEIGHT * rule_scores.get(tool, 0.0)
+            + (1 - self.RULE_WEIGHT) * model_scores.get(tool, 0.0)
+            for tool in TOOL_NAMES
+        }
+        best = max(combined, key=combined.get)
+        return best, combined[best]
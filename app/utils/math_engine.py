@@ -0,0 +1,251 @@
+"""Compiled, bounded-cost evaluation of arithmetic expressions.
+
+Expressions are parsed once, checked against a whitelist of operators,
+functions and names, and compiled into nested closures that are cached by
+expression text. Evaluating a compiled expression costs one Python call per
+node, with no re-parsing and no AST dispatch.
+
+Integer arithmetic is guarded so `9**9**9` and similar inputs fail fast
+instead of pinning a worker core, and an expression over variables can be
+evaluated across arrays of values in one vectorized NumPy pass.
+"""
+import ast
+import math
+import operator
+from functools import lru_cache
+
+from app.config import Config
+
+
+class MathEngineError(ValueError):
+    """Raised for expressions that are invalid or exceed the work limits."""
+
+
+def _check_int(value):
+    if isinstance(value, int) and value.bit_length() > Config.MATH_MAX_INT_BITS:
+        raise MathEngineError("Result too large")
+    return value
+
+
+def _pow(base, exponent):
+    # Estimate the size of integer powers before computing them
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent > Config.MATH_MAX_INT_BITS or base.bit_length() * exponent > Config.MATH_MAX_INT_BITS * 2:
+            raise MathEngineError("Result too large")
+    if isinstance(exponent, (int, float)) and abs(exponent) > Config.MATH_MAX_EXPONENT:
+        raise MathEngineError("Exponent too large")
+    return _check_int(operator.pow(base, exponent))
+
+
+def _mul(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > Config.MATH_MAX_INT_BITS * 2:
+            raise MathEngineError("Result too large")
+    return _check_int(operator.mul(left, right))
+
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _mul,
+    ast.Div: operator.truediv,
+    ast.Pow: _pow,
+    ast.Mod: operator.mod,
+    ast.FloorDiv: operator.floordiv,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+# name -> (scalar implementation, NumPy function name)
+FUNCTIONS = {
+    "sqrt": (math.sqrt, "sqrt"),
+    "log": (math.log, "log"),
+    "ln": (math.log, "log"),
+    "log10": (math.log10, "log10"),
+    "log2": (math.log2, "log2"),
+    "exp": (math.exp, "exp"),
+    "sin": (math.sin, "sin"),
+    "cos": (math.cos, "cos"),
+    "tan": (math.tan, "tan"),
+    "asin": (math.asin, "arcsin"),
+    "acos": (math.acos, "arccos"),
+    "atan": (math.atan, "arctan"),
+    "sinh": (math.sinh, "sinh"),
+    "cosh": (math.cosh, "cosh"),
+    "tanh": (math.tanh, "tanh"),
+    "abs": (abs, "abs"),
+    "floor": (math.floor, "floor"),
+    "ceil": (math.ceil, "ceil"),
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+}
+
+
+def _numpy():
+    import numpy
+    return numpy
+
+
+def _function(name, vectorized):
+    scalar, numpy_name = FUNCTIONS[name]
+    return getattr(_numpy(), numpy_name) if vectorized else scalar
+
+
+class CompiledExpression:
+    """An expression compiled to closures; call evaluate() or evaluate_array()."""
+
+    def __init__(self, expression, variables, scalar_fn):
+        self.expression = expression
+        self.variables = variables
+        self._scalar_fn = scalar_fn
+        self._vector_fn = None
+
+    def evaluate(self, **values):
+        """Evaluate with scalar values for the expression's variables."""
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise MathEngineError(f"Missing value for: {', '.join(missing)}")
+        try:
+            return self._scalar_fn(values)
+        except (OverflowError, RecursionError):
+            raise MathEngineError("Result too large")
+
+    def evaluate_array(self, **arrays):
+        """Evaluate over equal-length arrays of values in one vectorized pass.
+
+        Returns a NumPy float64 array; elements that are undefined (division
+        by zero, log of a negative, ...) come back as nan or inf.
+        """
+        numpy = _numpy()
+        missing = [name for name in self.variables if name not in arrays]
+        if missing:
+            raise MathEngineError(f"Missing values for: {', '.join(missing)}")
+
+        columns = {name: numpy.asarray(arrays[name], dtype=numpy.float64) for name in self.variables}
+        size = max((column.size for column in columns.values()), default=1)
+        if size > Config.MATH_MAX_ARRAY_SIZE:
+            raise MathEngineError(f"At most {Config.MATH_MAX_ARRAY_SIZE} values per variable")
+
+        if self._vector_fn is None:
+            self._vector_fn = _compile_node(ast.parse(self.expression, mode='eval').body, vectorized=True)
+
+        with numpy.errstate(all='ignore'):
+            result = self._vector_fn(columns)
+        return numpy.broadcast_to(numpy.asarray(result, dtype=numpy.float64), (size,))
+
+
+def _compile_node(node, vectorized=False):
+    """Compile an AST node into a closure taking the variable mapping."""
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if vectorized:
+            value = float(value)
+        return lambda env: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in CONSTANTS:
+            value = CONSTANTS[name]
+            return lambda env: value
+        return lambda env: env[name]
+
+    if isinstance(node, ast.BinOp):
+        left = _compile_node(node.left, vectorized)
+        right = _compile_node(node.right, vectorized)
+        op = BINARY_OPERATORS[type(node.op)]
+        if vectorized and op in (_pow, _mul):
+            # Float arrays overflow to inf instead of growing without bound
+            op = operator.pow if op is _pow else operator.mul
+        return lambda env: op(left(env), right(env))
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, vectorized)
+        op = UNARY_OPERATORS[type(node.op)]
+        return lambda env: op(operand(env))
+
+    if isinstance(node, ast.Call):
+        fn = _function(node.func.id, vectorized)
+        args = [_compile_node(arg, vectorized) for arg in node.args]
+        if len(args) == 1:
+            arg = args[0]
+            return lambda env: fn(arg(env))
+        if vectorized and node.func.id in ("log", "ln"):
+            # log(x, base) has no single NumPy ufunc
+            value, base = args
+            return lambda env: fn(value(env)) / fn(base(env))
+        return lambda env: fn(*(arg(env) for arg in args))
+
+    raise MathEngineError(f"Unsupported operation: {type(node).__name__}")
+
+
+def _validate(tree, allowed_variables):
+    """Check the whitelist and size limits; returns the variables used."""
+    nodes = list(ast.walk(tree.body))
+    if len(nodes) > Config.MATH_MAX_NODES:
+        raise MathEngineError("Expression too complex")
+
+    callees = {id(node.func) for node in nodes if isinstance(node, ast.Call)}
+    variables = []
+    for node in nodes:
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise MathEngineError("Only numbers are allowed")
+            _check_int(node.value)
+        elif isinstance(node, ast.Name):
+            if node.id in FUNCTIONS:
+                if id(node) not in callees:
+                    raise MathEngineError(f"{node.id} must be called, e.g. {node.id}(2)")
+            elif id(node) in callees:
+                raise MathEngineError(f"Unknown function: {node.id}")
+            elif node.id not in CONSTANTS:
+                if node.id not in allowed_variables:
+                    raise MathEngineError(f"Unknown name: {node.id}")
+                if node.id not in variables:
+                    variables.append(node.id)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                raise MathEngineError("Unsupported function call")
+            max_args = 2 if node.func.id in ("log", "ln") else 1
+            if not 1 <= len(node.args) <= max_args:
+                raise MathEngineError(f"Wrong number of arguments to {node.func.id}")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in BINARY_OPERATORS:
+                raise MathEngineError(f"Unsupported operation: {type(node.op).__name__}")
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in UNARY_OPERATORS:
+                raise MathEngineError(f"Unsupported operation: {type(node.op).__name__}")
+        elif not isinstance(node, (ast.Load, ast.operator, ast.unaryop)):
+            raise MathEngineError(f"Unsupported operation: {type(node).__name__}")
+
+    return tuple(variables)
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(expression, variables=()):
+    """Parse, validate and compile an expression; cached by its text.
+
+    `variables` is a tuple of names the expression may use besides the
+    built-in functions and constants.
+    """
+    if len(expression) > Config.MATH_MAX_EXPRESSION_LENGTH:
+        raise MathEngineError("Expression too long")
+
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise MathEngineError(f"Invalid expression: {e.msg}")
+
+    used = _validate(tree, set(variables))
+    return CompiledExpression(expression, used, _compile_node(tree.body))
+
+
+def evaluate(expression, **values):
+    """Compile (or fetch from cache) and evaluate one expression."""
+    return compile_expression(expression, tuple(sorted(values))).evaluate(**values)
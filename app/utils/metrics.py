@@ -0,0 +1,133 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_histograms = {}
+
+# Histogram bucket upper bounds in seconds (cumulative buckets, plus +Inf)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def increment(name, amount=1, **labels):
+    """Increment a labelled counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += amount
+
+
+def get_counter(name, **labels):
+    """Return the current value of a labelled counter."""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def set_gauge(name, value, **labels):
+    """Set a labelled gauge (a value that goes up and down, e.g. a queue depth)."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def get_gauge(name, **labels):
+    """Return the current value of a labelled gauge."""
+    with _lock:
+        return _gauges.get(_key(name, labels), 0)
+
+
+def series(name, **labels):
+    """Return the key of a labelled series, for repeated observe_series calls."""
+    return _key(name, labels)
+
+
+def observe(name, value, **labels):
+    """Record a value (e.g. a duration in seconds) in a labelled histogram."""
+    observe_series(_key(name, labels), value)
+
+
+def observe_series(key, value):
+    """observe() for a key from series(), skipping the label sort on hot paths."""
+    index = bisect_left(LATENCY_BUCKETS, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+        histogram[0][index] += 1
+        histogram[1] += value
+
+
+def get_histogram(name, **labels):
+    """Return {"count", "sum", "buckets": [(upper bound, cumulative count), ...]}."""
+    with _lock:
+        histogram = _histograms.get(_key(name, labels))
+        counts, total = (list(histogram[0]), histogram[1]) if histogram else ([0] * (len(LATENCY_BUCKETS) + 1), 0.0)
+
+    cumulative, buckets = 0, []
+    for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+        cumulative += count
+        buckets.append((bound, cumulative))
+    return {"count": cumulative, "sum": total, "buckets": buckets}
+
+
+def snapshot():
+    """Return all counters as {name: [{"labels": {...}, "value": n}, ...]}."""
+    result = defaultdict(list)
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            result[name].append({"labels": dict(labels), "value": value})
+    return dict(result)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render_prometheus():
+    """Return all counters, gauges and histograms in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((key, (list(counts), total)) for key, (counts, total) in _histograms.items())
+
+    lines = []
+    current = None
+    for (name, labels), value in counters:
+        if name != current:
+            lines.append(f"# TYPE {name} counter")
+            current = name
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+    for (name, labels), value in gauges:
+        if name != current:
+            lines.append(f"# TYPE {name} gauge")
+            current = name
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+    for (name, labels), (counts, total) in histograms:
+        if name != current:
+            lines.append(f"# TYPE {name} histogram")
+            current = name
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels(labels, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
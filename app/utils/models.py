@@ -0,0 +1,71 @@
+"""Which Groq model each LLM stage uses, and when to escalate to a larger one.
+
+Tool selection and city extraction answer in a handful of tokens, so they
+run on a small, fast model (STAGE_MODELS) with a max_tokens cap sized to
+the answer (STAGE_MAX_TOKENS); answers use the large model. When the small
+model's reply fails the stage's validation (an unknown tool, malformed
+JSON, a "city" that is neither in the query nor in the gazetteer), the
+call is repeated once on ESCALATION_MODEL, provided the request deadline
+still leaves the stage its minimum budget. Otherwise the caller's local
+fallback applies as usual.
+
+    city = models.with_escalation("extract_city", ask, validate)
+
+`ask(model)` makes the call (passing `**max_tokens(stage)`) and returns
+the raw reply; `validate(reply)` returns the parsed value, or None when
+the reply is unusable.
+"""
+from app.config import Config
+from app.utils import deadline, metrics
+
+
+def model_for(stage):
+    """The model configured for an LLM stage ("select", "extract_city" or "answer")."""
+    return Config.STAGE_MODELS.get(stage) or Config.DEFAULT_GROQ_MODEL
+
+
+def max_tokens(stage, items=1):
+    """Completion options capping a stage's reply length, for `items` answers in one reply."""
+    cap = Config.STAGE_MAX_TOKENS.get(stage)
+    return {"max_tokens": cap * items} if cap else {}
+
+
+def escalation_model(stage):
+    """The model to retry a stage with after a failed validation, or None."""
+    model = Config.ESCALATION_MODEL
+    if not Config.MODEL_ESCALATION_ENABLED or not model or model == model_for(stage):
+        return None
+    return model
+
+
+def _escalate(stage, model):
+    """Whether to retry `stage` on `model` (None: no escalation configured)."""
+    if model is None or not deadline.allows(stage):
+        return False
+    metrics.increment("model_escalations_total", stage=stage, model=model)
+    return True
+
+
+def with_escalation(stage, ask, validate):
+    """Ask the stage's model, then the escalation model if the reply fails validation.
+
+    Returns the validated value, or None when neither reply passes.
+    """
+    value = validate(ask(model_for(stage)))
+    if value is None:
+        model = escalation_model(stage)
+        if _escalate(stage, model):
+            value = validate(ask(model))
+    metrics.increment("model_validations_total", stage=stage, result="pass" if value is not None else "fail")
+    return value
+
+
+async def awith_escalation(stage, ask, validate):
+    """Asynchronous version of with_escalation; `ask` is a coroutine function."""
+    value = validate(await ask(model_for(stage)))
+    if value is None:
+        model = escalation_model(stage)
+        if _escalate(stage, model):
+            value = validate(await ask(model))
+    metrics.increment("model_validations_total", stage=stage, result="pass" if value is not None else "fail")
+    return value
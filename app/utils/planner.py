@@ -0,0 +1,382 @@
+"""Multi-intent queries: split a query into steps and run them as a DAG.
+
+"What's the weather in Paris and what is 17*23?" asks for two tools. The
+planner splits such a query into clauses at sentence ends (but not after
+abbreviations such as "Mr.") and at "and", "also" or "then" followed by a
+new question ("and what is ..."). Each clause is routed with the keyword
+router, and a clause is kept with the one before it when it goes to the
+same tool or follows up on it ("when was it written", "what about
+London"): splitting those would only cost extra calls and lose the
+context. Each remaining group of clauses becomes a step that is routed and
+run like a query of its own.
+
+A step that refers back to the one before it ("then multiply that by 2",
+"and what is the result in euros") depends on it. It starts once that step
+has finished, with the reference replaced by the earlier result when that
+is a number, or with the result given as context otherwise; "then"
+without a reference only orders the two steps. An LLM step without a
+subject of its own ("Is it cold in Oslo and what should I wear?") is about
+the steps before it: it waits for them and gets their results as context.
+Steps without dependencies run concurrently on a bounded pool
+(Config.PLANNER_THREADS threads, or as many tasks in the ASGI app), so a
+plan takes as long as its critical path rather than the sum of its steps.
+
+Splitting is rule-based and costs microseconds, so single-intent queries
+(nearly all of them) pay nothing extra: plan() returns one step and the
+caller runs the query as before.
+"""
+import asyncio
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app.config import Config
+from app.utils import metrics
+from app.utils.keyword_router import keyword_router
+
+
+# Words that open a new question or instruction after "and"/"also"/"then"
+OPENERS = (
+    r"what|what's|whats|how|who|whom|whose|why|when|where|which|is|are|was|were|will|would|"
+    r"does|do|did|can|could|should|tell|give|calculate|compute|solve|evaluate|explain|describe|"
+    r"define|list|name|convert|multiply|divide|add|subtract"
+)
+
+# Abbreviations whose period does not end a sentence ("Mr. Smith", "e.g. Paris")
+ABBREVIATIONS = ("mr", "mrs", "ms", "dr", "prof", "st", "mt", "jr", "sr", "vs", "etc", "e.g", "i.e", "inc", "ltd")
+NOT_ABBREVIATION = "".join(rf"(?<!\b{re.escape(abbreviation)}\.)" for abbreviation in ABBREVIATIONS)
+
+# Clause boundaries: sentence ends (a period only before a capital letter,
+# and not after an abbreviation or an initial), or a connective followed by
+# an opener. The connective is captured so "then" can mark a dependency.
+SPLIT_PATTERN = re.compile(
+    rf"(?<=[?!;])\s+|(?<=\.){NOT_ABBREVIATION}(?<!\b[a-z]\.)\s+(?-i:(?=[A-Z]))"
+    rf"|,?\s+(and\s+then|and\s+also|and|also|then)\s+(?=(?:{OPENERS})\b)",
+    re.IGNORECASE,
+)
+
+# A clause continuing the one before it: a pronoun referring back, or "what about ..."
+PRONOUN_PATTERN = re.compile(r"\b(it|its|they|them|their|theirs|he|him|his|she|her|hers|those|these)\b", re.IGNORECASE)
+FOLLOW_UP_PATTERN = re.compile(r"^(?:(?:and|also|then),?\s+)*(?:what|how)\s+about\b", re.IGNORECASE)
+
+# "Then ..."/"Also ..." opening a sentence
+LEADING_CONNECTIVE_PATTERN = re.compile(r"^(?:and\s+)?(then|also)\b,?\s*", re.IGNORECASE)
+
+# A reference to the previous step's result
+REFERENCE_PATTERN = re.compile(
+    r"\b(?:(?:the|that)\s+(?:result|answer|number|sum|product|total|value)|that)\b", re.IGNORECASE
+)
+
+NUMBER_PATTERN = re.compile(r"^\s*-?\d+(?:\.\d+)?(?:e[-+]?\d+)?\s*$", re.IGNORECASE)
+
+# A subject of a clause's own: a capitalised word after the first ("who
+# wrote Hamlet", but not "I") or a number
+SUBJECT_PATTERN = re.compile(r"\s(?!I\b)[A-Z]|\d")
+
+
+class PlanStep:
+    """One clause of a query; `depends_on` lists the indices of steps it needs first.
+
+    With `context`, the outputs of all of them are given to the step as
+    context, whether or not it refers to them.
+    """
+
+    __slots__ = ("index", "query", "depends_on", "context")
+
+    def __init__(self, index, query, depends_on=(), context=False):
+        self.index = index
+        self.query = query
+        self.depends_on = tuple(depends_on)
+        self.context = context
+
+    def resolve(self, outputs):
+        """The query to run, given the outputs of the steps it depends on."""
+        if not self.depends_on:
+            return self.query
+        if REFERENCE_PATTERN.search(self.query):
+            previous = str(outputs[self.depends_on[-1]]).strip()
+            if NUMBER_PATTERN.match(previous):
+                return REFERENCE_PATTERN.sub(previous, self.query, count=1)
+        elif not self.context:
+            # "then ..." without a reference only orders the steps
+            return self.query
+        context = "\n".join(str(outputs[index]).strip() for index in self.depends_on)
+        return f"Given that: {context}\n{self.query}"
+
+
+def _clauses(query):
+    """(start, end, connective) of each clause; `connective` is the one captured before it."""
+    clauses, start, connective = [], 0, ""
+    for match in SPLIT_PATTERN.finditer(query):
+        clauses.append((start, match.start(), connective))
+        start, connective = match.end(), (match.group(1) or "").lower()
+    clauses.append((start, len(query), connective))
+    return clauses
+
+
+def _follows_up(text, tool):
+    """Whether a clause continues the one before it ("when was it written", "what about London")."""
+    if FOLLOW_UP_PATTERN.match(text):
+        return True
+    pronouns = {pronoun.lower() for pronoun in PRONOUN_PATTERN.findall(text)}
+    if tool == "weather":
+        # Weather clauses use a dummy "it" ("is it raining in Oslo") that refers to nothing
+        pronouns.discard("it")
+    return bool(pronouns)
+
+
+def plan(query):
+    """Split a query into PlanSteps; a single step when it asks one thing (or too many)."""
+    if not Config.PLANNER_ENABLED:
+        return [PlanStep(0, query)]
+
+    text = query.strip()
+    clauses = _clauses(text)
+    if len(clauses) < 2 or any(len(text[start:end].strip()) < 3 for start, end, _ in clauses):
+        return [PlanStep(0, query)]
+
+    # Clauses for the same tool as the group before them, or following up on
+    # it, join that group: [tool, start, end, connective]
+    groups = []
+    for start, end, connective in clauses:
+        clause = text[start:end].strip()
+        tool = keyword_router.route(clause)
+        if groups and (tool == groups[-1][0] or _follows_up(clause, tool)):
+            groups[-1][2] = end
+        else:
+            groups.append([tool, start, end, connective])
+    if len(groups) < 2 or len(groups) > Config.PLANNER_MAX_STEPS:
+        return [PlanStep(0, query)]
+
+    steps = []
+    for index, (tool, start, end, connective) in enumerate(groups):
+        step_query = text[start:end].strip()
+        leading = LEADING_CONNECTIVE_PATTERN.match(step_query)
+        if leading and index > 0:
+            step_query, connective = step_query[leading.end():], connective or leading.group(1).lower()
+        if index > 0 and tool == "llm" and not SUBJECT_PATTERN.search(step_query):
+            # "what should I wear?" is about the clauses before it
+            steps.append(PlanStep(index, step_query, range(index), context=True))
+            continue
+        depends = index > 0 and ("then" in connective or REFERENCE_PATTERN.search(step_query) is not None)
+        steps.append(PlanStep(index, step_query, (index - 1,) if depends else ()))
+    metrics.increment("planned_queries_total", steps=str(len(steps)))
+    return steps
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_semaphore = None
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.PLANNER_THREADS, thread_name_prefix="plan")
+    return _executor
+
+
+def _get_semaphore():
+    global _semaphore
+
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(Config.PLANNER_THREADS)
+    return _semaphore
+
+
+def _step_result(step, query, outcome, started, finished, plan_started):
+    """Result dict for a finished step; `outcome` is (tool_key, tool_args, tier, output) or an exception."""
+    if isinstance(outcome, Exception):
+        tool_key, tool_args, tier, output = "error", {}, None, f"Error processing query: {str(outcome)}"
+    else:
+        tool_key, tool_args, tier, output = outcome
+    metrics.increment("plan_steps_total", tool=tool_key)
+    return {
+        'step': step.index,
+        'query': query,
+        'depends_on': list(step.depends_on),
+        'tool_used': tool_key,
+        'tool_args': tool_args,
+        'routing_tier': tier,
+        'result': output,
+        'started_ms': round((started - plan_started) * 1000, 1),
+        'duration_ms': round((finished - started) * 1000, 1),
+    }
+
+
+def _skipped(step, plan_started):
+    now = time.perf_counter()
+    return _step_result(step, step.query, RuntimeError(f"step {step.depends_on[-1]} failed"),
+                        now, now, plan_started)
+
+
+def run_plan(steps, run_step):
+    """Yield step result dicts as steps finish.
+
+    `run_step(query)` routes and runs one query and returns (tool_key,
+    tool_args, routing_tier, output). A step whose dependency failed is
+    reported as failed without running. Closing the generator cancels the
+    steps that have not started yet.
+    """
+    plan_started = time.perf_counter()
+    executor = _get_executor()
+    results = {}
+    running = {}
+
+    def execute(step, query):
+        started = time.perf_counter()
+        try:
+            outcome = run_step(query)
+        except Exception as e:
+            outcome = e
+        return _step_result(step, query, outcome, started, time.perf_counter(), plan_started)
+
+    waiting = list(steps)
+    try:
+        while waiting or running:
+            for step in list(waiting):
+                if any(index not in results for index in step.depends_on):
+                    continue
+                waiting.remove(step)
+                if any(results[index]['tool_used'] == "error" for index in step.depends_on):
+                    results[step.index] = _skipped(step, plan_started)
+                    yield results[step.index]
+                    continue
+                query = step.resolve({index: results[index]['result'] for index in step.depends_on})
+                running[executor.submit(contextvars.copy_context().run, execute, step, query)] = step
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[running.pop(future).index] = result
+                yield result
+    finally:
+        for future in running:
+            future.cancel()
+
+
+async def arun_plan(steps, arun_step):
+    """Asynchronous version of run_plan; `arun_step` is a coroutine function."""
+    plan_started = time.perf_counter()
+    results = {}
+    running = {}
+
+    async def execute(step, query):
+        async with _get_semaphore():
+            started = time.perf_counter()
+            try:
+                outcome = await arun_step(query)
+            except Exception as e:
+                outcome = e
+            return _step_result(step, query, outcome, started, time.perf_counter(), plan_started)
+
+    waiting = list(steps)
+    try:
+        while waiting or running:
+            for step in list(waiting):
+                if any(index not in results for index in step.depends_on):
+                    continue
+                waiting.remove(step)
+                if any(results[index]['tool_used'] == "error" for index in step.depends_on):
+                    results[step.index] = _skipped(step, plan_started)
+                    yield results[step.index]
+                    continue
+                query = step.resolve({index: results[index]['result'] for index in step.depends_on})
+                running[asyncio.ensure_future(execute(step, query))] = step
+
+            if not running:
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                results[running.pop(task).index] = result
+                yield result
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def compose(results):
+    """The final answer: each step's result under its clause, in query order."""
+    ordered = sorted(results, key=lambda result: result['step'])
+    return "\n\n".join(f"{result['query'].rstrip(' ?.')}: {str(result['result']).strip()}" for result in ordered)
+
+
+def timing(results, wall):
+    """Wall time, summed step time and critical-path time (ms) of a finished plan."""
+    finished = {}
+    for result in sorted(results, key=lambda result: result['step']):
+        ready = max((finished[index] for index in result['depends_on']), default=0.0)
+        finished[result['step']] = ready + result['duration_ms']
+    return {
+        'wall_ms': round(wall * 1000, 1),
+        'steps_ms': round(sum(result['duration_ms'] for result in results), 1),
+        'critical_path_ms': round(max(finished.values(), default=0.0), 1),
+    }
+
+
+def tools_used(results):
+    """Distinct tool keys of a plan's steps, in query order."""
+    ordered = sorted(results, key=lambda result: result['step'])
+    return list(dict.fromkeys(result['tool_used'] for result in ordered))
+
+
+def _plan_event(query, steps):
+    return 'plan', {
+        'query': query,
+        'steps': [{'step': step.index, 'query': step.query, 'depends_on': list(step.depends_on)}
+                  for step in steps]
+    }
+
+
+def _result_event(query, results, started):
+    return 'result', {
+        'query': query,
+        'tool_used': 'multi',
+        'tools_used': tools_used(results),
+        'result': compose(results),
+        'routing_tier': 'plan',
+        'steps': sorted(results, key=lambda result: result['step']),
+        **timing(results, time.perf_counter() - started),
+    }
+
+
+def stream_plan_events(query, steps, run_step):
+    """Yield (event, payload) pairs for a multi-step query.
+
+    A `plan` event lists the steps, a `step` event follows as each one
+    finishes, and a final `result` event carries the composed answer.
+    """
+    started = time.perf_counter()
+    yield _plan_event(query, steps)
+    results = []
+    generator = run_plan(steps, run_step)
+    try:
+        for result in generator:
+            results.append(result)
+            yield 'step', result
+    finally:
+        generator.close()
+    yield _result_event(query, results, started)
+
+
+async def astream_plan_events(query, steps, arun_step):
+    """Asynchronous version of stream_plan_events."""
+    started = time.perf_counter()
+    yield _plan_event(query, steps)
+    results = []
+    generator = arun_plan(steps, arun_step)
+    try:
+        async for result in generator:
+            results.append(result)
+            yield 'step', result
+    finally:
+        await generator.aclose()
+    yield _result_event(query, results, started)
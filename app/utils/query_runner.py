@@ -0,0 +1,153 @@
+"""The /query flow, shared by the Flask endpoints, the ASGI app and the job workers.
+
+The agent (app/utils/tool_selector.py) routes and runs a query when it is
+available. Without it (no GROQ_API_KEY), or when it fails for any reason
+other than admission control, the keyword router picks the tool and the
+routing tier is reported as "keyword"; a multi-intent query is still split
+by the planner, each step on the keyword router's tool, so every entry
+point answers it the same way.
+
+    response = run_query(user_query)
+    tool_key, tool_args, routing_tier = route(user_query)
+"""
+from app.tools import get_tools
+from app.utils import metrics, planner
+from app.utils.admission import Rejected, get_admission
+from app.utils.keyword_router import keyword_router
+from app.utils.tool_selector import get_agent_executor
+
+
+def agent_response(user_query, result_dict):
+    """The /query response body for a query the agent answered."""
+    # Extract the tool used from the agent's intermediate steps
+    tool_used = "agent"
+    if result_dict.get("intermediate_steps"):
+        tool_used = result_dict["intermediate_steps"][0][0].tool.lower().replace("tool", "")
+
+    response = {
+        'query': user_query,
+        'tool_used': tool_used,
+        'result': result_dict.get("output", str(result_dict)),
+        'agent_used': True,
+        'routing_tier': result_dict.get("routing_tier", "llm")
+    }
+    if "tools_used" in result_dict:
+        # Multi-intent query, answered by several tools
+        response['tool_used'] = 'multi'
+        response['tools_used'] = result_dict["tools_used"]
+    return response
+
+
+def _keyword_response(user_query, tool_used, result):
+    return {
+        'query': user_query,
+        'tool_used': tool_used,
+        'result': result,
+        'agent_used': False,
+        'routing_tier': 'keyword'
+    }
+
+
+def _keyword_plan_response(user_query, results):
+    return {
+        'query': user_query,
+        'tool_used': 'multi',
+        'tools_used': planner.tools_used(results),
+        'result': planner.compose(results),
+        'agent_used': False,
+        'routing_tier': 'plan'
+    }
+
+
+def _keyword_step(user_query):
+    """Run a query (or plan step) on the keyword router's tool; returns (tool_key, tool_args, routing_tier, output)."""
+    tool_used = keyword_router.route(user_query)
+    metrics.increment("routing_decisions_total", tier="keyword", tool=tool_used)
+    with get_admission().acquire(tool_used):
+        return tool_used, {}, 'keyword', get_tools()[tool_used]._run(user_query)
+
+
+async def _akeyword_step(user_query):
+    """Asynchronous version of _keyword_step."""
+    tool_used = keyword_router.route(user_query)
+    metrics.increment("routing_decisions_total", tier="keyword", tool=tool_used)
+    with await get_admission().aacquire(tool_used):
+        return tool_used, {}, 'keyword', await get_tools()[tool_used]._arun(user_query)
+
+
+def run_query(user_query):
+    """Route and run a query; returns the /query response body.
+
+    Raises admission.Rejected when the selected tool cannot be started.
+    """
+    agent_executor = get_agent_executor()
+    if agent_executor is not None:
+        try:
+            return agent_response(user_query, agent_executor.invoke({"input": user_query}))
+        except Rejected:
+            raise
+        except Exception as agent_error:
+            print(f"Agent error: {str(agent_error)}")
+
+    # Fallback: simple keyword-based routing
+    steps = planner.plan(user_query)
+    if len(steps) > 1:
+        return _keyword_plan_response(user_query, list(planner.run_plan(steps, _keyword_step)))
+    tool_used, _, _, result = _keyword_step(user_query)
+    return _keyword_response(user_query, tool_used, result)
+
+
+async def arun_query(user_query):
+    """Asynchronous version of run_query; tools run through their _arun."""
+    agent_executor = get_agent_executor()
+    if agent_executor is not None:
+        try:
+            return agent_response(user_query, await agent_executor.ainvoke({"input": user_query}))
+        except Rejected:
+            raise
+        except Exception as agent_error:
+            print(f"Agent error: {str(agent_error)}")
+
+    steps = planner.plan(user_query)
+    if len(steps) > 1:
+        return _keyword_plan_response(user_query, [result async for result in planner.arun_plan(steps, _akeyword_step)])
+    tool_used, _, _, result = await _akeyword_step(user_query)
+    return _keyword_response(user_query, tool_used, result)
+
+
+def route(user_query):
+    """Return (tool_key, tool_args, routing_tier) for a query."""
+    agent_executor = get_agent_executor()
+    if agent_executor is not None:
+        try:
+            return agent_executor.select_tool(user_query)
+        except Exception as agent_error:
+            print(f"Agent error: {str(agent_error)}")
+
+    return keyword_router.route(user_query), {}, 'keyword'
+
+
+async def aroute(user_query):
+    """Asynchronous version of route."""
+    agent_executor = get_agent_executor()
+    if agent_executor is not None:
+        try:
+            return await agent_executor.aselect_tool(user_query)
+        except Exception as agent_error:
+            print(f"Agent error: {str(agent_error)}")
+
+    return keyword_router.route(user_query), {}, 'keyword'
+
+
+def run_step(user_query):
+    """Route and run one step of a multi-intent query; returns (tool_key, tool_args, routing_tier, output)."""
+    tool_used, tool_args, routing_tier = route(user_query)
+    with get_admission().acquire(tool_used):
+        return tool_used, tool_args, routing_tier, get_tools()[tool_used]._run(user_query, **tool_args)
+
+
+async def arun_step(user_query):
+    """Asynchronous version of run_step."""
+    tool_used, tool_args, routing_tier = await aroute(user_query)
+    with await get_admission().aacquire(tool_used):
+        return tool_used, tool_args, routing_tier, await get_tools()[tool_used]._arun(user_query, **tool_args)
@@ -0,0 +1,67 @@
+"""Token buckets for keeping upstream calls under a quota."""
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Allow `rate` operations per second on average, with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def try_acquire(self, tokens=1, reserve=0):
+        """Take tokens if at least `reserve` would remain afterwards; never blocks."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens - tokens >= reserve:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` are available (0 if they are now)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def acquire(self, tokens=1, timeout=None):
+        """Take tokens, sleeping up to `timeout` seconds for them; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(tokens):
+            wait = self.wait_time(tokens)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    return False
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, tokens=1, timeout=None):
+        """Asynchronous version of acquire."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire(tokens):
+            wait = self.wait_time(tokens)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    return False
+            await asyncio.sleep(wait)
+        return True
@@ -0,0 +1,336 @@
+"""Semantic similarity cache for LLM answers.
+
+Queries are embedded as hashed TF-IDF vectors (stemmed content words, their
+bigrams and their character trigrams, hashed into a fixed number of buckets)
+and kept in a preallocated NumPy matrix that is searched brute force, which
+is fast for a few thousand entries. A query whose cosine similarity to a
+cached query meets the threshold gets the cached answer, so "what is the
+capital of France?" and "capital of france" share one Groq call.
+Similar queries whose numbers or negations differ never share an answer.
+
+IDF weights come from document frequencies over the cached queries and are
+applied at search time, so they never go stale. Entries expire after a TTL;
+when the cache is full the least recently used entry is replaced. With a
+path configured, vectors live in a memory-mapped file and answers in an
+append-only JSON log next to it, so the cache survives restarts. Only one
+process at a time owns the files; other workers keep their cache in memory.
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from app.config import Config
+from app.utils import metrics
+
+
+# Words that rarely change what a general-knowledge question is asking
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could did do does for from had has have how i if in is it its "
+    "me my of on or please the their there this to was were what whats when where which who whos whom "
+    "why will with would you your tell give explain describe about some another current currently "
+    "now today s".split()
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Crude suffix stripping so "italy"/"italian" and "joke"/"jokes" share a stem
+SUFFIX_PATTERN = re.compile(r"(?:ians|ian|ies|ing|ed|es|s|y|e)$")
+
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|never|none|nothing|nobody|neither|nor|without)\b|n't\b")
+
+
+def _stem(word):
+    return SUFFIX_PATTERN.sub("", word) if len(word) > 3 else word
+
+
+class HashedTfidfEmbedder:
+    """Map text to term-frequency vectors over hashed features."""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def features(self, text):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        content = [_stem(token) for token in tokens if token not in STOPWORDS] or tokens
+
+        weighted = [(word, 1.0) for word in content]
+        # Bigrams tell "flights from paris to rome" from "from rome to paris"
+        weighted.extend((f"{a} {b}", 0.5) for a, b in zip(content, content[1:]))
+        for word in content:
+            # Character trigrams give partial credit for related word forms
+            padded = f"#{word}#"
+            grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+            weighted.extend((f"#{gram}", 0.5 / len(grams)) for gram in grams)
+        return weighted
+
+    def embed(self, text):
+        import numpy
+
+        vector = numpy.zeros(self.dim, dtype=numpy.float32)
+        for feature, weight in self.features(text):
+            vector[zlib.crc32(feature.encode("utf-8")) % self.dim] += weight
+        return vector
+
+
+def _numbers(text):
+    # Questions that differ only in a number have different answers
+    return sorted(re.findall(r"\d+(?:\.\d+)?", text))
+
+
+def _negated(text):
+    # "is coffee healthy" and "is coffee not healthy" share every content
+    # word but ask opposite questions
+    return len(NEGATION_PATTERN.findall(text.lower())) % 2 == 1
+
+
+class SemanticCache:
+    """Brute-force nearest-neighbour cache of (query vector -> answer)."""
+
+    def __init__(self, threshold=0.9, max_entries=5000, dim=1024, ttl=None, path=None):
+        import numpy
+
+        self.numpy = numpy
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedder = HashedTfidfEmbedder(dim)
+        self._lock = threading.Lock()
+        self._file_lock = None
+
+        # Several workers writing the same slots would corrupt each other's
+        # entries, so the first process to lock the files owns them
+        self.path = path if path and self._lock_files(path) else None
+        if self.path:
+            self._vectors = self._open_vectors(path, max_entries, dim)
+        else:
+            self._vectors = numpy.zeros((max_entries, dim), dtype=numpy.float32)
+
+        # Squared vectors, for IDF-weighted norms without a per-query pass
+        self._squared = numpy.zeros((max_entries, dim), dtype=numpy.float32)
+        self._document_frequency = numpy.zeros(dim, dtype=numpy.float32)
+        self._expires_at = numpy.zeros(max_entries, dtype=numpy.float64)
+        self._last_used = numpy.zeros(max_entries, dtype=numpy.float64)
+        self._partitions = numpy.full(max_entries, -1, dtype=numpy.int32)
+        self._partition_ids = {}
+        self._answers = [None] * max_entries
+        self._numbers = [None] * max_entries
+        self._negations = numpy.zeros(max_entries, dtype=bool)
+        self._log = None
+
+        if self.path:
+            self._load()
+
+    def _lock_files(self, path):
+        """Take an exclusive lock on <path>.lock; False if another process holds it."""
+        if fcntl is None:
+            return True
+        lock_file = open(f"{path}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            print(f"Semantic cache files at {path} are in use by another process; "
+                  f"keeping this worker's cache in memory")
+            return False
+        self._file_lock = lock_file
+        return True
+
+    def _open_vectors(self, path, max_entries, dim):
+        """Map <path>.vectors, starting over when its shape no longer matches."""
+        numpy = self.numpy
+        vectors_path, log_path = f"{path}.vectors", f"{path}.json"
+        shape = {"max_entries": max_entries, "dim": dim}
+        size = max_entries * dim * numpy.dtype(numpy.float32).itemsize
+
+        # The first log line records the shape the vectors were written with
+        stored = None
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as log:
+                try:
+                    stored = json.loads(log.readline() or "null")
+                except ValueError:
+                    pass
+        reuse = (stored == shape and os.path.exists(vectors_path)
+                 and os.path.getsize(vectors_path) == size)
+        if not reuse:
+            if os.path.exists(log_path):
+                print(f"Semantic cache at {path} was built with a different size; starting empty")
+            with open(log_path, "w", encoding="utf-8") as log:
+                log.write(json.dumps(shape) + "\n")
+
+        return numpy.memmap(vectors_path, dtype=numpy.float32, mode="r+" if reuse else "w+",
+                            shape=(max_entries, dim))
+
+    def _partition(self, partition):
+        return self._partition_ids.setdefault(partition, len(self._partition_ids))
+
+    def _idf(self):
+        numpy = self.numpy
+        documents = max(1, int((self._partitions >= 0).sum()))
+        return numpy.log((1 + documents) / (1 + self._document_frequency)) + 1
+
+    def _clear_slot(self, slot):
+        if self._partitions[slot] >= 0:
+            self._document_frequency -= self._vectors[slot] > 0
+        self._partitions[slot] = -1
+        self._answers[slot] = None
+        self._numbers[slot] = None
+        self._negations[slot] = False
+
+    def lookup(self, partition, query):
+        """Return (found, answer) for the most similar cached query in the partition."""
+        numpy = self.numpy
+        started = time.perf_counter()
+        vector = self.embedder.embed(query)
+        numbers = _numbers(query)
+        negated = _negated(query)
+        now = time.time()
+
+        with self._lock:
+            # Only score the filled rows of this partition
+            rows = numpy.flatnonzero(
+                (self._partitions == self._partition_ids.get(partition, -2)) & (self._expires_at > now))
+            found, answer = False, None
+            if rows.size and vector.any():
+                idf_squared = self._idf() ** 2
+                query_norm = numpy.sqrt(((vector ** 2) * idf_squared).sum())
+                scores = (self._vectors[rows] @ (vector * idf_squared)) / (
+                    numpy.sqrt(self._squared[rows] @ idf_squared) * query_norm + 1e-9)
+
+                # Best few candidates; the first whose numbers and negation match wins
+                top = numpy.argpartition(scores, -5)[-5:] if scores.size > 5 else numpy.arange(scores.size)
+                for index in top[numpy.argsort(scores[top])[::-1]]:
+                    if scores[index] < self.threshold:
+                        break
+                    slot = rows[index]
+                    if self._numbers[slot] == numbers and self._negations[slot] == negated:
+                        self._last_used[slot] = now
+                        found, answer = True, self._answers[slot]
+                        break
+
+        metrics.increment("semantic_cache_requests_total", result="hit" if found else "miss")
+        metrics.increment("semantic_cache_lookup_seconds_total", amount=time.perf_counter() - started)
+        return found, answer
+
+    def store(self, partition, query, answer):
+        """Cache the answer for the query, replacing an expired or the least recently used entry."""
+        numpy = self.numpy
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return
+        now = time.time()
+
+        with self._lock:
+            free = numpy.flatnonzero((self._partitions < 0) | (self._expires_at <= now))
+            slot = int(free[0]) if free.size else int(numpy.argmin(self._last_used))
+            if not free.size:
+                metrics.increment("semantic_cache_evictions_total")
+
+            self._clear_slot(slot)
+            expires_at = now + self.ttl if self.ttl else float("inf")
+            self._put(slot, self._partition(partition), vector, answer, _numbers(query),
+                      _negated(query), expires_at, now)
+
+            if self._log is not None:
+                self._vectors.flush()
+                self._log.write(json.dumps({
+                    "slot": slot, "partition": partition, "answer": answer,
+                    "numbers": self._numbers[slot], "negated": bool(self._negations[slot]),
+                    "expires_at": expires_at,
+                }) + "\n")
+                self._log.flush()
+
+    def _put(self, slot, partition_id, vector, answer, numbers, negated, expires_at, now):
+        self._vectors[slot] = vector
+        self._squared[slot] = vector ** 2
+        self._document_frequency += vector > 0
+        self._partitions[slot] = partition_id
+        self._expires_at[slot] = expires_at
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+        self._numbers[slot] = numbers
+        self._negations[slot] = negated
+
+    def _load(self):
+        """Replay the answer log over the memory-mapped vectors, then compact it."""
+        log_path = f"{self.path}.json"
+        entries = {}
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as log:
+                log.readline()
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 0 <= entry.get("slot", -1) < self.max_entries:
+                        entries[entry["slot"]] = entry
+
+        now = time.time()
+        for slot, entry in entries.items():
+            expires_at = entry["expires_at"] if entry["expires_at"] is not None else float("inf")
+            if expires_at <= now:
+                continue
+            self._put(slot, self._partition(entry["partition"]), self.numpy.array(self._vectors[slot]),
+                      entry["answer"], entry["numbers"], entry.get("negated", False), expires_at, now)
+
+        with open(log_path, "w", encoding="utf-8") as log:
+            log.write(json.dumps({"max_entries": self.max_entries, "dim": self.embedder.dim}) + "\n")
+            for slot in map(int, self.numpy.flatnonzero(self._partitions >= 0)):
+                log.write(json.dumps({
+                    "slot": slot, "partition": entries[slot]["partition"], "answer": self._answers[slot],
+                    "numbers": self._numbers[slot], "negated": bool(self._negations[slot]),
+                    "expires_at": entries[slot]["expires_at"],
+                }) + "\n")
+        self._log = open(log_path, "a", encoding="utf-8")
+
+    def __len__(self):
+        with self._lock:
+            return int(((self._partitions >= 0) & (self._expires_at > time.time())).sum())
+
+    def stats(self):
+        hits = metrics.get_counter("semantic_cache_requests_total", result="hit")
+        misses = metrics.get_counter("semantic_cache_requests_total", result="miss")
+        lookups = hits + misses
+        return {
+            "entries": len(self),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(
+                metrics.get_counter("semantic_cache_lookup_seconds_total") / lookups * 1000, 3) if lookups else 0.0,
+            "evictions": metrics.get_counter("semantic_cache_evictions_total"),
+        }
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Return the process-wide semantic cache, or None when disabled."""
+    global _semantic_cache
+
+    if not Config.SEMANTIC_CACHE_ENABLED:
+        return None
+
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(
+                    threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+                    max_entries=Config.SEMANTIC_CACHE_MAX_ENTRIES,
+                    dim=Config.SEMANTIC_CACHE_DIM,
+                    ttl=Config.CACHE_TTLS.get("llm"),
+                    path=Config.SEMANTIC_CACHE_PATH,
+                )
+
+    return _semantic_cache
@@ -0,0 +1,140 @@
+"""Speculative tool execution while the LLM selector decides.
+
+When the local router is not confident, a query costs two serial round
+trips: the selection call, then the tool. With speculation, the keyword
+router's guess starts running as the selection call goes out. If the
+selector agrees, the tool's result is already there (or on its way); if it
+disagrees, the speculative run is cancelled (async) or left to finish and
+ignored (threaded), and the selected tool runs as usual. Agreeing means
+the same tool with the same arguments. The run starts with arguments
+extracted locally (the gazetteer city, the math expression) and the
+caller passes the selector's arguments resolved the same way, so a
+structured selection that names the same city or expression still hits.
+
+Only tools listed in SPECULATIVE_TOOLS are started speculatively. Their
+calls must be free of side effects and cheap to waste: math runs locally,
+and a weather lookup is usually served from the weather cache (otherwise it
+takes one call from the OpenWeatherMap quota).
+
+    speculation = get_speculator().start(guess, lambda: run(guess, args), args)
+    ...
+    if speculation is not None and speculation.confirm(selected, selected_args):
+        result = speculation.future.result()
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import Config
+from app.utils import metrics
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.SPECULATIVE_THREADS,
+                                               thread_name_prefix="speculate")
+    return _executor
+
+
+class Speculation:
+    """A tool run started before the selector decided; `future` is a Future or an asyncio Task."""
+
+    __slots__ = ("speculator", "tool", "args", "future", "started")
+
+    def __init__(self, speculator, tool, args=None):
+        self.speculator = speculator
+        self.tool = tool
+        self.args = args or {}
+        self.future = None
+        self.started = False
+
+    def _run(self, fn):
+        self.started = True
+        return fn()
+
+    async def _arun(self, coro_fn):
+        self.started = True
+        return await coro_fn()
+
+    def confirm(self, tool, args=None):
+        """Whether the selected `tool` and `args` are the ones being run; otherwise cancel and discard the run."""
+        hit = tool == self.tool and (args or {}) == self.args
+        if not hit and not self.future.cancel() and self.future.done():
+            # Retrieve a finished run's error so asyncio does not log it as unhandled
+            self.future.exception()
+        self.speculator.record(self.tool, hit, wasted=not hit and self.started)
+        return hit
+
+
+class Speculator:
+    """Starts speculative runs for the configured tools and counts how they turn out."""
+
+    def __init__(self, tools=()):
+        self.tools = set(tools)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def start(self, tool, fn, args=None):
+        """Run fn() (the tool with `args`) in the background if `tool` may be speculated on; returns a Speculation or None."""
+        if tool not in self.tools:
+            return None
+        speculation = Speculation(self, tool, args)
+        speculation.future = _get_executor().submit(contextvars.copy_context().run, speculation._run, fn)
+        return speculation
+
+    def astart(self, tool, coro_fn, args=None):
+        """Asynchronous version of start: runs coro_fn() as a task on the running loop."""
+        if tool not in self.tools:
+            return None
+        speculation = Speculation(self, tool, args)
+        speculation.future = asyncio.ensure_future(speculation._arun(coro_fn))
+        return speculation
+
+    def record(self, tool, hit, wasted=False):
+        metrics.increment("speculation_total", tool=tool, outcome="hit" if hit else "miss")
+        if wasted:
+            metrics.increment("speculation_wasted_calls_total", tool=tool)
+        with self._lock:
+            counts = self._counts.setdefault(tool, [0, 0, 0])
+            counts[0 if hit else 1] += 1
+            counts[2] += wasted
+
+    def stats(self):
+        with self._lock:
+            return {
+                tool: {
+                    "hits": hits,
+                    "misses": misses,
+                    "wasted_calls": wasted,
+                    "hit_rate": round(hits / (hits + misses), 3),
+                }
+                for tool, (hits, misses, wasted) in sorted(self._counts.items())
+            }
+
+
+_speculator = None
+_speculator_lock = threading.Lock()
+
+
+def get_speculator():
+    """Return the process-wide speculator (speculating on nothing unless SPECULATIVE_TOOLS is set)."""
+    global _speculator
+
+    if _speculator is None:
+        with _speculator_lock:
+            if _speculator is None:
+                _speculator = Speculator(Config.SPECULATIVE_TOOLS)
+    return _speculator
+
+
+def stats():
+    return get_speculator().stats()
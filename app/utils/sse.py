@@ -0,0 +1,11 @@
+import json
+
+
+# SSE comment line; keeps proxies from closing an idle stream and lets the
+# server notice disconnected clients while waiting on the upstream
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def format_event(event_id, event, payload):
+    """Format one server-sent event with an id, an event name and a JSON payload."""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(payload)}\n\n"
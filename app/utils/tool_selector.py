@@ -1,103 +1,501 @@
-from langchain_core.tools import StructuredTool
-from langchain_groq import ChatGroq
-from app.tools import WeatherTool, MathTool, LLMTool
+import json
+import re
+import threading
+import time
+from app.tools import get_tools
 from app.config import Config
+from app.utils import deadline, metrics, models, planner
+from app.utils.admission import get_admission
+from app.utils.circuit_breaker import OPEN, get_breaker
+from app.utils.clients import get_chat_groq
+from app.utils.coalesce import SingleFlight, MicroBatcher, AsyncMicroBatcher
+from app.utils.hedge import get_hedger
+from app.utils.keyword_router import keyword_router
+from app.utils.local_router import LocalRouter, TOOL_NAMES
+from app.utils.speculation import get_speculator
+from app.utils.tracing import traced
+
+
+STRUCTURED_TOOL_DESCRIPTIONS = """Available tools:
+- WeatherTool: For weather-related queries. Arguments: "city" (city name only) and "country" (ISO 3166 alpha-2 code, or null if unknown)
+- MathTool: For mathematical calculations. Arguments: "expression" (the calculation using only digits, + - * / ** % and parentheses, and the functions sqrt, log, sin, cos, tan if needed)
+- LLMTool: For general knowledge questions, explanations, or anything else. No arguments."""
+
+# Arguments each tool accepts from structured routing
+TOOL_ARGUMENTS = {
+    "weather": ("city", "country"),
+    "math": ("expression",),
+    "llm": (),
+}
+
+
+# Create a mock action object for compatibility
+class MockAction:
+    def __init__(self, tool_name, tool_input, tool_args=None, timing=None):
+        self.tool = tool_name
+        self.tool_input = tool_input
+        self.tool_args = tool_args or {}
+        # step, depends_on, started_ms and duration_ms of this step
+        self.timing = timing or {}
+
+
+class SimpleAgentExecutor:
+    """Tiered tool router: a local classifier first, the LLM selector as fallback."""
+
+    def __init__(self, llm, tools, local_router=None, threshold=None, routing_mode=None):
+        self.llm = llm
+        self.tools = tools
+        self.local_router = local_router or LocalRouter()
+        self.threshold = Config.LOCAL_ROUTER_THRESHOLD if threshold is None else threshold
+        self.routing_mode = routing_mode or Config.ROUTING_MODE
+
+        # Identical concurrent selections share one LLM call; with a batch
+        # window, distinct selections arriving together share one prompt
+        self._selection_flight = SingleFlight("tool_selection")
+        window = Config.SELECTOR_BATCH_WINDOW_MS / 1000
+        self._batcher = None
+        self._async_batcher = None
+        if window > 0:
+            self._batcher = MicroBatcher(
+                "tool_selection", self._select_batch_with_llm, window, Config.SELECTOR_BATCH_MAX_SIZE
+            )
+            self._async_batcher = AsyncMicroBatcher(
+                "tool_selection", self._aselect_batch_with_llm, window, Config.SELECTOR_BATCH_MAX_SIZE
+            )
+
+    def _selection_prompt(self, query):
+        if self.routing_mode == "structured":
+            return self._structured_selection_prompt(query)
+
+        return f"""You are a tool selector. Given a user query, determine which tool to use.
+Available tools:
+- WeatherTool: For weather-related queries (temperature, forecast, weather conditions in cities)
+- MathTool: For mathematical calculations (addition, subtraction, multiplication, division)
+- LLMTool: For general knowledge questions, explanations, or anything else
+
+Respond with ONLY the tool name (WeatherTool, MathTool, or LLMTool) and nothing else.
+
+User query: {query}"""
+
+    def _structured_selection_prompt(self, query):
+        return f"""You are a tool router. Given a user query, choose a tool and extract its arguments.
+{STRUCTURED_TOOL_DESCRIPTIONS}
+
+Respond with ONLY a JSON object and nothing else, for example:
+{{"tool": "WeatherTool", "args": {{"city": "Paris", "country": "FR"}}}}
+{{"tool": "MathTool", "args": {{"expression": "(2*4)+1"}}}}
+{{"tool": "LLMTool", "args": {{}}}}
+
+User query: {query}"""
+
+    def _batch_selection_prompt(self, queries):
+        numbered = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, 1))
+        return f"""You are a tool router. For each numbered user query below, choose a tool and extract its arguments.
+{STRUCTURED_TOOL_DESCRIPTIONS}
+
+Respond with ONLY a JSON array containing one object per query, in the same order, for example:
+[{{"tool": "WeatherTool", "args": {{"city": "Paris", "country": "FR"}}}}, {{"tool": "LLMTool", "args": {{}}}}]
+
+User queries:
+{numbered}"""
+
+    def _parse_batch_selection(self, content, count):
+        """Return a list of (tool_key, tool_args); raises ValueError if malformed."""
+        match = re.search(r"\[.*\]", content, re.DOTALL)
+        replies = json.loads(match.group(0)) if match else None
+        if not isinstance(replies, list) or len(replies) != count:
+            raise ValueError("Batched selection did not return one reply per query")
+        return [self._parse_reply(reply) for reply in replies]
+
+    def _parse_reply(self, reply):
+        """Return (tool_key, tool_args) from one parsed JSON reply."""
+        if not isinstance(reply, dict):
+            return "llm", {}
+
+        tool_map = {name: key for key, name in TOOL_NAMES.items()}
+        tool_key = tool_map.get(str(reply.get("tool", "")).strip(), "llm")
+        raw_args = reply.get("args") if isinstance(reply.get("args"), dict) else {}
+        tool_args = {
+            name: str(raw_args[name]).strip()
+            for name in TOOL_ARGUMENTS[tool_key]
+            if isinstance(raw_args.get(name), (str, int, float)) and str(raw_args[name]).strip()
+        }
+        return tool_key, tool_args
+
+    def _parse_selection(self, content):
+        """Return (tool_key, tool_args) from the selector's reply.
+
+        Accepts the structured JSON reply or a bare tool name; unknown or
+        malformed arguments are dropped so the tool extracts them itself.
+        """
+        # Map to our tool keys
+        tool_map = {name: key for key, name in TOOL_NAMES.items()}
+        content = content.strip()
+
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        if not match:
+            return tool_map.get(content, "llm"), {}
+
+        try:
+            return self._parse_reply(json.loads(match.group(0)))
+        except ValueError:
+            return "llm", {}
+
+    def _validate_selection(self, content):
+        """(tool_key, tool_args) if the reply names a known tool, as JSON in structured mode; else None.
+
+        Replies that fail are escalated to the larger model (app/utils/models.py).
+        """
+        tool_map = {name: key for key, name in TOOL_NAMES.items()}
+        content = content.strip()
+        if content in tool_map:
+            return tool_map[content], {}
+        if self.routing_mode != "structured":
+            return None
+
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        try:
+            reply = json.loads(match.group(0)) if match else None
+        except ValueError:
+            return None
+        if not isinstance(reply, dict) or str(reply.get("tool", "")).strip() not in tool_map:
+            return None
+        return self._parse_reply(reply)
+
+    def _selection_llm(self, model=None):
+        """The selector LLM on `model` (default the selector's), without retries when the deadline leaves no time for them."""
+        model = model or self.llm.model_name
+        retries = deadline.retries("select")
+        if model == self.llm.model_name and retries == Config.HTTP_RETRIES:
+            return self.llm
+        return get_chat_groq(model, max_retries=retries)
+
+    @traced("upstream", service="groq", operation="select")
+    def _request_selection(self, query):
+        if self._batcher is not None:
+            return self._batcher.submit(query)
+        prompt = self._selection_prompt(query)
+
+        def ask(model):
+            llm = self._selection_llm(model)
+            return get_hedger("select").call(
+                lambda: llm.invoke(prompt, timeout=deadline.timeout("select"), **models.max_tokens("select"))
+            ).content
+
+        # The small selector model first, the large one if its reply is unusable
+        return models.with_escalation("select", ask, self._validate_selection) or ("llm", {})
+
+    @traced("upstream", service="groq", operation="select")
+    async def _arequest_selection(self, query):
+        if self._async_batcher is not None:
+            return await self._async_batcher.submit(query)
+        prompt = self._selection_prompt(query)
+
+        async def ask(model):
+            llm = self._selection_llm(model)
+            return (await get_hedger("select").acall(
+                lambda: llm.ainvoke(prompt, timeout=deadline.timeout("select"), **models.max_tokens("select"))
+            )).content
+
+        return await models.awith_escalation("select", ask, self._validate_selection) or ("llm", {})
+
+    @traced("upstream", service="groq", operation="select_batch")
+    def _select_batch_with_llm(self, queries):
+        """Select tools for several queries with one LLM call.
+
+        Falls back to one (concurrent) call per query if the batched reply
+        cannot be matched up with the queries.
+        """
+        limit = models.max_tokens("select")
+        if len(queries) == 1:
+            response = self.llm.invoke(self._selection_prompt(queries[0]), **limit)
+            return [self._parse_selection(response.content)]
+
+        try:
+            response = self.llm.invoke(self._batch_selection_prompt(queries), **models.max_tokens("select", len(queries)))
+            return self._parse_batch_selection(response.content, len(queries))
+        except Exception as e:
+            print(f"Batched tool selection failed, selecting individually: {e}")
+            responses = self.llm.batch([self._selection_prompt(query) for query in queries], **limit)
+            return [self._parse_selection(response.content) for response in responses]
+
+    @traced("upstream", service="groq", operation="select_batch")
+    async def _aselect_batch_with_llm(self, queries):
+        """Asynchronous version of _select_batch_with_llm."""
+        limit = models.max_tokens("select")
+        if len(queries) == 1:
+            response = await self.llm.ainvoke(self._selection_prompt(queries[0]), **limit)
+            return [self._parse_selection(response.content)]
+
+        try:
+            response = await self.llm.ainvoke(self._batch_selection_prompt(queries), **models.max_tokens("select", len(queries)))
+            return self._parse_batch_selection(response.content, len(queries))
+        except Exception as e:
+            print(f"Batched tool selection failed, selecting individually: {e}")
+            responses = await self.llm.abatch([self._selection_prompt(query) for query in queries], **limit)
+            return [self._parse_selection(response.content) for response in responses]
+
+    def _selection_failed(self, query, error):
+        """Fallback after a failed LLM selection: keyword routing once the budget is spent
+        or Groq's circuit breaker has opened."""
+        print(f"Error selecting tool: {error}")
+        if get_breaker("groq").state == OPEN or not deadline.allows("select"):
+            return keyword_router.route(query), {}, "keyword"
+        return "llm", {}, "llm"
+
+    def _select_with_llm(self, query):
+        """Ask the LLM which tool to use; returns (tool_key, tool_args, tier)."""
+        # Get tool selection from LLM
+        try:
+            return (*self._selection_flight.do(query.strip(), lambda: self._request_selection(query)), "llm")
+        except Exception as e:
+            return self._selection_failed(query, e)
+
+    async def _aselect_with_llm(self, query):
+        """Asynchronous version of _select_with_llm."""
+        try:
+            return (*await self._selection_flight.ado(query.strip(), lambda: self._arequest_selection(query)), "llm")
+        except Exception as e:
+            return self._selection_failed(query, e)
+
+    def _local_selection(self, query):
+        """Return the local router's tool key, or None when it is not confident."""
+        tool_key, confidence = self.local_router.classify(query)
+        return tool_key if confidence >= self.threshold else None
+
+    def _resolved_args(self, tool_key, query, tool_args=None):
+        """The arguments `tool_key` would run with for the query, in comparable form.
+
+        Arguments the selector left out are extracted locally, the way the
+        tool would (the gazetteer city, the math expression); a city is
+        resolved to its gazetteer entry and an expression loses its spaces,
+        so "Paris"/"FR" and a gazetteer hit on "paris" compare equal.
+        """
+        tool_args = tool_args or {}
+        tool = get_tools()[tool_key]
+        if tool_key == "math":
+            expression = tool_args.get("expression") or tool._extract_expression(query)
+            return {"expression": expression.replace(" ", "").replace("^", "**")} if expression else {}
+        if tool_key == "weather":
+            place = tool._find_place(tool_args.get("city") or query, tool_args.get("country"))
+            if place is not None:
+                return {"city": place.name, "country": place.country}
+        return dict(tool_args)
+
+    def _record_selection(self, tool_key, tool_args, tier):
+        metrics.increment("routing_decisions_total", tier=tier, tool=tool_key)
+        return tool_key, tool_args, tier
+
+    @traced("select")
+    def _select(self, query, speculate=False):
+        """Return ((tool_key, tool_args, routing_tier), speculation); see select_tool.
+
+        With `speculate`, the keyword router's guess starts running (if it
+        is a SPECULATIVE_TOOLS tool) with locally extracted arguments while
+        the LLM selector is consulted; the caller confirms or discards the
+        returned Speculation.
+        """
+        tool_key = self._local_selection(query)
+        if tool_key is not None:
+            return self._record_selection(tool_key, {}, "local"), None
+        guess = keyword_router.route(query)
+        if not deadline.allows("select") or not get_breaker("groq").allow():
+            return self._record_selection(guess, {}, "keyword"), None
+        speculation = None
+        if speculate and guess in get_speculator().tools:
+            args = self._resolved_args(guess, query)
+            speculation = get_speculator().start(guess, lambda: self._run_tool(guess, query, args), args)
+        return self._record_selection(*self._select_with_llm(query)), speculation
+
+    @traced("select")
+    async def _aselect(self, query, speculate=False):
+        """Asynchronous version of _select."""
+        tool_key = self._local_selection(query)
+        if tool_key is not None:
+            return self._record_selection(tool_key, {}, "local"), None
+        guess = keyword_router.route(query)
+        if not deadline.allows("select") or not get_breaker("groq").allow():
+            return self._record_selection(guess, {}, "keyword"), None
+        speculation = None
+        if speculate and guess in get_speculator().tools:
+            args = self._resolved_args(guess, query)
+            speculation = get_speculator().astart(guess, lambda: self._arun_tool(guess, query, args), args)
+        return self._record_selection(*await self._aselect_with_llm(query)), speculation
+
+    def select_tool(self, query):
+        """Return (tool_key, tool_args, routing_tier) for a query.
+
+        The local router decides when its confidence reaches the threshold;
+        otherwise the LLM selector is consulted. `tool_args` holds arguments
+        the structured selector already extracted (empty for the local tier).
+        When too little of the request deadline is left for the LLM, or
+        Groq's circuit breaker is open, the keyword router decides instead.
+        """
+        return self._select(query)[0]
+
+    async def aselect_tool(self, query):
+        """Asynchronous version of select_tool."""
+        return (await self._aselect(query))[0]
+
+    def _run_tool(self, tool_key, query, tool_args):
+        # Execute the tool, skipping its own extraction when args are known
+        with get_admission().acquire(tool_key):
+            return self.tools[tool_key].func(query, **tool_args)
+
+    async def _arun_tool(self, tool_key, query, tool_args):
+        with await get_admission().aacquire(tool_key):
+            return await self.tools[tool_key].coroutine(query, **tool_args)
+
+    def _confirm_args(self, speculation, tool_key, query, tool_args):
+        # Resolving is only worth it when the tool matches
+        return self._resolved_args(tool_key, query, tool_args) if tool_key == speculation.tool else tool_args
+
+    def _run_step(self, query):
+        """Route and run one query; returns (tool_key, tool_args, routing_tier, output).
+
+        A speculative run of the keyword router's guess is used when the
+        selector agrees on the tool and its arguments resolve to the ones
+        the run was started with; otherwise the tool runs with the selected
+        arguments.
+        """
+        (tool_key, tool_args, tier), speculation = self._select(query, speculate=True)
+        if speculation is not None and speculation.confirm(tool_key, self._confirm_args(speculation, tool_key, query, tool_args)):
+            return tool_key, tool_args, tier, speculation.future.result()
+        return tool_key, tool_args, tier, self._run_tool(tool_key, query, tool_args)
+
+    async def _arun_step(self, query):
+        """Asynchronous version of _run_step."""
+        (tool_key, tool_args, tier), speculation = await self._aselect(query, speculate=True)
+        if speculation is not None and speculation.confirm(tool_key, self._confirm_args(speculation, tool_key, query, tool_args)):
+            return tool_key, tool_args, tier, await speculation.future
+        return tool_key, tool_args, tier, await self._arun_tool(tool_key, query, tool_args)
+
+    def _build_result(self, query, outcome, started):
+        tool_key, tool_args, tier, result = outcome
+        timing = {
+            "step": 0,
+            "depends_on": [],
+            "started_ms": 0.0,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        return {
+            "output": result,
+            "routing_tier": tier,
+            "intermediate_steps": [(MockAction(self.tools[tool_key].name, query, tool_args, timing), result)]
+        }
+
+    def _build_plan_result(self, results, started):
+        """Result of a multi-step query: the composed answer, one intermediate step per plan step."""
+        ordered = sorted(results, key=lambda result: result["step"])
+        steps = []
+        for result in ordered:
+            tool = self.tools.get(result["tool_used"])
+            timing = {name: result[name] for name in ("step", "depends_on", "started_ms", "duration_ms")}
+            action = MockAction(tool.name if tool is not None else "Error", result["query"], result["tool_args"], timing)
+            steps.append((action, result["result"]))
+        return {
+            "output": planner.compose(ordered),
+            "routing_tier": "plan",
+            "tools_used": planner.tools_used(ordered),
+            "intermediate_steps": steps,
+            "timing": planner.timing(ordered, time.perf_counter() - started),
+        }
+
+    @traced("agent")
+    def invoke(self, inputs):
+        """Select a tool and run it, or run each step of a multi-intent query.
+
+        `inputs` holds the query ("input"). Raises admission.Overloaded when
+        the tool of a single-step query cannot be started before the request
+        deadline; in a multi-step query the failed step reports the error.
+        """
+        query = inputs.get("input", "")
+        started = time.perf_counter()
+
+        steps = planner.plan(query)
+        if len(steps) > 1:
+            return self._build_plan_result(planner.run_plan(steps, self._run_step), started)
+        return self._build_result(query, self._run_step(query), started)
+
+    @traced("agent")
+    async def ainvoke(self, inputs):
+        """Asynchronous version of invoke; tools run through their _arun."""
+        query = inputs.get("input", "")
+        started = time.perf_counter()
+
+        steps = planner.plan(query)
+        if len(steps) > 1:
+            results = [result async for result in planner.arun_plan(steps, self._arun_step)]
+            return self._build_plan_result(results, started)
+        return self._build_result(query, await self._arun_step(query), started)
+
 
 def create_tool_selector():
     """Create a simple tool selector that routes queries intelligently using LLM."""
-    
-    # Initialize tool instances
-    weather_tool_instance = WeatherTool()
-    math_tool_instance = MathTool()
-    llm_tool_instance = LLMTool()
-    
+    from langchain_core.tools import StructuredTool
+
+    # Shared tool instances
+    shared_tools = get_tools()
+    weather_tool_instance = shared_tools["weather"]
+    math_tool_instance = shared_tools["math"]
+    llm_tool_instance = shared_tools["llm"]
+
     # Create LangChain tools using StructuredTool
     tools = {
         "weather": StructuredTool.from_function(
             func=weather_tool_instance._run,
+            coroutine=weather_tool_instance._arun,
             name="WeatherTool",
             description="Useful for getting current weather information for a specific city."
         ),
         "math": StructuredTool.from_function(
             func=math_tool_instance._run,
+            coroutine=math_tool_instance._arun,
             name="MathTool",
             description="Useful for performing basic math operations."
         ),
         "llm": StructuredTool.from_function(
             func=llm_tool_instance._run,
+            coroutine=llm_tool_instance._arun,
             name="LLMTool",
             description="Useful for answering general knowledge questions."
         )
     }
-    
+
     # Initialize the LLM for tool selection
     api_key = Config.GROQ_API_KEY
-    
+
     if not api_key or api_key == "your_groq_api_key_here":
         # Return None if no API key - fallback to keyword routing
         return None
-    
-    try:
-        llm = ChatGroq(
-            temperature=0,
-            groq_api_key=api_key,
-            model_name=Config.DEFAULT_GROQ_MODEL
-        )
-        
-        # Return a simple executor object
-        class SimpleAgentExecutor:
-            def __init__(self, llm, tools):
-                self.llm = llm
-                self.tools = tools
-            
-            def invoke(self, inputs):
-                query = inputs.get("input", "")
-                
-                # Use LLM to determine which tool to use
-                system_prompt = f"""You are a tool selector. Given a user query, determine which tool to use.
-Available tools:
-- WeatherTool: For weather-related queries (temperature, forecast, weather conditions in cities)
-- MathTool: For mathematical calculations (addition, subtraction, multiplication, division)
-- LLMTool: For general knowledge questions, explanations, or anything else
 
-Respond with ONLY the tool name (WeatherTool, MathTool, or LLMTool) and nothing else.
+    try:
+        llm = get_chat_groq(models.model_for("select"))
 
-User query: {query}"""
-                
-                # Get tool selection from LLM
-                try:
-                    response = self.llm.invoke(system_prompt)
-                    tool_name = response.content.strip()
-                except Exception as e:
-                    print(f"Error selecting tool: {e}")
-                    tool_name = "LLMTool"
-                
-                # Map to our tool keys
-                tool_map = {
-                    "WeatherTool": "weather",
-                    "MathTool": "math",
-                    "LLMTool": "llm"
-                }
-                
-                selected_tool_key = tool_map.get(tool_name, "llm")
-                selected_tool = self.tools[selected_tool_key]
-                
-                # Execute the tool
-                result = selected_tool.func(query)
-                
-                # Create a mock action object for compatibility
-                class MockAction:
-                    def __init__(self, tool_name, tool_input):
-                        self.tool = tool_name
-                        self.tool_input = tool_input
-                
-                return {
-                    "output": result,
-                    "intermediate_steps": [(MockAction(tool_name, query), result)]
-                }
-        
+        # Return a simple executor object
         return SimpleAgentExecutor(llm, tools)
-        
+
     except Exception as e:
         print(f"Error creating agent: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+_agent_executor = None
+_agent_built = False
+_agent_lock = threading.Lock()
+
+
+def get_agent_executor():
+    """Return the process-wide tool selector, built on first use (or by app.warmup).
+
+    Building it imports langchain_groq and the Groq SDK, which takes most
+    of a second, so it is kept out of module import. None without an API key.
+    """
+    global _agent_executor, _agent_built
+
+    if not _agent_built:
+        with _agent_lock:
+            if not _agent_built:
+                _agent_executor = create_tool_selector()
+                _agent_built = True
+    return _agent_executor
@@ -0,0 +1,290 @@
+"""Weather observation cache with refresh-ahead and stale-while-revalidate.
+
+Observations are stored per location: a geo bucket of rounded coordinates
+for places the gazetteer resolved, otherwise the normalized city name. An
+entry is fresh for CACHE_TTL_WEATHER seconds, after which it is still
+served (stale) for up to WEATHER_STALE_TTL while a background refresh
+fetches a new one, so callers never wait on a slow or rate-limited
+upstream when there is something to show.
+
+Locations hit at least WEATHER_HOT_HITS times since their last fetch are
+hot: a background worker refetches them once they reach WEATHER_REFRESH_AHEAD
+of their TTL, before they go stale. All OpenWeatherMap calls draw from one
+token bucket sized to the per-minute quota; background refreshes leave a
+reserve in the bucket for foreground misses.
+"""
+import asyncio
+import queue
+import threading
+import time
+
+from app.config import Config
+from app.utils import metrics
+from app.utils.cache import ResponseCache, get_response_cache
+from app.utils.coalesce import SingleFlight
+from app.utils.rate_limit import TokenBucket
+
+
+class WeatherQuotaExceeded(Exception):
+    """Raised when no OpenWeatherMap call is allowed within the wait budget."""
+
+
+class _Tracked:
+    """Per-location refresh state kept by the process that serves it."""
+
+    __slots__ = ("fetch", "hits", "fetched_at", "last_hit")
+
+    def __init__(self, fetch, fetched_at):
+        self.fetch = fetch
+        self.hits = 0
+        self.fetched_at = fetched_at
+        self.last_hit = time.time()
+
+
+class WeatherCache:
+    """Serve weather observations from cache, refreshing them in the background."""
+
+    def __init__(self, backend, ttl=600, stale_ttl=3600, refresh_ahead=0.8, hot_hits=3,
+                 quota_per_minute=60, quota_wait=2.0, refresh_reserve=0.25,
+                 refresh_interval=5.0, precision=1, max_tracked=1000):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.refresh_ahead = refresh_ahead
+        self.hot_hits = hot_hits
+        self.quota_wait = quota_wait
+        self.refresh_interval = refresh_interval
+        self.precision = precision
+        self.max_tracked = max_tracked
+        self.bucket = TokenBucket(quota_per_minute / 60.0, quota_per_minute)
+        self.reserve = quota_per_minute * refresh_reserve
+        self._flight = SingleFlight("weather")
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._revalidate = queue.Queue()
+        self._pending = set()
+        self._worker = None
+
+    def key_for(self, city, place=None):
+        """Cache key for a location: rounded coordinates when known, else the name."""
+        if place is not None:
+            return f"geo:{place.latitude:.{self.precision}f},{place.longitude:.{self.precision}f}"
+        return "city:" + ' '.join(city.lower().split())
+
+    def _read(self, key):
+        try:
+            found, entry = self.backend.get(ResponseCache.make_key("weather", key))
+        except Exception as e:
+            print(f"Weather cache read failed: {e}")
+            return None
+        return entry if found else None
+
+    def _write(self, key, data):
+        entry = {"data": data, "fetched_at": time.time()}
+        try:
+            # Kept until the stale window ends; freshness is judged on read
+            self.backend.set(ResponseCache.make_key("weather", key), entry, self.stale_ttl)
+        except Exception as e:
+            print(f"Weather cache write failed: {e}")
+        return entry
+
+    def _track(self, key, fetch, fetched_at, hit):
+        with self._lock:
+            tracked = self._tracked.get(key)
+            if tracked is None:
+                if len(self._tracked) >= self.max_tracked:
+                    return
+                tracked = self._tracked[key] = _Tracked(fetch, fetched_at)
+            tracked.fetched_at = max(tracked.fetched_at, fetched_at)
+            tracked.last_hit = time.time()
+            if hit:
+                tracked.hits += 1
+        self._ensure_worker()
+
+    def _fetch_and_store(self, key, fetch, timeout):
+        if not self.bucket.acquire(timeout=timeout):
+            metrics.increment("weather_quota_throttled_total")
+            raise WeatherQuotaExceeded("OpenWeatherMap quota reached, try again shortly")
+        metrics.increment("weather_upstream_calls_total")
+        return self._write(key, fetch())["data"]
+
+    def _classify(self, entry):
+        """Return "fresh", "stale" or "miss" for a stored entry."""
+        if entry is None:
+            return "miss"
+        return "fresh" if time.time() - entry["fetched_at"] < self.ttl else "stale"
+
+    def get(self, key, fetch):
+        """Return the observation for a location, calling fetch() only on a miss.
+
+        `fetch` returns a JSON-serializable observation and raises on errors,
+        which propagate on a miss and are never cached.
+        """
+        entry = self._read(key)
+        state = self._classify(entry)
+        metrics.increment("weather_cache_requests_total", result=state)
+
+        if state == "miss":
+            data = self._flight.do(key, lambda: self._fetch_and_store(key, fetch, self.quota_wait))
+            self._track(key, fetch, time.time(), hit=False)
+            return data
+
+        self._track(key, fetch, entry["fetched_at"], hit=True)
+        if state == "stale":
+            self._schedule_revalidation(key)
+        return entry["data"]
+
+    async def aget(self, key, afetch, fetch):
+        """Asynchronous version of get.
+
+        `afetch` is used for misses; the synchronous `fetch` is kept for
+        background refreshes, which run on the worker thread.
+        """
+        if self.backend.blocking:
+            entry = await asyncio.to_thread(self._read, key)
+        else:
+            entry = self._read(key)
+        state = self._classify(entry)
+        metrics.increment("weather_cache_requests_total", result=state)
+
+        if state == "miss":
+            async def fetch_and_store():
+                if not await self.bucket.aacquire(timeout=self.quota_wait):
+                    metrics.increment("weather_quota_throttled_total")
+                    raise WeatherQuotaExceeded("OpenWeatherMap quota reached, try again shortly")
+                metrics.increment("weather_upstream_calls_total")
+                data = await afetch()
+                if self.backend.blocking:
+                    await asyncio.to_thread(self._write, key, data)
+                else:
+                    self._write(key, data)
+                return data
+
+            data = await self._flight.ado(key, fetch_and_store)
+            self._track(key, fetch, time.time(), hit=False)
+            return data
+
+        self._track(key, fetch, entry["fetched_at"], hit=True)
+        if state == "stale":
+            self._schedule_revalidation(key)
+        return entry["data"]
+
+    def _schedule_revalidation(self, key):
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._revalidate.put(key)
+
+    def _refresh(self, key, reason):
+        with self._lock:
+            tracked = self._tracked.get(key)
+        if tracked is None:
+            return
+
+        # Skip if a request or another process sharing the backend got there first
+        entry = self._read(key)
+        if entry is not None:
+            tracked.fetched_at = max(tracked.fetched_at, entry["fetched_at"])
+            age = time.time() - entry["fetched_at"]
+            if age < (self.ttl if reason == "stale" else self.refresh_ahead * self.ttl):
+                return
+
+        # Background calls never dip into the reserve kept for foreground misses
+        if not self.bucket.try_acquire(reserve=self.reserve):
+            metrics.increment("weather_refresh_total", reason=reason, result="throttled")
+            return
+        try:
+            metrics.increment("weather_upstream_calls_total")
+            self._flight.do(key, lambda: self._write(key, tracked.fetch())["data"])
+        except Exception as e:
+            # The stale entry keeps being served until the next attempt
+            print(f"Weather refresh failed for {key}: {e}")
+            metrics.increment("weather_refresh_total", reason=reason, result="error")
+            return
+        tracked.hits = 0
+        tracked.fetched_at = time.time()
+        metrics.increment("weather_refresh_total", reason=reason, result="ok")
+
+    def _due(self):
+        """Hot locations close to expiry; forgets locations nobody asked for lately."""
+        now = time.time()
+        due = []
+        with self._lock:
+            for key, tracked in list(self._tracked.items()):
+                if now - tracked.last_hit > self.stale_ttl:
+                    del self._tracked[key]
+                elif tracked.hits >= self.hot_hits and now - tracked.fetched_at >= self.refresh_ahead * self.ttl:
+                    due.append(key)
+        return due
+
+    def _run_worker(self):
+        while True:
+            try:
+                key = self._revalidate.get(timeout=self.refresh_interval)
+                try:
+                    self._refresh(key, "stale")
+                finally:
+                    with self._lock:
+                        self._pending.discard(key)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Weather refresh worker error: {e}")
+            for key in self._due():
+                self._refresh(key, "ahead")
+
+    def _ensure_worker(self):
+        # Started on first use, i.e. in the serving process after any fork
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(
+                        target=self._run_worker, name="weather-refresh", daemon=True)
+                    self._worker.start()
+
+    def stats(self):
+        counts = {
+            state: metrics.get_counter("weather_cache_requests_total", result=state)
+            for state in ("fresh", "stale", "miss")
+        }
+        requests = sum(counts.values())
+        with self._lock:
+            hot = sum(1 for tracked in self._tracked.values() if tracked.hits >= self.hot_hits)
+            tracked = len(self._tracked)
+        return {
+            **counts,
+            "hit_rate": round((counts["fresh"] + counts["stale"]) / requests, 4) if requests else 0.0,
+            "upstream_calls": metrics.get_counter("weather_upstream_calls_total"),
+            "throttled": metrics.get_counter("weather_quota_throttled_total"),
+            "quota_tokens": round(self.bucket.available, 2),
+            "tracked_locations": tracked,
+            "hot_locations": hot,
+        }
+
+
+_weather_cache = None
+_weather_cache_lock = threading.Lock()
+
+
+def get_weather_cache():
+    """Return the process-wide weather cache, sharing the response cache backend."""
+    global _weather_cache
+
+    if _weather_cache is None:
+        with _weather_cache_lock:
+            if _weather_cache is None:
+                _weather_cache = WeatherCache(
+                    get_response_cache().backend,
+                    ttl=Config.CACHE_TTLS["weather"],
+                    stale_ttl=Config.WEATHER_STALE_TTL,
+                    refresh_ahead=Config.WEATHER_REFRESH_AHEAD,
+                    hot_hits=Config.WEATHER_HOT_HITS,
+                    quota_per_minute=Config.OPENWEATHER_QUOTA_PER_MINUTE,
+                    quota_wait=Config.WEATHER_QUOTA_WAIT,
+                    refresh_reserve=Config.WEATHER_REFRESH_RESERVE,
+                    refresh_interval=Config.WEATHER_REFRESH_INTERVAL,
+                    precision=Config.WEATHER_GEO_PRECISION,
+                )
+
+    return _weather_cache
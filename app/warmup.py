@@ -0,0 +1,48 @@
+"""Load what the first queries would otherwise wait for.
+
+Importing the app is kept light: the tools, the agent and the SDKs behind
+them (langchain_core, langchain_groq and groq, well over a second in all)
+load on first use or here. WARMUP picks when this runs:
+
+- preload (default): in the gunicorn master, once, before any worker is
+  forked. Every worker, including those forked later to scale out (TTIN)
+  or to replace one that exited, starts warm and shares the loaded code
+  copy-on-write.
+- post_fork: in each worker as it starts, keeping the master small.
+- lazy: never up front; the first query pays instead (development,
+  scripts, tests).
+
+Nothing here opens upstream connections: the pooled clients are created
+per process, after fork.
+"""
+import importlib
+import time
+
+from app.config import Config
+
+
+def warmup():
+    """Import the heavy dependencies and build the shared tools and agent; returns seconds taken."""
+    started = time.perf_counter()
+
+    from app.tools import get_tools
+    from app.utils.gazetteer import get_gazetteer
+    from app.utils.tool_selector import get_agent_executor
+
+    get_tools()
+    # Imports langchain_groq and groq when a Groq API key is configured
+    get_agent_executor()
+    # Used by the semantic cache and vectorized /math/batch
+    importlib.import_module("numpy")
+
+    # Maps the compiled city index (shared page cache across workers)
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        try:
+            gazetteer.find(Config.BREAKER_PROBE_CITY)
+        except Exception as e:
+            print(f"Gazetteer warmup failed: {e}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Warmed up in {elapsed * 1000:.0f} ms")
+    return elapsed
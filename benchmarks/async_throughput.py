@@ -0,0 +1,140 @@
+"""Concurrent-request throughput: Flask (threaded) vs. the ASGI app.
+
+Starts the upstream stand-ins, the Flask app (main.py) and the ASGI app
+(app.asgi) as subprocesses, then fires the same burst of /query requests at
+each server and reports requests per second and latency percentiles.
+
+    python -m benchmarks.async_throughput --requests 500 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def start_process(args, env, port):
+    process = subprocess.Popen(args, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_for_port(port)
+    return process
+
+
+def app_env(stub_port, extra=None):
+    env = dict(os.environ)
+    env.update({
+        "GROQ_API_KEY": "stub-key",
+        "OPENWEATHER_API_KEY": "stub-key",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "OPENWEATHER_BASE_URL": f"http://127.0.0.1:{stub_port}/data/2.5",
+        "PYTHONUNBUFFERED": "1",
+    })
+    env.update(extra or {})
+    return env
+
+
+def unique_name(number):
+    """Spell a number with letters so queries stay free of digits (and of the math tool)."""
+    return "".join(chr(ord("a") + int(digit)) for digit in str(number))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def drive(base_url, total, concurrency):
+    """Send `total` unique LLM queries with at most `concurrency` in flight."""
+    run_id = unique_name(uuid.uuid4().int % 10 ** 8)
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    # Unique queries so the response cache never answers
+                    response = await client.post("/query", json={"query": f"Who is {run_id} {unique_name(i)}?"})
+                    response.raise_for_status()
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--flask-port", type=int, default=9101)
+    parser.add_argument("--asgi-port", type=int, default=9102)
+    args = parser.parse_args()
+
+    processes = []
+    try:
+        processes.append(start_process(
+            [sys.executable, "-m", "benchmarks.stub_upstreams", "--port", str(args.stub_port),
+             "--llm-latency-ms", str(args.llm_latency_ms)],
+            dict(os.environ), args.stub_port))
+
+        servers = {
+            "flask": ([sys.executable, "main.py"], args.flask_port,
+                      app_env(args.stub_port, {"PORT": str(args.flask_port)})),
+            "asgi": ([sys.executable, "-m", "uvicorn", "app.asgi:app", "--port", str(args.asgi_port),
+                      "--log-level", "warning"], args.asgi_port, app_env(args.stub_port)),
+        }
+
+        print(f"{args.requests} requests, concurrency {args.concurrency}, "
+              f"upstream latency {args.llm_latency_ms:.0f} ms")
+        for name, (command, port, env) in servers.items():
+            processes.append(start_process(command, env, port))
+            result = asyncio.run(drive(f"http://127.0.0.1:{port}", args.requests, args.concurrency))
+            print(f"{name:>6}: {result}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Cold-start budget: how long until a fresh server, and a scaled-out worker, is ready.
+
+Launches the server the way the Dockerfile does (`python main.py`) against
+the upstream stand-ins and measures:
+
+- ready_ms: launch until GET /health answers;
+- first_query_ms / second_query_ms: one LLM, weather and math query each
+  right after that, and again, showing what is still loaded lazily;
+- worker_ready_ms: for the gunicorn modes, how long a worker added with
+  SIGTTIN (a scale-out) takes from fork until it accepts requests.
+
+Exits with status 1 when ready_ms or worker_ready_ms exceed their budget,
+so it can gate a deploy. To measure the container itself, point --command
+at it (it must pass the environment and port through):
+
+    python -m benchmarks.cold_start --mode gunicorn --workers 2
+    python -m benchmarks.cold_start --warmup lazy
+    python -m benchmarks.cold_start --command "docker run --rm --network host -e PORT=9101 \\
+        -e GROQ_BASE_URL=http://127.0.0.1:9100 ai-agent-backend"
+"""
+import argparse
+import json
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+
+from benchmarks.async_throughput import ROOT, app_env, start_process, unique_name
+
+
+QUERIES = {
+    "llm": "Who is {name}?",
+    "weather": "What's the weather in Paris?",
+    "math": "What is 12 * 7?",
+}
+
+WORKER_READY = re.compile(r"Worker ready in (\d+) ms")
+
+
+class OutputWatcher:
+    """Collects a process's output lines and lets callers wait for one."""
+
+    def __init__(self, stream):
+        self.lines = []
+        self._changed = threading.Condition()
+        threading.Thread(target=self._read, args=(stream,), daemon=True).start()
+
+    def _read(self, stream):
+        for line in iter(stream.readline, ""):
+            with self._changed:
+                self.lines.append(line.rstrip("\n"))
+                self._changed.notify_all()
+
+    def wait_for(self, pattern, start=0, timeout=30.0):
+        """Return the first match of `pattern` in lines[start:], or None after `timeout`."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                for line in self.lines[start:]:
+                    match = pattern.search(line)
+                    if match:
+                        return match
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+
+def wait_until_ready(base_url, started, timeout):
+    """Poll /health until it answers; returns milliseconds since `started`."""
+    deadline = started + timeout
+    with httpx.Client(timeout=1.0) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if client.get(f"{base_url}/health").status_code == 200:
+                    return (time.perf_counter() - started) * 1000
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def time_queries(base_url):
+    """Milliseconds for one query per tool kind."""
+    name = unique_name(uuid.uuid4().int % 10 ** 8)
+    timings = {}
+    with httpx.Client(base_url=base_url, timeout=60.0) as client:
+        for kind, query in QUERIES.items():
+            started = time.perf_counter()
+            client.post("/query", json={"query": query.format(name=name)}).raise_for_status()
+            timings[kind] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+
+def scale_out(process, output, timeout=30.0):
+    """Add a gunicorn worker with SIGTTIN; returns its fork-to-ready milliseconds."""
+    seen = len(output.lines)
+    process.send_signal(signal.SIGTTIN)
+    match = output.wait_for(WORKER_READY, seen, timeout)
+    if match is None:
+        raise RuntimeError("No worker came up after SIGTTIN")
+    return float(match.group(1))
+
+
+def measure(args):
+    stub = start_process(
+        [sys.executable, "-m", "benchmarks.stub_upstreams", "--port", str(args.stub_port)],
+        app_env(args.stub_port), args.stub_port)
+    env = app_env(args.stub_port, {
+        "PORT": str(args.port),
+        "SERVER_MODE": args.mode,
+        "WEB_CONCURRENCY": str(args.workers),
+        "WARMUP": args.warmup,
+        "FLASK_ENV": "production",
+    })
+    command = shlex.split(args.command) if args.command else [sys.executable, "main.py"]
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, text=True)
+    output = OutputWatcher(server.stdout)
+    try:
+        result = {"command": " ".join(command), "mode": args.mode, "workers": args.workers,
+                  "warmup": args.warmup}
+        result["ready_ms"] = round(wait_until_ready(base_url, started, args.timeout), 1)
+        result["first_query_ms"] = time_queries(base_url)
+        result["second_query_ms"] = time_queries(base_url)
+        # main.py execs gunicorn in place, so the launched process is the master
+        if args.mode in ("gunicorn", "asgi") and not args.command:
+            result["worker_ready_ms"] = scale_out(server, output)
+        return result
+    except Exception:
+        print("\n".join(output.lines[-30:]), file=sys.stderr)
+        raise
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        stub.terminate()
+        stub.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("gunicorn", "asgi", "werkzeug"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--warmup", choices=("preload", "post_fork", "lazy"), default="preload")
+    parser.add_argument("--command", help="launch command instead of `python main.py` (e.g. docker run ...)")
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for readiness")
+    parser.add_argument("--budget-ms", type=float, default=4000.0, help="allowed launch-to-ready time")
+    parser.add_argument("--worker-budget-ms", type=float, default=500.0,
+                        help="allowed fork-to-ready time of a scaled-out worker")
+    args = parser.parse_args()
+
+    result = measure(args)
+    print(json.dumps(result, indent=2))
+
+    over = []
+    if result["ready_ms"] > args.budget_ms:
+        over.append(f"ready in {result['ready_ms']} ms, budget {args.budget_ms:g} ms")
+    if result.get("worker_ready_ms", 0) > args.worker_budget_ms:
+        over.append(f"scaled-out worker ready in {result['worker_ready_ms']} ms, "
+                    f"budget {args.worker_budget_ms:g} ms")
+    if over:
+        print("Over budget: " + "; ".join(over), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark: gazetteer build, load time, memory footprint and lookup cost.
+
+Builds the index from the cities file, then reports how long the lazy
+mmap open takes, how much resident memory it adds compared with loading
+the same names into Python dicts, and the per-query cost of finding the
+place compared with the regex fallback. Point --source at a full GeoNames
+dump (cities15000.txt) to see how it scales:
+
+    python -m benchmarks.gazetteer --source cities15000.txt
+"""
+import argparse
+import os
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from app.config import Config
+from app.tools import WeatherTool
+from app.utils.gazetteer import Gazetteer, _read_places, build_index, normalize
+
+
+QUERIES = [
+    "What's the weather like in Jakarta today?",
+    "is it raining in paris texas",
+    "temperature in Paris, France",
+    "how is it in the sky up in bogor",
+    "weather in new york",
+    "Temperature in München",
+    "will it be sunny tomorrow somewhere nice",
+]
+
+
+def rss_kb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def per_query_us(fn, number):
+    total = min(timeit.repeat(lambda: [fn(query) for query in QUERIES], number=number, repeat=3))
+    return total / (number * len(QUERIES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=Config.GAZETTEER_SOURCE)
+    parser.add_argument("--number", type=int, default=2000, help="passes over the query set")
+    args = parser.parse_args()
+
+    index_path = os.path.join(tempfile.mkdtemp(), "cities.idx")
+    started = time.perf_counter()
+    places, keys = build_index(args.source, index_path)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"build:        {places} places, {keys} names, {os.path.getsize(index_path) / 1024:.0f} KiB "
+          f"index in {build_ms:.0f} ms")
+
+    gazetteer = Gazetteer(args.source, index_path, Config.GAZETTEER_COUNTRIES)
+    rss_before = rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    gazetteer.find("warm up")
+    open_ms = (time.perf_counter() - started) * 1000
+    heap_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    print(f"lazy open:    {open_ms:.2f} ms, +{rss_kb() - rss_before} KiB RSS, {heap_kb:.0f} KiB Python heap")
+
+    # The same names held in Python dicts, for comparison
+    rss_before = rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    names = {}
+    for name, aliases, latitude, longitude, country, population in _read_places(args.source):
+        for alias in aliases:
+            names.setdefault(" ".join(normalize(alias)), []).append((name, country, latitude, longitude, population))
+    dict_ms = (time.perf_counter() - started) * 1000
+    heap_kb = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    print(f"dict load:    {dict_ms:.2f} ms, +{rss_kb() - rss_before} KiB RSS, {heap_kb:.0f} KiB Python heap")
+    print()
+
+    tool = WeatherTool()
+    print(f"{'query':<45} {'gazetteer':<28} {'regex fallback'}")
+    for query in QUERIES:
+        place = gazetteer.find(query)
+        found = f"{place.name}, {place.country}" if place else "-"
+        print(f"{query:<45} {found:<28} {tool._extract_city_local(query)}")
+    print()
+
+    print(f"{'Gazetteer.find':<30} {per_query_us(gazetteer.find, args.number):8.2f} us/query")
+    print(f"{'WeatherTool regex fallback':<30} {per_query_us(tool._extract_city_local, args.number):8.2f} us/query")
+
+
+if __name__ == "__main__":
+    main()
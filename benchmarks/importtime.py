@@ -0,0 +1,105 @@
+"""Profile what importing the app costs, module by module.
+
+Runs `python -X importtime -c "import <target>"` in fresh interpreters and
+reports the median total import time, the packages whose modules take
+longest to import (summed over the package) and the slowest modules:
+
+    python -m benchmarks.importtime                  # main (Flask app)
+    python -m benchmarks.importtime --target app.asgi
+    python -m benchmarks.importtime --target app.warmup --call warmup
+
+With --call, the named function of the target module is run after the
+import (e.g. the warmup, to see what it loads). Use it to check that a
+change keeps heavy SDKs out of the import path.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.async_throughput import ROOT
+
+
+def parse_importtime(stderr):
+    """Return {module: self_us} from -X importtime output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        modules[name.strip()] = int(self_us)
+    return modules
+
+
+def profile(target, call=None, env=None):
+    """Import `target` in a fresh interpreter; returns (wall_seconds, modules)."""
+    code = f"import {target}"
+    if call:
+        code += f"; {target}.{call}()"
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{result.stderr[-2000:]}")
+    return wall, parse_importtime(result.stderr)
+
+
+def summarize(runs, top):
+    """Median wall time, per-package and per-module import times over several runs."""
+    walls = [wall for wall, _ in runs]
+    names = set().union(*(modules for _, modules in runs))
+    medians = {name: statistics.median(modules.get(name, 0) for _, modules in runs) for name in names}
+
+    packages = {}
+    for name, self_us in medians.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    def largest(times):
+        ordered = sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {name: round(us / 1000, 1) for name, us in ordered}
+
+    return {
+        "wall_ms": round(statistics.median(walls) * 1000, 1),
+        "modules": len(names),
+        "import_ms": round(sum(medians.values()) / 1000, 1),
+        "packages_ms": largest(packages),
+        "modules_ms": largest(medians),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", default="main", help="module to import")
+    parser.add_argument("--call", help="function of the target module to run after importing it")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to import in")
+    parser.add_argument("--top", type=int, default=15, help="modules to list")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    # The first run also warms the OS file cache and writes bytecode
+    profile(args.target, args.call, env)
+    summary = summarize([profile(args.target, args.call, env) for _ in range(args.runs)], args.top)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    label = args.target + (f".{args.call}()" if args.call else "")
+    print(f"{label}: {summary['wall_ms']} ms wall, {summary['import_ms']} ms importing "
+          f"{summary['modules']} modules (median of {args.runs})")
+    print("\nSlowest packages (ms, all their modules):")
+    for name, ms in summary["packages_ms"].items():
+        print(f"  {ms:>8.1f}  {name}")
+    print("\nSlowest modules (ms, excluding their imports):")
+    for name, ms in summary["modules_ms"].items():
+        print(f"  {ms:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
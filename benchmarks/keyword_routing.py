@@ -0,0 +1,74 @@
+"""Microbenchmark: per-query cost of the keyword router.
+
+Compares the original inline routing block (substring scans plus a fresh
+tool instance per request) with the precompiled KeywordRouter and the
+shared tool instances, and shows the LocalRouter classifier for reference.
+Run with:
+
+    python -m benchmarks.keyword_routing --number 20000
+"""
+import argparse
+import re
+import timeit
+
+from app.tools import WeatherTool, MathTool, LLMTool, get_tools
+from app.utils.keyword_router import keyword_router
+from app.utils.local_router import LocalRouter
+
+
+QUERIES = [
+    "What's the weather like in Jakarta today?",
+    "What is 15 + 25?",
+    "Calculate 12 x 3",
+    "Explain how photosynthesis works in a few sentences",
+    "Tell me the next big thing in renewable energy research",
+    "Is it cloudy in London?",
+]
+
+LEGACY_TOOLS = {"weather": WeatherTool, "math": MathTool, "llm": LLMTool}
+
+
+def legacy_route(user_query):
+    """The keyword block formerly inlined in the query and streaming endpoints."""
+    query_lower = user_query.lower()
+
+    if any(keyword in query_lower for keyword in ["weather", "temperature", "rain", "sunny", "cloudy", "hot", "cold"]):
+        return "weather"
+    elif any(op in query_lower for op in ["+", "-", "*", "x", "/", "multiply", "divide", "add", "subtract", "what is"]):
+        if re.search(r'\d', query_lower):
+            return "math"
+    return "llm"
+
+
+def per_query_us(fn, number):
+    total = min(timeit.repeat(lambda: [fn(query) for query in QUERIES], number=number, repeat=3))
+    return total / (number * len(QUERIES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="passes over the query set")
+    args = parser.parse_args()
+
+    tools = get_tools()
+    local_router = LocalRouter()
+
+    print(f"{'query':<58} {'legacy':>8} {'keyword':>8}")
+    for query in QUERIES:
+        print(f"{query:<58} {legacy_route(query):>8} {keyword_router.route(query):>8}")
+    print()
+
+    cases = [
+        ("legacy route", legacy_route),
+        ("legacy route + new tool instance", lambda q: LEGACY_TOOLS[legacy_route(q)]()),
+        ("KeywordRouter.route", keyword_router.route),
+        ("KeywordRouter.route + shared tool", lambda q: tools[keyword_router.route(q)]),
+        ("LocalRouter.classify (reference)", local_router.classify),
+    ]
+    for label, fn in cases:
+        number = args.number if "classify" not in label and "instance" not in label else args.number // 20
+        print(f"{label:<40} {per_query_us(fn, number):8.2f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Load test for the serving modes selectable with SERVER_MODE.
+
+Starts the upstream stand-ins, then for each mode runs main.py and drives
+it with a burst of /query requests plus a set of concurrent SocketIO
+clients. Prints throughput and latency percentiles per mode:
+
+    python -m benchmarks.load_test --modes werkzeug gunicorn asgi --workers 4
+
+The asgi mode serves no SocketIO, so only /query is driven there.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from benchmarks.async_throughput import app_env, drive, percentile, start_process, unique_name
+
+
+def drive_socketio(base_url, clients, queries_per_client, make_query=None):
+    """Each client sends queries over a websocket and waits for each result event.
+
+    `make_query(client, i)` returns the query text; by default every query is
+    a unique LLM question. Time to first byte is the delay until the first
+    event (usually `routing`) arrives for a query.
+    """
+    import socketio
+
+    make_query = make_query or (lambda number, i: f"Who is {unique_name(number)} {unique_name(i)}?")
+    latencies = []
+    first_events = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client(number):
+        nonlocal errors
+        sio = socketio.Client()
+        done = threading.Event()
+        first = []
+
+        def on_event(event, *payload):
+            if not first:
+                first.append(time.perf_counter())
+            if event in ('result', 'error'):
+                done.set()
+
+        sio.on('*', on_event)
+        try:
+            sio.connect(base_url, transports=['websocket'])
+            for i in range(queries_per_client):
+                done.clear()
+                first.clear()
+                started = time.perf_counter()
+                sio.emit('query', {'query': make_query(number, i)})
+                if not done.wait(60):
+                    raise TimeoutError("no result event")
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+                    first_events.append(first[0] - started)
+        except Exception:
+            with lock:
+                errors += 1
+        finally:
+            sio.disconnect()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "clients": clients,
+        "queries": len(latencies),
+        "errors": errors,
+        "qps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "ttfb_p50_ms": round(percentile(first_events, 0.50) * 1000, 1),
+        "ttfb_p95_ms": round(percentile(first_events, 0.95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["werkzeug", "gunicorn", "asgi"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--socket-clients", type=int, default=50)
+    parser.add_argument("--socket-queries", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--port", type=int, default=9110)
+    args = parser.parse_args()
+
+    stub = start_process(
+        [sys.executable, "-m", "benchmarks.stub_upstreams", "--port", str(args.stub_port),
+         "--llm-latency-ms", str(args.llm_latency_ms)],
+        dict(os.environ), args.stub_port)
+
+    print(f"{args.requests} /query requests at concurrency {args.concurrency}, "
+          f"{args.socket_clients} SocketIO clients x {args.socket_queries} queries, "
+          f"{args.workers} workers, upstream latency {args.llm_latency_ms:.0f} ms")
+    try:
+        for mode in args.modes:
+            env = app_env(args.stub_port, {
+                "PORT": str(args.port),
+                "SERVER_MODE": mode,
+                "WEB_CONCURRENCY": str(args.workers),
+                "FLASK_ENV": "production",
+            })
+            server = start_process([sys.executable, "main.py"], env, args.port)
+            try:
+                base_url = f"http://127.0.0.1:{args.port}"
+                print(f"{mode:>9} /query:    {asyncio.run(drive(base_url, args.requests, args.concurrency))}")
+                if mode != "asgi":
+                    result = drive_socketio(base_url, args.socket_clients, args.socket_queries)
+                    print(f"{mode:>9} socketio:  {result}")
+            finally:
+                # SIGTERM: gunicorn drains in-flight requests before exiting
+                server.terminate()
+                server.wait(timeout=60)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
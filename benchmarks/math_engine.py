@@ -0,0 +1,94 @@
+"""Microbenchmark: compiled math engine vs the original AST-walking evaluator.
+
+Compares, per expression:
+
+- legacy: ast.parse plus a recursive walk on every call (the evaluator
+  MathTool used before app/utils/math_engine.py)
+- compile: math_engine.compile_expression with its cache cleared (cold)
+- cached: math_engine.evaluate on an already-compiled expression
+
+and, for one expression over many values, a Python loop against the
+vectorized evaluate_array pass. Run with:
+
+    python -m benchmarks.math_engine --number 20000
+"""
+import argparse
+import ast
+import operator
+import timeit
+
+from app.utils import math_engine
+
+
+EXPRESSIONS = [
+    "2+3",
+    "(15+25)*2-10/5",
+    "2**10+3**4-(7%3)*11",
+    "((1.5+2.25)*(3-0.5))/(4+6*(2-1))**2",
+]
+
+
+def legacy_safe_eval(expression):
+    """The evaluator MathTool used before the compiled engine."""
+    operators = {
+        ast.Add: operator.add,
+        ast.Sub: operator.sub,
+        ast.Mult: operator.mul,
+        ast.Div: operator.truediv,
+        ast.Pow: operator.pow,
+        ast.Mod: operator.mod,
+        ast.FloorDiv: operator.floordiv,
+        ast.UAdd: operator.pos,
+        ast.USub: operator.neg,
+    }
+
+    def eval_node(node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        elif isinstance(node, ast.BinOp):
+            return operators[type(node.op)](eval_node(node.left), eval_node(node.right))
+        elif isinstance(node, ast.UnaryOp):
+            return operators[type(node.op)](eval_node(node.operand))
+        raise ValueError(f"Unsupported operation: {type(node).__name__}")
+
+    return eval_node(ast.parse(expression, mode='eval').body)
+
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def cold_compile(expression):
+    math_engine.compile_expression.cache_clear()
+    return math_engine.compile_expression(expression).evaluate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per measurement")
+    parser.add_argument("--values", type=int, default=100000, help="array size for the vectorized case")
+    args = parser.parse_args()
+
+    print(f"{'expression':<40} {'legacy us':>10} {'compile us':>11} {'cached us':>10} {'speedup':>8}")
+    for expression in EXPRESSIONS:
+        assert abs(legacy_safe_eval(expression) - math_engine.evaluate(expression)) < 1e-9
+
+        legacy = per_call_us(lambda: legacy_safe_eval(expression), args.number)
+        compiled = per_call_us(lambda: cold_compile(expression), args.number // 10)
+        cached = per_call_us(lambda: math_engine.evaluate(expression), args.number)
+        print(f"{expression:<40} {legacy:>10.2f} {compiled:>11.2f} {cached:>10.2f} {legacy / cached:>7.1f}x")
+
+    expression = "sqrt(x)*log(x+1)+sin(x)**2"
+    compiled = math_engine.compile_expression(expression, ("x",))
+    values = [float(i) for i in range(1, args.values + 1)]
+
+    loop_ms = min(timeit.repeat(lambda: [compiled.evaluate(x=x) for x in values], number=1, repeat=3)) * 1000
+    vector_ms = min(timeit.repeat(lambda: compiled.evaluate_array(x=values), number=1, repeat=3)) * 1000
+    print()
+    print(f"{expression} over {args.values} values:")
+    print(f"  per-value loop {loop_ms:8.1f} ms")
+    print(f"  vectorized     {vector_ms:8.1f} ms ({loop_ms / vector_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Offline eval: tool-selection accuracy vs. latency per model.
+
+Sends the selector prompt for every query in a labelled file (one JSON
+object per line: "query", the expected "tool", and for weather queries
+the expected "city") to each model, and reports per model:
+
+- accuracy: share of queries routed to the expected tool;
+- valid: share of replies that pass the selector's validation (the rest
+  would be escalated);
+- city: share of weather queries whose extracted city matches (structured
+  routing mode only);
+- p50/p95/mean latency of the selection call.
+
+The "policy" row runs the configured policy: the selector model, escalating
+to ESCALATION_MODEL when a reply fails validation (app/utils/models.py).
+The "local" row is the in-process router on its own, for reference.
+
+Runs against Groq with GROQ_API_KEY, or against the stand-ins with --stub:
+
+    python -m benchmarks.routing_eval --models llama-3.1-8b-instant llama-3.3-70b-versatile
+    python -m benchmarks.routing_eval --stub --stub-args "--model-latency-ms llama-3.1-8b-instant=80"
+"""
+import argparse
+import json
+import os
+import shlex
+import statistics
+import sys
+import time
+
+from benchmarks.async_throughput import ROOT, app_env, percentile, start_process
+
+
+def load_cases(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(cases, select, repeat=1):
+    """Run select(query) -> (tool_key, tool_args, valid) over the cases; returns the summary row."""
+    latencies, correct, valid, cities, city_correct = [], 0, 0, 0, 0
+    for _ in range(repeat):
+        for case in cases:
+            started = time.perf_counter()
+            tool_key, tool_args, passed = select(case["query"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            correct += tool_key == case["tool"]
+            valid += passed
+            if case.get("city") and tool_key == "weather" and "city" in tool_args:
+                cities += 1
+                city_correct += tool_args["city"].split(",")[0].strip().lower() == case["city"].lower()
+
+    total = len(cases) * repeat
+    return {
+        "accuracy": round(correct / total, 3),
+        "valid": round(valid / total, 3),
+        "city": round(city_correct / cities, 3) if cities else None,
+        "p50_ms": round(percentile(latencies, 0.5), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+    }
+
+
+def model_selector(executor, model):
+    """select() for one model: the selector prompt, no escalation."""
+    from app.utils import models
+    from app.utils.clients import get_chat_groq
+
+    llm = get_chat_groq(model)
+
+    def select(query):
+        content = llm.invoke(executor._selection_prompt(query), **models.max_tokens("select")).content
+        selection = executor._validate_selection(content)
+        if selection is None:
+            return (*executor._parse_selection(content), False)
+        return (*selection, True)
+    return select
+
+
+def policy_selector(executor):
+    """select() for the configured policy: selector model, escalating on failed validation."""
+    from app.utils import metrics
+
+    def select(query):
+        before = _escalations(metrics)
+        tool_key, tool_args = executor._request_selection(query)
+        # "valid" here: answered without escalating
+        return tool_key, tool_args, _escalations(metrics) == before
+    return select
+
+
+def _escalations(metrics):
+    return sum(item["value"] for item in metrics.snapshot().get("model_escalations_total", [])
+               if item["labels"].get("stage") == "select")
+
+
+def local_selector(router):
+    def select(query):
+        tool_key, confidence = router.classify(query)
+        return tool_key, {}, True
+    return select
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join(ROOT, "benchmarks", "routing_eval.jsonl"))
+    parser.add_argument("--models", nargs="+", help="models to compare (default: selector and escalation models)")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the queries")
+    parser.add_argument("--stub", action="store_true", help="run against the local stand-ins")
+    parser.add_argument("--stub-args", default="", help="extra stub_upstreams flags")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        stub = start_process(
+            [sys.executable, "-m", "benchmarks.stub_upstreams", "--port", str(args.stub_port),
+             *shlex.split(args.stub_args)],
+            dict(os.environ), args.stub_port)
+        os.environ.update(app_env(args.stub_port))
+
+    # Imported after the environment is set: Config reads it at import
+    from app.config import Config
+    from app.utils.local_router import LocalRouter
+    from app.utils.tool_selector import get_agent_executor
+
+    try:
+        executor = get_agent_executor()
+        if executor is None:
+            parser.error("GROQ_API_KEY is not set (or use --stub)")
+
+        cases = load_cases(args.data)
+        names = args.models or list(dict.fromkeys([Config.STAGE_MODELS["select"], Config.ESCALATION_MODEL]))
+        results = {}
+        for name in names:
+            results[name] = evaluate(cases, model_selector(executor, name), args.repeat)
+        results["policy"] = evaluate(cases, policy_selector(executor), args.repeat)
+        results["local"] = evaluate(cases, local_selector(LocalRouter()), args.repeat)
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    print(f"{len(cases)} queries x {args.repeat}, routing mode {Config.ROUTING_MODE}")
+    print(f"{'model':<28} {'accuracy':>8} {'valid':>6} {'city':>6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, row in results.items():
+        city = f"{row['city']:.3f}" if row["city"] is not None else "-"
+        print(f"{name:<28} {row['accuracy']:>8.3f} {row['valid']:>6.3f} {city:>6} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['mean_ms']:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"data": args.data, "repeat": args.repeat, "routing_mode": Config.ROUTING_MODE,
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
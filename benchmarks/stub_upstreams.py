@@ -0,0 +1,317 @@
+"""Local stand-ins for the Groq and OpenWeatherMap APIs.
+
+Emulates the Groq (OpenAI-compatible) chat completions endpoint and the
+OpenWeatherMap current-weather endpoint with configurable latency and error
+distributions, so the app can be benchmarked without network access or API
+quota. Latency is drawn around each base value (per model and API key, if
+configured) from a uniform, normal or lognormal (long-tailed) distribution;
+a fraction of calls can fail with 429 or 500, or stall for a while before
+answering. Each API key can get a per-minute request limit, reported in
+Groq's x-ratelimit-* headers. Point the app at it with:
+
+    GROQ_BASE_URL=http://127.0.0.1:9100
+    OPENWEATHER_BASE_URL=http://127.0.0.1:9100/data/2.5
+
+Run standalone with:
+
+    python -m benchmarks.stub_upstreams --port 9100 --llm-latency-ms 300 \
+        --latency-distribution lognormal --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+
+DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+
+class StubSettings:
+    """Latency (milliseconds) and error-rate knobs shared by the handlers."""
+
+    llm_latency_ms = 300.0
+    model_latency_ms = ""    # per-model overrides of llm_latency_ms: "model=ms,model=ms"
+    key_latency_ms = ""      # extra latency per API key: "key=ms,key=ms"
+    key_rate_limit = 0       # requests per minute per API key, with Groq's x-ratelimit-* headers (0: unlimited)
+    token_latency_ms = 15.0
+    weather_latency_ms = 80.0
+    latency_distribution = "uniform"
+    jitter_ms = 20.0         # uniform: +/- jitter_ms; normal: standard deviation
+    latency_sigma = 0.5      # lognormal: sigma of log(latency), median is the base value
+    error_rate = 0.0         # fraction of calls answered with 429 and Retry-After
+    server_error_rate = 0.0  # fraction of calls answered with 500
+    stall_rate = 0.0         # fraction of calls delayed by an extra stall_ms
+    stall_ms = 5000.0
+
+
+def _delay(base_ms):
+    distribution = StubSettings.latency_distribution
+    if distribution == "fixed":
+        delay = base_ms
+    elif distribution == "normal":
+        delay = random.gauss(base_ms, StubSettings.jitter_ms)
+    elif distribution == "lognormal":
+        delay = base_ms * random.lognormvariate(0.0, StubSettings.latency_sigma)
+    else:
+        delay = base_ms + random.uniform(-StubSettings.jitter_ms, StubSettings.jitter_ms)
+    return max(0.0, delay) / 1000.0
+
+
+async def _upstream_delay(base_ms):
+    delay = _delay(base_ms)
+    if random.random() < StubSettings.stall_rate:
+        delay += StubSettings.stall_ms / 1000.0
+    await asyncio.sleep(delay)
+
+
+def _injected_error():
+    """Return the status code (429 or 500) for a call chosen to fail, else None."""
+    roll = random.random()
+    if roll < StubSettings.error_rate:
+        return 429
+    if roll < StubSettings.error_rate + StubSettings.server_error_rate:
+        return 500
+    return None
+
+
+def _route(query):
+    if any(word in query for word in ("weather", "temperature", "rain", "sunny")):
+        return "WeatherTool", {"city": "Paris", "country": "FR"}
+    if any(char.isdigit() for char in query):
+        return "MathTool", {"expression": "".join(c for c in query if c in "0123456789+-*/().")}
+    return "LLMTool", {}
+
+
+def _completion_text(prompt):
+    """Return a plausible answer for the prompts the app sends."""
+    lowered = prompt.lower()
+
+    if "for each numbered user query" in lowered:
+        lines = lowered.rsplit("user queries:", 1)[-1].strip().splitlines()
+        queries = [line.split(". ", 1)[-1] for line in lines if line.strip()]
+        return json.dumps([{"tool": tool, "args": args} for tool, args in map(_route, queries)])
+
+    if "you are a tool selector" in lowered or "you are a tool router" in lowered:
+        tool, args = _route(lowered.rsplit("user query:", 1)[-1])
+        if "you are a tool router" in lowered:
+            return json.dumps({"tool": tool, "args": args})
+        return tool
+
+    if "extract only the city name" in lowered:
+        return "Paris, France"
+
+    return "This is a stub answer from the local Groq stand-in."
+
+
+def _setting_for(setting, name):
+    """The value for `name` in a "name=ms,name=ms" setting, or None."""
+    for entry in setting.split(","):
+        key, _, value = entry.partition("=")
+        if key.strip() == name and value:
+            return float(value)
+    return None
+
+
+def _llm_latency(model, api_key):
+    """Base latency for a model and key: its model_latency_ms entry (else llm_latency_ms) plus key_latency_ms."""
+    latency = _setting_for(StubSettings.model_latency_ms, model)
+    if latency is None:
+        latency = StubSettings.llm_latency_ms
+    return latency + (_setting_for(StubSettings.key_latency_ms, api_key) or 0.0)
+
+
+_key_windows = {}
+
+
+def _rate_limit_headers(api_key):
+    """Count a call against the key's one-minute window; returns (headers, over_limit)."""
+    limit = StubSettings.key_rate_limit
+    if not limit:
+        return {}, False
+    now = time.monotonic()
+    window = _key_windows.get(api_key)
+    if window is None or now - window[0] >= 60.0:
+        window = _key_windows[api_key] = [now, 0]
+    window[1] += 1
+    reset = f"{60.0 - (now - window[0]):.2f}s"
+    headers = {
+        "x-ratelimit-limit-requests": str(limit),
+        "x-ratelimit-remaining-requests": str(max(0, limit - window[1])),
+        "x-ratelimit-reset-requests": reset,
+    }
+    if window[1] > limit:
+        headers["retry-after"] = str(int(60.0 - (now - window[0])) + 1)
+        return headers, True
+    return headers, False
+
+
+async def chat_completions(request):
+    body = await request.json()
+    api_key = request.headers.get("authorization", "").removeprefix("Bearer ")
+    headers, over_limit = _rate_limit_headers(api_key)
+    if over_limit:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached for requests", "type": "requests"}},
+            status_code=429,
+            headers=headers,
+        )
+    await _upstream_delay(_llm_latency(body.get("model"), api_key))
+
+    error = _injected_error()
+    if error == 429:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after": "1"},
+        )
+    if error is not None:
+        return JSONResponse(
+            {"error": {"message": "Internal server error", "type": "internal_server_error"}},
+            status_code=500,
+        )
+
+    prompt = body["messages"][-1]["content"]
+    if body.get("stream"):
+        return StreamingResponse(_stream_completion(body, _completion_text(prompt)),
+                                 media_type="text/event-stream", headers=headers)
+
+    return JSONResponse({
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": _completion_text(prompt)},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+    }, headers=headers)
+
+
+async def list_models(request):
+    """Model list, used by the app's circuit breaker to probe for recovery."""
+    error = _injected_error()
+    if error is not None:
+        return JSONResponse({"error": {"message": "Unavailable"}}, status_code=error)
+    return JSONResponse({"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+
+
+async def _stream_completion(body, text):
+    """Emit the answer word by word as OpenAI-style chat.completion.chunk events."""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    words = text.split(" ")
+
+    for index, word in enumerate(words):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub-model"),
+            "choices": [{
+                "index": 0,
+                "delta": {"content": word if index == 0 else f" {word}"},
+                "finish_reason": "stop" if index == len(words) - 1 else None,
+            }],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(_delay(StubSettings.token_latency_ms))
+
+    yield "data: [DONE]\n\n"
+
+
+async def current_weather(request):
+    await _upstream_delay(StubSettings.weather_latency_ms)
+
+    error = _injected_error()
+    if error is not None:
+        message = "rate limit exceeded" if error == 429 else "internal error"
+        return JSONResponse({"cod": error, "message": message}, status_code=error)
+
+    params = request.query_params
+    if "lat" in params:
+        city = f"Station {float(params['lat']):.2f},{float(params['lon']):.2f}"
+    else:
+        city = params.get("q", "Paris").split(",")[0].strip().title()
+    return JSONResponse({
+        "name": city,
+        "main": {"temp": 21.5},
+        "weather": [{"description": "clear sky"}],
+        "cod": 200,
+    })
+
+
+app = Starlette(routes=[
+    Route('/openai/v1/chat/completions', chat_completions, methods=['POST']),
+    Route('/openai/v1/models', list_models, methods=['GET']),
+    Route('/data/2.5/weather', current_weather, methods=['GET']),
+])
+
+
+def add_arguments(parser):
+    """Add the StubSettings knobs to an argument parser."""
+    parser.add_argument("--llm-latency-ms", type=float, default=StubSettings.llm_latency_ms)
+    parser.add_argument("--model-latency-ms", default=StubSettings.model_latency_ms,
+                        help="per-model LLM latency, e.g. llama-3.1-8b-instant=80,llama-3.3-70b-versatile=300")
+    parser.add_argument("--key-latency-ms", default=StubSettings.key_latency_ms,
+                        help="extra LLM latency per API key, e.g. key-a=0,key-b=200")
+    parser.add_argument("--key-rate-limit", type=int, default=StubSettings.key_rate_limit,
+                        help="LLM requests per minute per API key (0: unlimited)")
+    parser.add_argument("--token-latency-ms", type=float, default=StubSettings.token_latency_ms)
+    parser.add_argument("--weather-latency-ms", type=float, default=StubSettings.weather_latency_ms)
+    parser.add_argument("--latency-distribution", choices=DISTRIBUTIONS,
+                        default=StubSettings.latency_distribution)
+    parser.add_argument("--jitter-ms", type=float, default=StubSettings.jitter_ms)
+    parser.add_argument("--latency-sigma", type=float, default=StubSettings.latency_sigma)
+    parser.add_argument("--error-rate", type=float, default=StubSettings.error_rate,
+                        help="fraction of upstream calls answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=StubSettings.server_error_rate,
+                        help="fraction of upstream calls answered with 500")
+    parser.add_argument("--stall-rate", type=float, default=StubSettings.stall_rate)
+    parser.add_argument("--stall-ms", type=float, default=StubSettings.stall_ms)
+
+
+SETTINGS = ("llm_latency_ms", "model_latency_ms", "key_latency_ms", "key_rate_limit", "token_latency_ms", "weather_latency_ms", "latency_distribution",
+            "jitter_ms", "latency_sigma", "error_rate", "server_error_rate", "stall_rate",
+            "stall_ms")
+
+
+def settings_from(args):
+    """Return {setting: value} for the StubSettings knobs in parsed arguments."""
+    return {name: getattr(args, name) for name in SETTINGS}
+
+
+def command_line(settings):
+    """Command-line flags reproducing `settings` (as returned by settings_from)."""
+    flags = []
+    for name, value in settings.items():
+        flags += ["--" + name.replace("_", "-"), str(value)]
+    return flags
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--seed", type=int, help="seed for latency and error draws")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    for name, value in settings_from(args).items():
+        setattr(StubSettings, name, value)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+"""Reproducible benchmark suite: load tests against stub upstreams plus microbenchmarks.
+
+Starts the upstream stand-ins (benchmarks/stub_upstreams.py) with the given
+latency and error distributions, runs main.py in one SERVER_MODE against
+them and drives /query, /query_enhanced, /stream and the SocketIO `query`
+event in turn. For each endpoint it reports requests per second, latency
+percentiles, time to first byte and, for /stream, time to the first token
+event, along with the memory and CPU used by every server process. The
+microbenchmarks time MathTool's expression extraction and evaluation and
+the routers in-process.
+
+Results are written as JSON (with the commit, settings and machine), so
+runs can be compared across commits:
+
+    python -m benchmarks.suite --mode gunicorn --workers 4 --output before.json
+    git checkout my-branch
+    python -m benchmarks.suite --mode gunicorn --workers 4 --output after.json --compare before.json
+    python -m benchmarks.suite --compare before.json after.json   # compare without running
+
+Query mixes are generated from --seed, so two runs send the same queries.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import timeit
+import uuid
+
+import httpx
+
+from benchmarks import stub_upstreams
+from benchmarks.async_throughput import ROOT, app_env, percentile, start_process, unique_name
+
+
+ENDPOINTS = ("query", "query_enhanced", "stream", "socketio")
+MIXES = ("llm", "weather", "math", "mixed")
+
+CITIES = ["Paris", "London", "Tokyo", "Jakarta", "New York", "Berlin", "Sydney", "Cairo",
+          "Toronto", "Mumbai", "Madrid", "Seoul", "Lagos", "Lima", "Rome", "Oslo"]
+
+# Higher is better for these result fields; lower for everything else compared
+HIGHER_IS_BETTER = ("rps", "qps")
+
+
+class QueryMix:
+    """Deterministic query generator for one run.
+
+    LLM questions are unique per run (spelled with letters, so they never
+    route to the math tool) and therefore always miss the response cache;
+    weather questions cycle through a few cities and mostly hit it.
+    """
+
+    def __init__(self, mix, seed):
+        self.mix = mix
+        self.seed = seed
+        self.run_id = unique_name(uuid.uuid4().int % 10 ** 8)
+
+    def query(self, number):
+        rng = random.Random(f"{self.seed}:{number}")
+        kind = self.mix
+        if kind == "mixed":
+            kind = rng.choices(("llm", "weather", "math"), weights=(6, 2, 2))[0]
+
+        if kind == "weather":
+            return f"What's the weather like in {rng.choice(CITIES)}?"
+        if kind == "math":
+            a, b, c = rng.randint(1, 999), rng.randint(1, 99), rng.randint(2, 9)
+            return f"What is ({a} + {b}) * {c}?"
+        return f"Who is {self.run_id} {unique_name(number)}?"
+
+
+class ProcessSampler:
+    """Samples RSS and CPU time of a process and its children from /proc.
+
+    Linux only; elsewhere the resource section of the results stays empty.
+    """
+
+    def __init__(self, root_pid, interval=0.25):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.available = os.path.isdir(f"/proc/{root_pid}")
+        self._peaks = {}
+        self._rss_samples = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._start_cpu = {}
+
+    def _tree(self):
+        """PIDs of the root process and all its descendants."""
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as handle:
+                    fields = handle.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            children.setdefault(int(fields[1]), []).append(int(entry))
+
+        pids, pending = [], [self.root_pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, ()))
+        return pids
+
+    def _read(self, pid):
+        """Return (rss bytes, cpu seconds) for a process, or None if it is gone."""
+        try:
+            with open(f"/proc/{pid}/stat") as handle:
+                fields = handle.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/statm") as handle:
+                resident = int(handle.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            return None
+        # utime and stime are fields 14 and 15 of stat; fields[0] here is field 3
+        cpu = (int(fields[11]) + int(fields[12])) / self.ticks
+        return resident * self.page_size, cpu
+
+    def _sample(self):
+        sample = {}
+        for pid in self._tree():
+            reading = self._read(pid)
+            if reading is not None:
+                sample[pid] = reading
+                self._peaks[pid] = max(self._peaks.get(pid, 0), reading[0])
+                self._rss_samples.setdefault(pid, []).append(reading[0])
+        return sample
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if not self.available:
+            return
+        self._peaks, self._rss_samples = {}, {}
+        self._start_cpu = {pid: cpu for pid, (_, cpu) in self._sample().items()}
+        self._started = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling; return per-process RSS and CPU use since start()."""
+        if not self.available:
+            return []
+        self._stop.set()
+        self._thread.join()
+        final = self._sample()
+        elapsed = time.perf_counter() - self._started
+
+        processes = []
+        for pid, (rss, cpu) in sorted(final.items()):
+            cpu_seconds = cpu - self._start_cpu.get(pid, 0.0)
+            samples = self._rss_samples.get(pid, [rss])
+            processes.append({
+                "pid": pid,
+                "role": "master" if pid == self.root_pid else "worker",
+                "rss_mb": round(rss / 2 ** 20, 1),
+                "rss_avg_mb": round(sum(samples) / len(samples) / 2 ** 20, 1),
+                "rss_peak_mb": round(self._peaks.get(pid, rss) / 2 ** 20, 1),
+                "cpu_seconds": round(cpu_seconds, 2),
+                "cpu_percent": round(cpu_seconds / elapsed * 100, 1) if elapsed else 0.0,
+            })
+        return processes
+
+
+def _summary(total, elapsed, latencies, first_bytes, statuses, errors):
+    result = {
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+    }
+    for name, values in (("", latencies), ("ttfb_", first_bytes)):
+        for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+            result[f"{name}{label}_ms"] = round(percentile(values, fraction) * 1000, 1)
+    return result
+
+
+async def drive_http(base_url, path, mix, total, concurrency):
+    """POST `total` queries to `path` with at most `concurrency` in flight.
+
+    Time to first byte is measured to the first body chunk. For /stream the
+    time to the first `token` (or, for tools, `result`) event is reported
+    as well.
+    """
+    latencies, first_bytes, first_tokens = [], [], []
+    statuses = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                first_byte = first_token = None
+                try:
+                    async with client.stream("POST", path, json={"query": mix.query(i)}) as response:
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                        async for chunk in response.aiter_bytes():
+                            now = time.perf_counter()
+                            if first_byte is None:
+                                first_byte = now
+                            if first_token is None and (b"event: token" in chunk or b"event: result" in chunk):
+                                first_token = now
+                        if response.status_code >= 400:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                finished = time.perf_counter()
+                latencies.append(finished - started)
+                first_bytes.append((first_byte or finished) - started)
+                if first_token is not None:
+                    first_tokens.append(first_token - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    result = _summary(total, elapsed, latencies, first_bytes, statuses, errors)
+    if path == "/stream":
+        result["first_token_p50_ms"] = round(percentile(first_tokens, 0.50) * 1000, 1)
+        result["first_token_p95_ms"] = round(percentile(first_tokens, 0.95) * 1000, 1)
+    return result
+
+
+def _per_call_us(fn, number):
+    return round(min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6, 3)
+
+
+def micro_benchmarks(number):
+    """Time the in-process hot paths; returns {name: microseconds per call}."""
+    from app.tools import get_tools
+    from app.utils import math_engine
+    from app.utils.keyword_router import keyword_router
+    from app.utils.local_router import LocalRouter
+    from benchmarks.keyword_routing import QUERIES
+    from benchmarks.math_engine import EXPRESSIONS, legacy_safe_eval
+
+    math_tool = get_tools()["math"]
+    local_router = LocalRouter()
+    math_queries = ["What is 15 + 25?", "Calculate 12 x 3", "What is (15 + 25) * 2 - 10 / 5?",
+                    "square root of 144 plus 2 to the power of 3"]
+
+    def over(items, fn):
+        return lambda: [fn(item) for item in items]
+
+    def cold_compile(expression):
+        math_engine.compile_expression.cache_clear()
+        return math_engine.compile_expression(expression).evaluate()
+
+    cases = {
+        "math.extract_expression": (over(math_queries, math_tool._extract_expression), len(math_queries), number),
+        "math.legacy_safe_eval": (over(EXPRESSIONS, legacy_safe_eval), len(EXPRESSIONS), number),
+        "math.compile_cold": (over(EXPRESSIONS, cold_compile), len(EXPRESSIONS), max(1, number // 10)),
+        "math.evaluate_cached": (over(EXPRESSIONS, math_engine.evaluate), len(EXPRESSIONS), number),
+        "math.tool_run": (over(math_queries, math_tool._run), len(math_queries), max(1, number // 10)),
+        "routing.keyword": (over(QUERIES, keyword_router.route), len(QUERIES), number),
+        "routing.local_classify": (over(QUERIES, local_router.classify), len(QUERIES), max(1, number // 20)),
+    }
+    return {name: round(_per_call_us(fn, calls) / size, 3) for name, (fn, size, calls) in cases.items()}
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(args, stub_settings):
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mode": args.mode,
+        "workers": args.workers,
+        "endpoints": args.endpoints,
+        "mix": args.mix,
+        "seed": args.seed,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "socket_clients": args.socket_clients,
+        "socket_queries": args.socket_queries,
+        "app_env": dict(args.app_env),
+        "stub": stub_settings,
+    }
+
+
+def run_load(args, stub_settings):
+    """Start the stub and the app, drive every endpoint; returns (load, resources)."""
+    from benchmarks.load_test import drive_socketio
+
+    stub = start_process(
+        [sys.executable, "-m", "benchmarks.stub_upstreams", "--port", str(args.stub_port),
+         "--seed", str(args.seed), *stub_upstreams.command_line(stub_settings)],
+        dict(os.environ), args.stub_port)
+
+    load, resources = {}, {}
+    try:
+        env = app_env(args.stub_port, {
+            "PORT": str(args.port),
+            "SERVER_MODE": args.mode,
+            "WEB_CONCURRENCY": str(args.workers),
+            "FLASK_ENV": "production",
+            # Unique LLM questions must reach the stub rather than a similar cached answer
+            "SEMANTIC_CACHE_ENABLED": "false",
+            **dict(args.app_env),
+        })
+        server = start_process([sys.executable, "main.py"], env, args.port)
+        sampler = ProcessSampler(server.pid)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            for endpoint in args.endpoints:
+                # A fresh mix per endpoint so LLM questions never repeat across endpoints
+                mix = QueryMix(args.mix, args.seed)
+                if endpoint == "socketio" and args.mode == "asgi":
+                    print(f"{endpoint:>15}: skipped (the asgi mode serves no SocketIO)")
+                    continue
+
+                if args.warmup:
+                    asyncio.run(drive_http(base_url, "/query", QueryMix(args.mix, args.seed),
+                                           args.warmup, min(args.warmup, args.concurrency)))
+
+                sampler.start()
+                if endpoint == "socketio":
+                    result = drive_socketio(base_url, args.socket_clients, args.socket_queries,
+                                            lambda client, i: mix.query(client * args.socket_queries + i))
+                else:
+                    result = asyncio.run(drive_http(base_url, "/" + endpoint, mix,
+                                                    args.requests, args.concurrency))
+                resources[endpoint] = sampler.stop()
+                if resources[endpoint]:
+                    result["server_rss_peak_mb"] = round(sum(p["rss_peak_mb"] for p in resources[endpoint]), 1)
+                    result["server_cpu_seconds"] = round(sum(p["cpu_seconds"] for p in resources[endpoint]), 2)
+                load[endpoint] = result
+                print(f"{endpoint:>15}: {result}")
+        finally:
+            # SIGTERM: gunicorn drains in-flight requests before exiting
+            server.terminate()
+            server.wait(timeout=60)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=10)
+
+    return load, resources
+
+
+def _compare_values(baseline, current, prefix=""):
+    """Yield (name, old, new) for every numeric field present in both results."""
+    for key, value in current.items():
+        if key in ("statuses", "requests", "clients", "queries"):
+            continue
+        old = baseline.get(key)
+        name = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(old, dict):
+            yield from _compare_values(old, value, name + ".")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and not isinstance(value, bool):
+            yield name, old, value
+
+
+def compare(baseline, current, threshold=0.05):
+    """Print the change of every load and micro result between two runs.
+
+    Changes beyond `threshold` are flagged as better or worse; throughput
+    is better when higher, latencies and per-call times when lower.
+    """
+    print(f"baseline {str(baseline['meta'].get('commit'))[:12]} ({baseline['meta'].get('timestamp')})"
+          f" -> current {str(current['meta'].get('commit'))[:12]} ({current['meta'].get('timestamp')})")
+    for section in ("load", "micro"):
+        rows = list(_compare_values(baseline.get(section, {}), current.get(section, {})))
+        if not rows:
+            continue
+        print(f"\n{section}:")
+        for name, old, new in rows:
+            change = (new - old) / old if old else 0.0
+            higher_is_better = name.split(".")[-1] in HIGHER_IS_BETTER
+            flag = ""
+            if abs(change) >= threshold:
+                flag = "better" if (change > 0) == higher_is_better else "WORSE"
+            print(f"  {name:<40} {old:>12} {new:>12} {change * 100:>+8.1f}%  {flag}")
+
+
+def _env_pair(value):
+    name, sep, setting = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE")
+    return name, setting
+
+
+def _load(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", default="gunicorn", choices=["werkzeug", "gunicorn", "asgi"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--mix", choices=MIXES, default="mixed")
+    parser.add_argument("--seed", type=int, default=1, help="seeds the query mix and the stub's draws")
+    parser.add_argument("--requests", type=int, default=500, help="requests per HTTP endpoint")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--socket-clients", type=int, default=50)
+    parser.add_argument("--socket-queries", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=20, help="untimed /query requests before each endpoint")
+    parser.add_argument("--app-env", type=_env_pair, action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the app (repeatable)")
+    parser.add_argument("--micro-number", type=int, default=5000, help="calls per microbenchmark (0 to skip)")
+    parser.add_argument("--no-load", action="store_true", help="only run the microbenchmarks")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--port", type=int, default=9120)
+    parser.add_argument("--output", help="result file (default benchmarks/results/<commit>-<mode>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT",
+                        help="baseline result to compare this run with; with two files, compare them and exit")
+    parser.add_argument("--threshold", type=float, default=0.05, help="relative change flagged by --compare")
+    stub_upstreams.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        compare(_load(args.compare[0]), _load(args.compare[1]), args.threshold)
+        return
+
+    stub_settings = stub_upstreams.settings_from(args)
+    results = {"meta": run_metadata(args, stub_settings), "load": {}, "resources": {}, "micro": {}}
+
+    if not args.no_load:
+        print(f"{args.mode} x{args.workers}, {args.mix} queries, {args.requests} requests per endpoint "
+              f"at concurrency {args.concurrency}, upstream {args.latency_distribution} "
+              f"{args.llm_latency_ms:.0f} ms")
+        results["load"], results["resources"] = run_load(args, stub_settings)
+
+    if args.micro_number > 0:
+        results["micro"] = micro_benchmarks(args.micro_number)
+        for name, value in results["micro"].items():
+            print(f"{name:>25}: {value:10.3f} us/call")
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"{(results['meta']['commit'] or 'unknown')[:12]}-{args.mode}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        print()
+        compare(_load(args.compare[0]), results, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
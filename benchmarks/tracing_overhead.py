@@ -0,0 +1,56 @@
+"""Microbenchmark: per-span cost of the instrumentation in app/utils/tracing.py.
+
+    python -m benchmarks.tracing_overhead --number 200000
+"""
+import argparse
+import asyncio
+import time
+import timeit
+
+from app.utils import tracing
+
+
+def per_call_us(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    def bare():
+        pass
+
+    @tracing.traced("tool", tool="benchmark")
+    def decorated():
+        pass
+
+    def with_span():
+        with tracing.span("upstream", service="benchmark", operation="noop"):
+            pass
+
+    @tracing.traced("tool", tool="benchmark_async")
+    async def decorated_async():
+        pass
+
+    async def run_async(number):
+        started = time.perf_counter()
+        for _ in range(number):
+            await decorated_async()
+        return (time.perf_counter() - started) / number * 1e6
+
+    baseline = per_call_us(bare, args.number)
+    print(f"{'plain call':<40} {baseline:6.2f} us")
+    print(f"{'@traced call':<40} {per_call_us(decorated, args.number) - baseline:6.2f} us overhead")
+    print(f"{'with span(...)':<40} {per_call_us(with_span, args.number) - baseline:6.2f} us overhead")
+    print(f"{'@traced coroutine (incl. await)':<40} {asyncio.run(run_async(args.number)):6.2f} us")
+
+    # Collect Server-Timing entries as an instrumented request would
+    token = tracing._timings.set([])
+    print(f"{'with span(...), Server-Timing on':<40} {per_call_us(with_span, args.number // 10) - baseline:6.2f} us overhead")
+    tracing._timings.reset(token)
+
+
+if __name__ == "__main__":
+    main()
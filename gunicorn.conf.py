@@ -0,0 +1,65 @@
+"""Gunicorn settings for the production serving modes (see main.py).
+
+The app is preloaded and, with WARMUP=preload, the master also loads the
+agent, tools and SDKs (app/warmup.py) before forking, so they are built
+once and shared copy-on-write by the workers; a worker forked later, e.g.
+after TTIN, is ready in milliseconds (a gevent worker adds ~0.2s for its
+monkey-patching). Pooled upstream connections are dropped after fork so no
+socket is shared between processes. SIGTERM stops accepting connections and
+lets in-flight requests finish for up to WEB_GRACEFUL_TIMEOUT seconds.
+"""
+import os
+import time
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+
+if worker_class == 'gevent':
+    # Patch sockets and ssl before the app is preloaded, so clients created
+    # at import time are cooperative. Threads, select and signals are left to
+    # the worker (which patches everything after fork): patching them here
+    # stops the master from handling SIGTERM, and httpcore imports trio, when
+    # installed, which needs select.epoll at import
+    from gevent import monkey
+    monkey.patch_all(thread=False, select=False, signal=False)
+    import httpcore  # noqa: F401
+
+from app.config import Config  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = Config.WEB_CONCURRENCY
+worker_connections = Config.WEB_WORKER_CONNECTIONS
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+keepalive = Config.WEB_KEEPALIVE
+preload_app = True
+accesslog = '-'
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded, before the first fork
+    if Config.JOBS_BACKEND == 'memory' and server.num_workers > 1:
+        server.log.error(
+            "JOBS_BACKEND=memory with %d workers: a job lives only in the worker that took it, "
+            "so GET /jobs/<id> answers 404 whenever another worker serves it. "
+            "Set JOBS_BACKEND=redis (or REDIS_URL), or WEB_CONCURRENCY=1", server.num_workers)
+    if Config.WARMUP == 'preload':
+        from app.warmup import warmup
+        warmup()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.monotonic()
+    from app.utils.clients import reset_clients
+    reset_clients()
+
+
+def post_worker_init(worker):
+    if Config.WARMUP == 'post_fork':
+        from app.warmup import warmup
+        warmup()
+    worker.log.info("Worker ready in %.0f ms", (time.monotonic() - worker.forked_at) * 1000)
+
+
+def worker_exit(server, worker):
+    from app.utils.clients import close_clients
+    close_clients()
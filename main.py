@@ -1,5 +1,6 @@
 from app import create_app
 import os
+import sys
 from app.config import Config
 
 # Load environment variables
@@ -12,17 +13,35 @@ if missing_keys:
     print(f"Warning: Missing or invalid API keys: {', '.join(missing_keys)}")
     print("Please update the .env file with your API keys.")
 
+
+def serve_with_gunicorn(target, worker_class):
+    """Replace this process with a gunicorn master serving `target` (see gunicorn.conf.py)."""
+    os.environ['WEB_WORKER_CLASS'] = worker_class
+    os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', target])
+
+
+# Check if running in development or production
+is_development = os.environ.get('FLASK_ENV', 'production') == 'development'
+
+if __name__ == '__main__' and not is_development:
+    # Hand over before building the app: the gunicorn master imports it itself
+    if Config.SERVER_MODE == 'gunicorn':
+        serve_with_gunicorn('main:app', Config.WEB_WORKER_CLASS)
+    elif Config.SERVER_MODE == 'asgi':
+        serve_with_gunicorn('app.asgi:app', 'uvicorn.workers.UvicornWorker')
+
 # Create the Flask app and SocketIO instance
 app, socketio = create_app()
 
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    # Check if running in development or production
-    import os
-    is_development = os.environ.get('FLASK_ENV', 'production') == 'development'
     
     if is_development:
-        socketio.run(app, host='0.0.0', port=port, debug=True)
+        socketio.run(app, host='0.0.0.0', port=port, debug=True)
     else:
-        # For production, allow unsafe Werkzeug
-        socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
+        # Single-process development server (gunicorn warms up in gunicorn.conf.py)
+        if Config.WARMUP != 'lazy':
+            from app.warmup import warmup
+            warmup()
+        socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True)
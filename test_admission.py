@@ -0,0 +1,20 @@
+from app.utils import admission
+from app.utils.admission import client_key
+
+
+def test_client_key_only_trusts_listed_api_keys(monkeypatch):
+    monkeypatch.setattr(admission.Config, "ADMISSION_API_KEYS", {"known"})
+    monkeypatch.setattr(admission.Config, "ADMISSION_TRUST_FORWARDED", False)
+
+    assert client_key({"X-API-Key": "known"}, "10.0.0.1") == "key:known"
+    assert client_key({"Authorization": "Bearer known"}, "10.0.0.1") == "key:known"
+    # Made-up keys share the bucket of their IP
+    assert client_key({"X-API-Key": "random-1"}, "10.0.0.1") == "ip:10.0.0.1"
+    assert client_key({"Authorization": "Bearer random-2"}, "10.0.0.1") == "ip:10.0.0.1"
+    assert client_key({"X-Forwarded-For": "1.2.3.4"}, "10.0.0.1") == "ip:10.0.0.1"
+
+
+def test_client_key_uses_forwarded_address_behind_a_proxy(monkeypatch):
+    monkeypatch.setattr(admission.Config, "ADMISSION_API_KEYS", set())
+    monkeypatch.setattr(admission.Config, "ADMISSION_TRUST_FORWARDED", True)
+    assert client_key({"X-API-Key": "known", "X-Forwarded-For": "1.2.3.4, 10.0.0.2"}, "10.0.0.1") == "ip:1.2.3.4"
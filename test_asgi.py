@@ -0,0 +1,13 @@
+from starlette.testclient import TestClient
+
+from app import create_app
+from app.asgi import app as asgi_app
+
+
+def test_stats_matches_the_flask_endpoint():
+    flask_app, _ = create_app()
+    flask_stats = flask_app.test_client().get('/stats').get_json()
+
+    response = TestClient(asgi_app).get('/stats')
+    assert response.status_code == 200
+    assert set(response.json()) == set(flask_stats)
@@ -0,0 +1,44 @@
+import time
+
+from app import create_app
+from app.endpoints import query
+from app.utils import batch, deadline
+from app.utils.admission import AdmissionController
+
+
+class DeadlineTool:
+    def _run(self, query):
+        return deadline.remaining()
+
+
+def test_batch_queries_keep_the_request_deadline():
+    with deadline.scope(time.monotonic() + 5):
+        results = list(batch.run_batch(["a", "b"], lambda query: ("llm", {}, "keyword"), {"llm": DeadlineTool()}))
+    assert [result['routing_tier'] for result in results] == ["keyword", "keyword"]
+    assert all(0 < result['result'] <= 5 for result in results)
+
+
+def test_validate_queries(monkeypatch):
+    monkeypatch.setattr(batch.Config, "QUERY_BATCH_MAX_QUERIES", 2)
+    assert batch.validate_queries({"queries": ["a", "b"]}) == (["a", "b"], None)
+    for body in [None, {}, {"queries": []}, {"queries": "a"}, {"queries": ["a", 1]}, {"queries": ["a", "b", "c"]}]:
+        queries, error = batch.validate_queries(body)
+        assert queries is None and error
+
+
+def test_batches_are_charged_per_query(monkeypatch):
+    admission = AdmissionController({}, client_rate=0.001, client_burst=3)
+    monkeypatch.setattr(query, "get_admission", lambda: admission)
+    monkeypatch.setattr(query.batch, "run_batch", lambda *args: iter(()))
+    app, _ = create_app()
+    client = app.test_client()
+
+    assert client.post('/query/batch', json={'queries': ['a', 'b']}).status_code == 200
+    # One request left in the bucket, so the next two-query batch is turned away
+    response = client.post('/query/batch/stream', json={'queries': ['a', 'b']})
+    assert response.status_code == 429
+    assert response.headers['Retry-After']
+    # A batch larger than the burst costs the whole burst
+    admission._buckets.clear()
+    assert client.post('/query/batch', json={'queries': ['a'] * 10}).status_code == 200
+    assert client.post('/query/batch', json={'queries': ['a']}).status_code == 429
@@ -0,0 +1,118 @@
+import json
+
+import httpx
+
+from app.utils import jobs, query_runner
+from app.utils.jobs import Config
+
+
+def test_create_job():
+    job, error = jobs.create_job({"query": "What is 2*21?"})
+    assert error is None
+    assert job["status"] == "queued"
+    assert job["deadline"] - job["created_at"] == Config.JOBS_TIMEOUT
+    assert job["expires_at"] == job["deadline"] + Config.JOBS_TTL
+    assert "callback_url" not in jobs.public(job)
+
+
+def test_create_job_rejects_bad_bodies(monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_MAX_QUERY_CHARS", 10)
+    for body in [None, [], {}, {"query": ""}, {"query": "   "}, {"query": 42}, {"query": "x" * 11}]:
+        job, error = jobs.create_job(body)
+        assert job is None and error
+
+
+def test_create_job_timeout_is_clamped(monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_TIMEOUT", 300)
+    monkeypatch.setattr(Config, "JOBS_TIMEOUT_MAX", 900)
+    for timeout, expected in [(60, 60), (5000, 900), (-1, 300), ("soon", 300), (float("nan"), 300)]:
+        job, _ = jobs.create_job({"query": "hi", "timeout": timeout})
+        assert job["deadline"] - job["created_at"] == expected
+
+
+def test_callbacks_to_internal_addresses_are_refused(monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_CALLBACK_HOSTS", set())
+    for url in ["http://127.0.0.1:8000/hook", "http://169.254.169.254/latest/meta-data", "http://10.0.0.5/",
+                "http://[::1]/", "http://[::ffff:127.0.0.1]/", "http://localhost:5000/", "ftp://example.com/",
+                "not a url"]:
+        job, error = jobs.create_job({"query": "hi", "callback_url": url})
+        assert job is None and error
+
+    job, error = jobs.create_job({"query": "hi", "callback_url": "https://203.0.114.7/hook"})
+    assert error is None and job["callback_url"] == "https://203.0.114.7/hook"
+
+
+def test_callback_allowlist(monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_CALLBACK_HOSTS", {"127.0.0.1"})
+    assert jobs.create_job({"query": "hi", "callback_url": "http://127.0.0.1:9000/hook"})[1] is None
+    assert jobs.create_job({"query": "hi", "callback_url": "https://example.com/hook"})[1]
+
+
+def test_callback_goes_to_the_checked_address(monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_CALLBACK_HOSTS", set())
+    monkeypatch.setattr(Config, "JOBS_CALLBACK_RETRIES", 0)
+    answers = [[(0, 0, 0, "", ("93.184.215.14", 0))]]
+    monkeypatch.setattr(jobs.socket, "getaddrinfo", lambda host, port: answers[-1])
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(jobs, "get_webhook_client", lambda: httpx.Client(transport=httpx.MockTransport(handler)))
+    job, _ = jobs.create_job({"query": "hi", "callback_url": "https://hooks.example.com:8443/done?x=1"})
+
+    assert jobs.deliver_callback(job)
+    request = requests[0]
+    assert str(request.url) == "https://93.184.215.14:8443/done?x=1"
+    assert request.headers["host"] == "hooks.example.com:8443"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+
+    # The name now resolves to an internal address (DNS rebinding)
+    answers.append([(0, 0, 0, "", ("127.0.0.1", 0))])
+    assert not jobs.deliver_callback(job)
+    assert len(requests) == 1
+
+
+def test_limit_result_keeps_small_responses():
+    response = {"query": "hi", "result": "hello"}
+    assert jobs._limit_result(response) == (response, False)
+
+
+def test_limit_result_fits_the_byte_budget(monkeypatch):
+    monkeypatch.setattr(Config, "JOBS_MAX_RESULT_BYTES", 1000)
+    # Escaped and multi-byte characters take more bytes than characters
+    for text in ["a" * 5000, "é" * 5000, '"\n' * 5000, "雨" * 5000]:
+        response, truncated = jobs._limit_result({"query": "q", "result": text})
+        size = len(json.dumps(response).encode())
+        assert truncated
+        assert size <= 1000
+        assert size > 800
+        assert text.startswith(response["result"])
+
+
+def test_in_memory_store_queue_and_wait():
+    store = jobs.InMemoryJobStore(max_queue=1)
+    job, _ = jobs.create_job({"query": "hi"})
+    other, _ = jobs.create_job({"query": "hi"})
+    assert store.submit(job)
+    assert not store.submit(other)
+    assert store.get(other["id"]) is None
+
+    assert store.next(timeout=0.1)["id"] == job["id"]
+    job.update(status="succeeded")
+    store.update(job)
+    assert store.wait(job["id"], timeout=1.0)["status"] == "succeeded"
+    assert store.wait("unknown", timeout=0.01) is None
+
+
+def test_runner_runs_jobs_like_query(monkeypatch):
+    monkeypatch.setattr(query_runner, "get_agent_executor", lambda: None)
+    runner = jobs.JobRunner(jobs.InMemoryJobStore(), workers=1)
+    job, _ = jobs.create_job({"query": "What is 2*21?"})
+    runner.submit(job)
+    finished = runner.store.wait(job["id"], timeout=5.0)
+    runner.stop()
+    assert finished["status"] == "succeeded"
+    assert finished["response"]["result"] == "42"
+    assert finished["response"]["routing_tier"] == "keyword"
@@ -0,0 +1,11 @@
+from app.utils.keyword_router import keyword_router
+
+
+def test_keyword_router_rules():
+    assert keyword_router.route("What's the temperature in Cape Town?") == "weather"
+    assert keyword_router.route("What is 15 + 25?") == "math"
+    assert keyword_router.route("12 x 3") == "math"
+    # Math keywords only count with a number, and only as whole words
+    assert keyword_router.route("what is love") == "llm"
+    assert keyword_router.route("explain photosynthesis") == "llm"
+    assert keyword_router.route("hi") == "llm"
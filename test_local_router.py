@@ -0,0 +1,52 @@
+from app.config import Config
+from app.tools.math_tool import MathTool
+from app.utils.local_router import LocalRouter
+from app.utils.tool_selector import SimpleAgentExecutor
+
+local_router = LocalRouter()
+
+
+def test_local_router_confident_on_clear_queries():
+    for query, tool in [
+        ("What is 15 + 25?", "math"),
+        ("What is 10 / 4?", "math"),
+        ("what is 100-7", "math"),
+        ("12/4 = ?", "math"),
+        ("what is the weather in paris", "weather"),
+        ("What's the temperature in Cape Town?", "weather"),
+        ("Who is the president of Italy right now?", "llm"),
+        ("How to make an Iceland Volcano Baked cake?", "llm"),
+    ]:
+        tool_key, confidence = local_router.classify(query)
+        assert tool_key == tool
+        assert confidence >= Config.LOCAL_ROUTER_THRESHOLD
+
+
+def test_local_router_below_threshold_on_vague_queries():
+    # Its top label for these is math, so it must not decide on its own
+    for query in ["hi", "what is love"]:
+        _, confidence = local_router.classify(query)
+        assert confidence < Config.LOCAL_ROUTER_THRESHOLD
+
+
+def test_ranges_and_dates_are_not_math():
+    for query in [
+        "who was the US president from 2009-2017?",
+        "what happened on 9/11",
+        "is a 24/7 gym worth it",
+        "How many days between 2024-01-01 and 2024-03-01?",
+        "the 1939-1945 war",
+    ]:
+        tool_key, confidence = local_router.classify(query)
+        assert tool_key != "math" or confidence < Config.LOCAL_ROUTER_THRESHOLD
+
+
+def test_percent_of_is_computed():
+    assert local_router.classify("what is 10 percent of 250")[0] == "math"
+    assert MathTool()._run("what is 10 percent of 250") == "25"
+
+
+def test_local_selection_respects_threshold():
+    executor = SimpleAgentExecutor(None, {}, local_router, threshold=0.75)
+    assert executor._local_selection("What is 15 + 25?") == "math"
+    assert executor._local_selection("hi") is None
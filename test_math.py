@@ -0,0 +1,61 @@
+import pytest
+
+from app.tools.math_tool import MathTool
+from app.utils import math_engine
+from app.utils.math_engine import MathEngineError
+
+math_tool = MathTool()
+
+
+def test_evaluates_expressions():
+    assert math_engine.evaluate("2*4+1") == 9
+    assert math_engine.evaluate("sqrt(16) + 2**3") == 12
+    assert math_engine.evaluate("x * 2", x=21) == 42
+
+
+def test_rejects_names_and_calls_outside_the_whitelist():
+    for expression in ["__import__('os')", "x", "open(1)", "(1).real", "sqrt", "[1, 2]", "'a'"]:
+        with pytest.raises(MathEngineError):
+            math_engine.evaluate(expression)
+
+
+def test_size_limits(monkeypatch):
+    with pytest.raises(MathEngineError, match="Result too large"):
+        math_engine.evaluate("9**9**9")
+    with pytest.raises(MathEngineError, match="Result too large"):
+        math_engine.evaluate("(10**1000)*(10**1000)")
+    with pytest.raises(MathEngineError, match="Exponent too large"):
+        math_engine.evaluate("2.0**100000")
+    with pytest.raises(MathEngineError, match="Expression too long"):
+        math_engine.evaluate("1+" * 300 + "1")
+
+    monkeypatch.setattr(math_engine.Config, "MATH_MAX_NODES", 10)
+    with pytest.raises(MathEngineError, match="Expression too complex"):
+        math_engine.evaluate("1+2+3+4+5+6+7")
+
+
+def test_tool_formats_results_and_errors():
+    assert math_tool._run("What is 2*4+1?") == "9"
+    assert math_tool._run("What is 10 / 4?") == "2.5"
+    assert math_tool._run("what is 12 x 3") == "36"
+    assert math_tool._run("1/0") == "Error: Division by zero"
+    assert math_tool._run("hello") == "Could not extract a mathematical expression from the query."
+
+
+def test_tool_reports_results_beyond_float_range():
+    # Within MATH_MAX_INT_BITS, but too large for a float
+    assert math_tool._run("10**400") == "Error: Result too large"
+    assert math_tool._run("(10**300)*(10**300)") == "Error: Result too large"
+
+
+def test_tool_reports_complex_results():
+    assert math_tool._run("(-8)**(1/3)") == "Error: Result is not a real number"
+    assert math_tool._run("what is (-8)^(0.5)") == "Error: Result is not a real number"
+    assert math_tool._run("(-8)**3") == "-512"
+
+
+def test_tool_strips_thousands_separators():
+    assert math_tool._run("1,000 + 5") == "1005"
+    assert math_tool._run("what is 1,000,000 * 2") == "2000000"
+    # Inside a call, the comma separates arguments
+    assert math_tool._run("log(8,2)") == "3"
@@ -0,0 +1,70 @@
+from app.utils import planner
+
+
+def queries(query):
+    return [step.query for step in planner.plan(query)]
+
+
+def test_single_intent_queries_stay_whole():
+    for query in [
+        "What is 2*4+1?",
+        "Can you tell me a joke? Thanks!",
+        "Who wrote Hamlet and when was it written?",
+        "Explain what a neural network is and how it is trained",
+        "What's the weather in Paris? What about London?",
+        "Mr. Smith went to Washington. What happened?",
+        "Who is J. K. Rowling?",
+    ]:
+        assert queries(query) == [query]
+
+
+def test_splits_clauses_for_different_tools():
+    assert queries("What's the weather in Paris and what is 17*23?") == [
+        "What's the weather in Paris", "what is 17*23?"]
+    # Weather's dummy "it" is not a reference to the clause before
+    assert queries("What is 17*23 and how hot is it in Dubai?") == ["What is 17*23", "how hot is it in Dubai?"]
+    assert queries("Who wrote Hamlet and what is 17*23? Also is it raining in Oslo?") == [
+        "Who wrote Hamlet", "what is 17*23?", "is it raining in Oslo?"]
+
+
+def test_independent_steps_have_no_dependencies():
+    steps = planner.plan("What's the weather in Paris and what is 17*23?")
+    assert [step.depends_on for step in steps] == [(), ()]
+
+
+def test_references_and_then_add_dependencies():
+    steps = planner.plan("What's the temperature in Paris, then multiply that by 2")
+    assert [(step.query, step.depends_on) for step in steps] == [
+        ("What's the temperature in Paris", ()), ("multiply that by 2", (0,))]
+    assert steps[1].resolve({0: "21"}) == "multiply 21 by 2"
+    assert steps[1].resolve({0: "It's 21°C"}) == "Given that: It's 21°C\nmultiply that by 2"
+
+
+def test_llm_steps_without_a_subject_get_earlier_results():
+    steps = planner.plan("Is it cold in Oslo and what should I wear?")
+    assert [(step.query, step.depends_on) for step in steps] == [
+        ("Is it cold in Oslo", ()), ("what should I wear?", (0,))]
+    assert steps[1].resolve({0: "Oslo: -5°C, snow"}) == "Given that: Oslo: -5°C, snow\nwhat should I wear?"
+
+    # A clause with a subject of its own does not wait
+    steps = planner.plan("What's the weather in Paris and who wrote Hamlet?")
+    assert [step.depends_on for step in steps] == [(), ()]
+
+
+def test_too_many_steps_or_disabled(monkeypatch):
+    monkeypatch.setattr(planner.Config, "PLANNER_MAX_STEPS", 1)
+    assert len(planner.plan("What's the weather in Paris and what is 17*23?")) == 1
+    monkeypatch.setattr(planner.Config, "PLANNER_MAX_STEPS", 5)
+    monkeypatch.setattr(planner.Config, "PLANNER_ENABLED", False)
+    assert len(planner.plan("What's the weather in Paris and what is 17*23?")) == 1
+
+
+def test_run_plan_skips_steps_after_a_failure():
+    steps = planner.plan("What's the temperature in Paris, then multiply that by 2")
+
+    def run_step(query):
+        raise RuntimeError("upstream down")
+
+    results = sorted(planner.run_plan(steps, run_step), key=lambda result: result['step'])
+    assert [result['tool_used'] for result in results] == ["error", "error"]
+    assert results[1]['result'] == "Error processing query: step 0 failed"
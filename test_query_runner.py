@@ -0,0 +1,50 @@
+import asyncio
+
+from app.utils import query_runner
+
+
+def test_fallback_without_agent_uses_keyword_router(monkeypatch):
+    monkeypatch.setattr(query_runner, "get_agent_executor", lambda: None)
+
+    response = query_runner.run_query("What is 2*21?")
+    assert response["tool_used"] == "math"
+    assert response["result"] == "42"
+    assert response["routing_tier"] == "keyword"
+    assert response["agent_used"] is False
+
+    # The local classifier's top label for these is math, at low confidence
+    for query in ["hi", "what is love"]:
+        response = asyncio.run(query_runner.arun_query(query))
+        assert (response["tool_used"], response["routing_tier"]) == ("llm", "keyword")
+
+
+def test_route_without_agent_uses_keyword_router(monkeypatch):
+    monkeypatch.setattr(query_runner, "get_agent_executor", lambda: None)
+    assert query_runner.route("hi") == ("llm", {}, "keyword")
+    assert query_runner.route("What is 2*21?") == ("math", {}, "keyword")
+    assert asyncio.run(query_runner.aroute("what is love")) == ("llm", {}, "keyword")
+
+
+class EchoTool:
+    def __init__(self, name):
+        self.name = name
+
+    def _run(self, query):
+        return f"{self.name}: {query}"
+
+    async def _arun(self, query):
+        return self._run(query)
+
+
+def test_fallback_splits_multi_intent_queries(monkeypatch):
+    monkeypatch.setattr(query_runner, "get_agent_executor", lambda: None)
+    monkeypatch.setattr(query_runner, "get_tools", lambda: {name: EchoTool(name) for name in ("weather", "math", "llm")})
+    query = "What's the weather in Paris and what is 17*23?"
+
+    for response in [query_runner.run_query(query), asyncio.run(query_runner.arun_query(query))]:
+        assert response["tool_used"] == "multi"
+        assert response["tools_used"] == ["weather", "math"]
+        assert response["routing_tier"] == "plan"
+        assert response["agent_used"] is False
+        assert "weather: What's the weather in Paris" in response["result"]
+        assert "math: what is 17*23" in response["result"]
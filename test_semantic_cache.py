@@ -0,0 +1,53 @@
+import numpy
+
+from app.utils.semantic_cache import SemanticCache
+
+
+def test_rewording_hits_but_numbers_and_negations_do_not():
+    cache = SemanticCache()
+    cache.store("model", "What is the capital of France?", "Paris")
+    cache.store("model", "is coffee healthy", "In moderation")
+    cache.store("model", "top 10 movies of 2020", "A list")
+
+    assert cache.lookup("model", "capital of france") == (True, "Paris")
+    assert cache.lookup("other-model", "capital of france") == (False, None)
+    assert cache.lookup("model", "is coffee not healthy") == (False, None)
+    assert cache.lookup("model", "isn't coffee healthy") == (False, None)
+    assert cache.lookup("model", "top 10 movies of 2021") == (False, None)
+
+
+def test_only_filled_rows_are_scored():
+    cache = SemanticCache(max_entries=4, dim=64)
+    cache.store("model", "capital of france", "Paris")
+    # Stale vectors in an empty slot must not be picked up
+    cache._vectors[3] = cache.embedder.embed("capital of spain")
+    cache._squared[3] = cache._vectors[3] ** 2
+    assert cache.lookup("model", "capital of spain") == (False, None)
+
+
+def test_persisted_entries_survive_restart_and_shape_changes(tmp_path):
+    path = str(tmp_path / "semantic")
+    cache = SemanticCache(max_entries=8, dim=64, path=path)
+    cache.store("model", "capital of france", "Paris")
+    cache._file_lock.close()
+
+    restarted = SemanticCache(max_entries=8, dim=64, path=path)
+    assert restarted.lookup("model", "capital of france") == (True, "Paris")
+    restarted._file_lock.close()
+
+    resized = SemanticCache(max_entries=16, dim=64, path=path)
+    assert len(resized) == 0
+    assert resized._vectors.shape == (16, 64)
+    assert not numpy.asarray(resized._vectors).any()
+
+
+def test_second_process_keeps_its_cache_in_memory(tmp_path):
+    path = str(tmp_path / "semantic")
+    owner = SemanticCache(max_entries=8, dim=64, path=path)
+    # flock is per open file, so a second open in this process stands in
+    # for another worker
+    other = SemanticCache(max_entries=8, dim=64, path=path)
+    assert owner.path == path
+    assert other.path is None
+    other.store("model", "capital of france", "Paris")
+    assert other.lookup("model", "capital of france") == (True, "Paris")
@@ -0,0 +1,49 @@
+import time
+from types import SimpleNamespace
+
+from app.tools import get_tools
+from app.utils import tool_selector
+from app.utils.speculation import Speculator
+
+
+def test_speculation_confirms_tool_and_args():
+    speculator = Speculator(["math"])
+    assert speculator.start("weather", lambda: "sunny", {}) is None
+
+    speculation = speculator.start("math", lambda: "42", {})
+    assert speculation.confirm("math", {})
+    assert speculation.future.result() == "42"
+
+    # The selector extracted arguments the speculative run did not have
+    speculation = speculator.start("math", lambda: time.sleep(0.01), {})
+    assert not speculation.confirm("math", {"expression": "6*7"})
+    assert speculator.stats()["math"]["misses"] == 1
+
+
+def test_structured_selection_with_the_same_args_uses_the_speculative_run(monkeypatch):
+    speculator = Speculator(["math", "weather"])
+    monkeypatch.setattr(tool_selector, "get_speculator", lambda: speculator)
+    calls = []
+
+    def tool(key):
+        def run(query, **args):
+            calls.append((key, args))
+            return f"{key} result"
+        return SimpleNamespace(name=key, func=run)
+
+    executor = tool_selector.SimpleAgentExecutor(
+        None, {"math": tool("math"), "weather": tool("weather")}, threshold=1.1)
+
+    # The selector returns the same expression with different spacing
+    monkeypatch.setattr(executor, "_select_with_llm", lambda query: ("math", {"expression": "6 * 7"}, "llm"))
+    assert executor._run_step("what is 6*7")[3] == "math result"
+    assert calls == [("math", {"expression": "6*7"})]
+
+    # ...and the gazetteer place the run was started with
+    if get_tools()["weather"]._find_place("Paris", "FR") is not None:
+        monkeypatch.setattr(executor, "_select_with_llm",
+                            lambda query: ("weather", {"city": "Paris", "country": "FR"}, "llm"))
+        assert executor._run_step("what is the weather in paris")[3] == "weather result"
+        assert calls[1:] == [("weather", {"city": "Paris", "country": "FR"})]
+
+    assert speculator.stats()["math"]["hits"] == 1